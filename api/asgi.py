@@ -0,0 +1,326 @@
+"""
+ASGI serving mode: the same Flask app and routes_api resources, behind an async adapter with two
+lanes, so that a few heavy exports don't hold up cheap calls such as /v0/counter_last.
+
+- Light requests run in a thread pool of this process, their body streamed as it is produced.
+- Heavy requests (see ASGI_HEAVY_PATHS) run in a pool of worker processes, each with its own app
+  and database connections, their body handed back whole (see `run_in_worker`). They are
+  admitted up to the number of workers plus ASGI_HEAVY_QUEUE waiting ones: past that, they are
+  rejected with a 503 rather than piling up.
+
+Run with any ASGI server, e.g. uvicorn (`poetry install --extras asgi`):
+    uvicorn asgi:create_app --factory --port 8080
+"""
+
+import asyncio
+import importlib
+import io
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from base.db import DB_MAX_OVERFLOW, DB_POOL_SIZE
+from base.env import get_env
+from base.logger import logger
+
+# By default, no more light requests at once than database connections this process can hold
+ASGI_LIGHT_WORKERS = int(get_env("ASGI_LIGHT_WORKERS", DB_POOL_SIZE + DB_MAX_OVERFLOW))
+ASGI_HEAVY_WORKERS = int(get_env("ASGI_HEAVY_WORKERS", 2))
+ASGI_HEAVY_QUEUE = int(get_env("ASGI_HEAVY_QUEUE", 8))
+ASGI_HEAVY_PATHS = get_env(
+    "ASGI_HEAVY_PATHS", "/v1/kpler_trade,/v1/kpler_flow,/v0/transformed,/v0/comtrade"
+).split(",")
+
+# Response bodies are sent in chunks of at least this size (but the last one)
+ASGI_CHUNK_SIZE = 64 * 1024
+
+# The app of a heavy worker process, loaded once by its initializer
+_worker_app = None
+
+
+def build_environ(request):
+    """
+    WSGI environ of a request (see `read_request`), as asgiref's WsgiToAsgi builds it.
+    """
+    server_name, server_port = request["server"] or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": request["method"],
+        "SCRIPT_NAME": request["root_path"],
+        "PATH_INFO": request["path_info"],
+        "QUERY_STRING": request["query_string"],
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{request['http_version']}",
+        "REMOTE_ADDR": request["client"] or "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": request["scheme"],
+        "wsgi.input": io.BytesIO(request["body"]),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+
+    for name, value in request["headers"]:
+        if name == "content-type":
+            key = "CONTENT_TYPE"
+        elif name == "content-length":
+            key = "CONTENT_LENGTH"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        # Repeated headers are comma separated
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+    # The body is read whole, e.g. even if sent chunked
+    environ["CONTENT_LENGTH"] = str(len(request["body"]))
+    return environ
+
+
+class WsgiResponse:
+    """
+    Response of a WSGI app to a request (see `read_request`), with its body read chunk by chunk
+    rather than all at once. The app is called, and its first chunk read, on creation: WSGI
+    apps can wait for their body to be iterated to start the response.
+    """
+
+    def __init__(self, wsgi_app, request):
+        self.status = None
+        self.headers = None
+        self.written = []
+        self.app_iter = wsgi_app(build_environ(request), self.start_response)
+        self.chunks = iter(self.app_iter)
+        self.first_chunk = self.read()
+
+    def start_response(self, status, headers, exc_info=None):
+        if exc_info and self.status is not None:
+            raise exc_info[1].with_traceback(exc_info[2])
+        self.status = int(status.split(" ", 1)[0])
+        self.headers = headers
+        # For legacy apps writing their body
+        return self.written.append
+
+    def read(self, size=ASGI_CHUNK_SIZE):
+        """
+        The next chunks of the body, joined up to at least `size` bytes. Empty once all read.
+        """
+        parts, n_read = self.written, sum(len(x) for x in self.written)
+        self.written = []
+        for chunk in self.chunks:
+            parts.append(chunk)
+            n_read += len(chunk)
+            if n_read >= size:
+                break
+        return b"".join(parts)
+
+    def read_all(self):
+        parts = [self.first_chunk]
+        while chunk := self.read():
+            parts.append(chunk)
+        return b"".join(parts)
+
+    def close(self):
+        if hasattr(self.app_iter, "close"):
+            self.app_iter.close()
+
+
+def load_worker_app(module):
+    global _worker_app
+    _worker_app = importlib.import_module(module).app
+
+
+def run_in_worker(request):
+    """
+    Run a request in a heavy worker process.
+
+    The whole body is returned at once, to be pickled back to the main process: while a
+    response of N bytes is handed over, it takes about N in the worker, N in the pipe and N in
+    the main process. Fine for the heavy endpoints' exports, but not meant for unbounded ones.
+
+    :return: status code, headers, body
+    """
+    response = WsgiResponse(_worker_app, request)
+    try:
+        return response.status, response.headers, response.read_all()
+    finally:
+        response.close()
+
+
+async def read_request(scope, receive):
+    """
+    The picklable parts of an ASGI http request, body included.
+    """
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+    root_path = scope.get("root_path", "")
+    # WSGI paths are latin-1 strings of the raw bytes
+    path_info = scope["path"].encode("utf-8").decode("latin-1")
+    if root_path and path_info.startswith(root_path):
+        path_info = path_info[len(root_path) :]
+
+    return {
+        "method": scope["method"],
+        "path": scope["path"],
+        "root_path": root_path,
+        "path_info": path_info,
+        "query_string": scope["query_string"].decode("latin-1"),
+        "http_version": scope.get("http_version", "1.1"),
+        "scheme": scope.get("scheme", "http"),
+        "server": scope.get("server"),
+        "headers": [(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]],
+        "body": body,
+        "client": scope["client"][0] if scope.get("client") else None,
+    }
+
+
+async def send_start(send, status, headers):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+        }
+    )
+
+
+async def send_body(send, body):
+    """
+    Send a body already in memory, in chunks.
+    """
+    for i in range(0, max(len(body), 1), ASGI_CHUNK_SIZE):
+        more_body = i + ASGI_CHUNK_SIZE < len(body)
+        await send(
+            {
+                "type": "http.response.body",
+                "body": body[i : i + ASGI_CHUNK_SIZE],
+                "more_body": more_body,
+            }
+        )
+
+
+class LanedAsgiApp:
+    """
+    ASGI adapter of a WSGI app, running light and heavy requests on separate lanes.
+
+    :param wsgi_app: the app serving light requests, in this process
+    :param worker_module: module whose `app` heavy worker processes serve
+    """
+
+    def __init__(
+        self,
+        wsgi_app,
+        worker_module="app",
+        heavy_paths=ASGI_HEAVY_PATHS,
+        light_workers=ASGI_LIGHT_WORKERS,
+        heavy_workers=ASGI_HEAVY_WORKERS,
+        heavy_queue=ASGI_HEAVY_QUEUE,
+    ):
+        self.wsgi_app = wsgi_app
+        self.worker_module = worker_module
+        self.heavy_paths = [x for x in heavy_paths if x]
+        self.light_workers = light_workers
+        self.heavy_workers = heavy_workers
+        self.heavy_capacity = heavy_workers + heavy_queue
+        self.heavy_admitted = 0
+        self.light_executor = None
+        self.heavy_executor = None
+
+    def is_heavy(self, request):
+        return any(request["path"].startswith(x) for x in self.heavy_paths)
+
+    def start(self):
+        if self.light_executor is None:
+            self.light_executor = ThreadPoolExecutor(
+                max_workers=self.light_workers, thread_name_prefix="asgi-light"
+            )
+        if self.heavy_executor is None and self.heavy_workers > 0:
+            # Spawned rather than forked, not to share the database connections of this process
+            self.heavy_executor = ProcessPoolExecutor(
+                max_workers=self.heavy_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=load_worker_app,
+                initargs=(self.worker_module,),
+            )
+
+    def stop(self):
+        for executor in [self.light_executor, self.heavy_executor]:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+        self.light_executor = None
+        self.heavy_executor = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            raise NotImplementedError(f"Unsupported ASGI scope: {scope['type']}")
+
+        self.start()
+        request = await read_request(scope, receive)
+        if self.is_heavy(request) and self.heavy_executor is not None:
+            status, headers, body = await self.run_heavy(request)
+            await send_start(send, status, headers)
+            await send_body(send, body)
+        else:
+            await self.run_light(request, send)
+
+    async def run_light(self, request, send):
+        """
+        Run a request in the light thread pool, streaming its body as the app produces it.
+        """
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(
+            self.light_executor, WsgiResponse, self.wsgi_app, request
+        )
+        try:
+            await send_start(send, response.status, response.headers)
+            chunk = response.first_chunk
+            while True:
+                # Read ahead, so that the last chunk is sent with more_body=False
+                next_chunk = await loop.run_in_executor(self.light_executor, response.read)
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": bool(next_chunk)}
+                )
+                if not next_chunk:
+                    break
+                chunk = next_chunk
+        finally:
+            await loop.run_in_executor(self.light_executor, response.close)
+
+    async def run_heavy(self, request):
+        if self.heavy_admitted >= self.heavy_capacity:
+            logger.warning(f"Heavy lane full, rejecting {request['path']}")
+            return (
+                503,
+                [("Content-Type", "text/plain"), ("Retry-After", "30")],
+                b"Too many heavy requests in progress, please retry later.",
+            )
+
+        self.heavy_admitted += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.heavy_executor, run_in_worker, request
+            )
+        finally:
+            self.heavy_admitted -= 1
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def create_app():
+    from app import app as wsgi_app
+
+    return LanedAsgiApp(wsgi_app)
@@ -1,7 +1,6 @@
 import datetime as dt
 import pandas as pd
 import json
-import geopandas as gpd
 import re
 import numpy as np
 import sqlalchemy.sql.expression
@@ -12,6 +12,13 @@ from sqlalchemy import case
 from operator import attrgetter
 
 from . import routes_api, postcompute
+from .timing import TimedResource, PROFILE_HELP
+from .currency import (
+    get_currencies,
+    add_currency_values,
+    get_currency_agg_cols,
+    drop_unrequested_eur,
+)
 from base import (
     PRICING_DEFAULT,
     COUNTER_VERSION_DEFAULT,
@@ -21,17 +28,24 @@ from base import (
 )
 from base.logger import logger
 from base.db import session
-from base.models import Counter, Country, Currency, PriceScenario
-from base.utils import to_datetime, to_list, intersect, df_to_json, hash_df, unhash_df
+from base.models import Counter, Country, PriceScenario
+from base.utils import (
+    to_datetime,
+    to_list,
+    intersect,
+    df_to_json,
+    get_list_columns,
+    hash_df,
+    unhash_df,
+)
 from .commodity import get_subquery as get_commodity_subquery
 
 
 @routes_api.route("/v0/counter", strict_slashes=False)
-class RussiaCounterResource(Resource):
+class RussiaCounterResource(TimedResource):
     @staticmethod
     def get_aggregateby_cols(subquery=None):
         aggregate_cols_dict = {
-            "currency": ["currency"],
             "pricing_scenario": [
                 "pricing_scenario",
                 "pricing_scenario_name",
@@ -283,6 +297,14 @@ class RussiaCounterResource(Resource):
         default=False,
     )
 
+    parser.add_argument(
+        "profile",
+        type=inputs.boolean,
+        help=PROFILE_HELP,
+        required=False,
+        default=False,
+    )
+
     @routes_api.expect(parser)
     def get(self):
         params = RussiaCounterResource.parser.parse_args()
@@ -318,7 +340,7 @@ class RussiaCounterResource(Resource):
         commodity_grouping = params.get("commodity_grouping")
         nest_in_data = params.get("nest_in_data")
         use_eu = params.get("use_eu")
-        currency = params.get("currency")
+        currencies = get_currencies(params)
         pricing_scenario = params.get("pricing_scenario")
         sort_by = params.get("sort_by")
         pivot_by = params.get("pivot_by")
@@ -367,8 +389,6 @@ class RussiaCounterResource(Resource):
             else_="NOT_PCC",
         ).label("destination_is_pcc")
 
-        value_currency_field = (Counter.value_eur * Currency.per_eur).label("value_currency")
-
         commodity_subquery = get_commodity_subquery(
             session=session, grouping_name=commodity_grouping
         )
@@ -387,20 +407,25 @@ class RussiaCounterResource(Resource):
                 Counter.date,
                 Counter.value_tonne,
                 Counter.value_eur,
-                Currency.currency,
-                value_currency_field,
                 Counter.pricing_scenario,
                 PriceScenario.name.label("pricing_scenario_name"),
                 Counter.version,
             )
             .outerjoin(commodity_subquery, Counter.commodity == commodity_subquery.c.id)
             .outerjoin(Country, Counter.destination_iso2 == Country.iso2)
-            .outerjoin(Currency, Counter.date == Currency.date)
             .outerjoin(PriceScenario, Counter.pricing_scenario == PriceScenario.id)
             .filter(Counter.date >= to_datetime(date_from))
             .filter(Counter.version == version)
         )
 
+        # One value_<ccy> column per currency, rather than one row per currency
+        query = add_currency_values(
+            query,
+            value_eur_field=Counter.value_eur,
+            date_field=Counter.date,
+            currencies=currencies,
+        )
+
         if pricing_scenario:
             query = query.filter(Counter.pricing_scenario.in_(to_list(pricing_scenario)))
 
@@ -419,9 +444,6 @@ class RussiaCounterResource(Resource):
         if commodity_group:
             query = query.filter(commodity_subquery.c.group.in_(to_list(commodity_group)))
 
-        if currency is not None:
-            query = query.filter(Currency.currency.in_(to_list(currency)))
-
         if date_to is not None:
             query = query.filter(Counter.date <= to_datetime(date_to))
 
@@ -429,15 +451,18 @@ class RussiaCounterResource(Resource):
             legacy_filter = Counter.commodity != "lpg"
             query = query.filter(legacy_filter)
 
-        query = self.aggregate(query, aggregate_by)
+        query = self.aggregate(query, aggregate_by, currencies=currencies)
+        self.timer.lap("aggregate")
         counter = pd.read_sql(query.statement, session.bind)
+        self.timer.lap("read_sql", counter)
 
         if "id" in counter:
             counter.drop(["id"], axis=1, inplace=True)
 
         # Resample
-        # Need to hash list columns before resampling
-        counter, list_columns = hash_df(counter)
+        # Need to hash list columns before resampling. They are known from the query
+        counter, codes_values = hash_df(counter, get_list_columns(query))
+        self.timer.lap("hash_df", counter)
 
         if len(counter) == 0:
             return Response(
@@ -460,7 +485,6 @@ class RussiaCounterResource(Resource):
                     "destination_country",
                     "destination_region",
                     "destination_is_pcc",
-                    "currency",
                     "pricing_scenario",
                     "pricing_scenario_name",
                     "version",
@@ -468,8 +492,10 @@ class RussiaCounterResource(Resource):
                 counter.columns,
             )
 
+            # Other columns are dropped, list ones included (their codes being numeric)
+            value_cols = [x for x in counter.columns if x.startswith("value_")]
             counter = (
-                counter.groupby(cols, dropna=False)
+                counter.groupby(cols, dropna=False)[["date"] + value_cols]
                 .apply(
                     lambda x: x.set_index("date")
                     .resample("D")
@@ -495,22 +521,16 @@ class RussiaCounterResource(Resource):
                     "destination_region",
                     "destination_regions",
                     "destination_is_pcc",
-                    "currency",
                     "pricing_scenario",
                     "pricing_scenario_name",
                     "version",
                 ]
                 if aggregate_by is None or not aggregate_by or x in aggregate_by
             ]
-            counter["value_eur"] = counter.groupby(groupby_cols, dropna=False)[
-                "value_eur"
-            ].transform(pd.Series.cumsum)
-            counter["value_tonne"] = counter.groupby(groupby_cols, dropna=False)[
-                "value_tonne"
-            ].transform(pd.Series.cumsum)
-            counter["value_currency"] = counter.groupby(groupby_cols, dropna=False)[
-                "value_currency"
-            ].transform(pd.Series.cumsum)
+            value_cols = [x for x in counter.columns if x.startswith("value_")]
+            counter[value_cols] = counter.groupby(groupby_cols, dropna=False)[value_cols].transform(
+                pd.Series.cumsum
+            )
 
         if rolling_days is not None and rolling_days > 1:
             counter = (
@@ -526,7 +546,6 @@ class RussiaCounterResource(Resource):
                             "destination_region",
                             "destination_regions",
                             "destination_is_pcc",
-                            "currency",
                             "pricing_scenario",
                             "pricing_scenario_name",
                             "version",
@@ -548,11 +567,15 @@ class RussiaCounterResource(Resource):
                 .replace({np.nan: None})
             )
 
+        self.timer.lap("resample", counter)
+
         # Spread currencies
-        counter = self.spread_currencies(result=counter)
+        counter = self.spread_currencies(result=counter, currencies=currencies)
+        self.timer.lap("spread_currencies", counter)
 
         # Sort results
         counter = self.sort_result(result=counter, sort_by=sort_by, aggregate_by=aggregate_by)
+        self.timer.lap("sort", counter)
 
         # Keep only n records
         counter = self.limit_result(
@@ -563,6 +586,7 @@ class RussiaCounterResource(Resource):
             limit_by=limit_by,
             keep_zeros=keep_zeros,
         )
+        self.timer.lap("limit", counter)
 
         def add_total_commodity(data):
             groupby_cols = [c for c in data.columns if not re.match("commodity|value", c)]
@@ -593,8 +617,14 @@ class RussiaCounterResource(Resource):
             if commodity:
                 counter = counter[counter.commodity.isin(to_list(commodity) + ["Total"])]
 
+        self.timer.lap("add_totals", counter)
+
         # Pivot
         counter = self.pivot_result(result=counter, pivot_by=pivot_by, pivot_value=pivot_value)
+        self.timer.lap("pivot", counter)
+
+        # Unhash before post computing, which applies to numeric columns
+        counter = unhash_df(counter, codes_values)
 
         # Sort columns
         counter = self.sort_columns(result=counter, columns_order=columns_order)
@@ -608,8 +638,7 @@ class RussiaCounterResource(Resource):
         # Translate
         counter = self.translate(data=counter, language=language)
 
-        # Unhash finally
-        counter = unhash_df(counter, intersect(list_columns, counter.columns))
+        self.timer.lap("postcompute", counter)
 
         if format == "csv":
             return Response(
@@ -625,7 +654,7 @@ class RussiaCounterResource(Resource):
                 mimetype="application/json",
             )
 
-    def aggregate(self, query, aggregate_by):
+    def aggregate(self, query, aggregate_by, currencies):
         """Perform aggregation based on user agparameters"""
 
         if not aggregate_by:
@@ -637,7 +666,7 @@ class RussiaCounterResource(Resource):
         value_cols = [
             func.sum(subquery.c.value_tonne).label("value_tonne"),
             func.sum(subquery.c.value_eur).label("value_eur"),
-            func.sum(subquery.c.value_currency).label("value_currency"),
+            *get_currency_agg_cols(subquery, currencies),
         ]
 
         optional_calculated_cols = {
@@ -646,7 +675,7 @@ class RussiaCounterResource(Resource):
         }
 
         # Adding must have grouping columns
-        must_group_by = ["currency", "pricing_scenario", "version"]
+        must_group_by = ["pricing_scenario", "version"]
         aggregate_by.extend([x for x in must_group_by if x not in aggregate_by])
         if "" in aggregate_by:
             aggregate_by.remove("")
@@ -671,27 +700,10 @@ class RussiaCounterResource(Resource):
         query = session.query(*groupby_cols, *value_cols).group_by(*groupby_cols)
         return query
 
-    def spread_currencies(self, result):
-        len_before = len(result)
-        n_currencies = len(result.currency.unique())
-
-        result["currency"] = "value_" + result.currency.str.lower()
-        index_cols = [
-            x for x in result.columns if x not in ["currency", "value_currency", "value_eur"]
-        ]
-
-        result = (
-            result[index_cols + ["currency", "value_currency"]]
-            .set_index(index_cols + ["currency"])["value_currency"]
-            .unstack(-1)
-            .reset_index()
-        )
-
-        # Quick sanity check
-        len_after = len(result)
-        assert len_after == len_before / n_currencies
+    def spread_currencies(self, result, currencies):
+        # Currencies are already spread in SQL, see add_currency_values
+        result = drop_unrequested_eur(result, currencies)
         result.replace({np.nan: None}, inplace=True)
-
         return result
 
     def sort_result(self, result, sort_by, aggregate_by):
@@ -728,7 +740,7 @@ class RussiaCounterResource(Resource):
                     x
                     for x in aggregate_by
                     if not x in aggregate_by_dependencies
-                    and not x in ["date", "month", "year", "currency"]
+                    and not x in ["date", "month", "year"]
                     and not x in by
                     and x in result.columns
                 ]
@@ -6,7 +6,6 @@ import pytz
 import datetime as dt
 from flask import Response
 from flask_restx import Resource, reqparse, inputs
-import pymongo
 from sqlalchemy import func
 import sqlalchemy as sa
 from sqlalchemy.orm import aliased
@@ -0,0 +1,77 @@
+from sqlalchemy import func
+
+from base.db import session
+from base.models import Currency
+from base.utils import to_list
+
+DEFAULT_CURRENCIES = ["EUR", "USD"]
+
+
+def get_currencies(params):
+    """
+    Currencies requested, upper case and without duplicates.
+    """
+    currencies = to_list(params.get("currency")) or DEFAULT_CURRENCIES
+    return list(dict.fromkeys(x.upper() for x in currencies))
+
+
+def get_value_col(currency):
+    return f"value_{currency.lower()}"
+
+
+def get_rates_subquery(currencies):
+    """
+    Exchange rates with one row per date, and one `per_<ccy>` column per (non EUR) currency,
+    built with conditional aggregates so that joining it doesn't duplicate records.
+    """
+    return (
+        session.query(
+            Currency.date,
+            *[
+                func.max(Currency.per_eur).filter(Currency.currency == x).label(f"per_{x.lower()}")
+                for x in currencies
+            ],
+        )
+        .filter(Currency.currency.in_(currencies))
+        .group_by(Currency.date)
+        .subquery()
+    )
+
+
+def add_currency_values(query, value_eur_field, date_field, currencies):
+    """
+    Add one `value_<ccy>` column per currency to the query, with the rate of `date_field`.
+    EUR is already there as `value_eur`.
+    """
+    currencies = [x for x in currencies if x != "EUR"]
+    if not currencies:
+        return query
+
+    rates = get_rates_subquery(currencies)
+    return query.add_columns(
+        *[
+            (value_eur_field * rates.c[f"per_{x.lower()}"]).label(get_value_col(x))
+            for x in currencies
+        ]
+    ).outerjoin(rates, rates.c.date == date_field)
+
+
+def get_currency_agg_cols(subquery, currencies):
+    """
+    Sums of the `value_<ccy>` columns added by `add_currency_values`.
+    """
+    return [
+        func.sum(subquery.c[get_value_col(x)]).label(get_value_col(x))
+        for x in currencies
+        if x != "EUR"
+    ]
+
+
+def drop_unrequested_eur(result, currencies):
+    """
+    `value_eur` is always queried, other currencies being computed from it, but only returned
+    if EUR was requested.
+    """
+    if "EUR" not in currencies and "value_eur" in result.columns:
+        result = result.drop(columns=["value_eur"])
+    return result
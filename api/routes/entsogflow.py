@@ -1,10 +1,16 @@
 import datetime as dt
 import pandas as pd
-import geopandas as gpd
 import json
 import numpy as np
 
 from . import routes_api
+from .timing import TimedResource, PROFILE_HELP
+from .currency import (
+    get_currencies,
+    add_currency_values,
+    get_currency_agg_cols,
+    drop_unrequested_eur,
+)
 from flask_restx import inputs
 from http import HTTPStatus
 from flask import Response
@@ -15,7 +21,7 @@ from sqlalchemy import func, case, any_
 
 
 import base
-from base.models import EntsogFlow, Price, Country, Commodity, Currency
+from base.models import EntsogFlow, Price, Country, Commodity
 from base.db import session
 from base.encoder import JsonEncoder
 from base.utils import to_list, to_datetime
@@ -30,7 +36,7 @@ from .commodity import get_subquery as get_commodity_subquery
 
 
 @routes_api.route("/v0/entsogflow", strict_slashes=False)
-class EntsogFlowResource(Resource):
+class EntsogFlowResource(TimedResource):
     parser = reqparse.RequestParser()
 
     # Query content
@@ -155,6 +161,14 @@ class EntsogFlowResource(Resource):
         default=False,
     )
 
+    parser.add_argument(
+        "profile",
+        type=inputs.boolean,
+        help=PROFILE_HELP,
+        required=False,
+        default=False,
+    )
+
     @routes_api.expect(parser)
     def get(self):
         params = EntsogFlowResource.parser.parse_args()
@@ -176,7 +190,7 @@ class EntsogFlowResource(Resource):
         nest_in_data = params.get("nest_in_data")
         download = params.get("download")
         rolling_days = params.get("rolling_days")
-        currency = params.get("currency")
+        currencies = get_currencies(params)
         pricing_scenario = params.get("pricing_scenario")
 
         if aggregate_by and "" in aggregate_by:
@@ -186,8 +200,6 @@ class EntsogFlowResource(Resource):
 
         pricing_scenario_field = (Price.scenario).label("pricing_scenario")
 
-        value_currency_field = (value_eur_field * Currency.per_eur).label("value_currency")
-
         commodity_subquery = get_commodity_subquery(
             session=session, grouping_name=commodity_grouping
         )
@@ -241,8 +253,6 @@ class EntsogFlowResource(Resource):
                 EntsogFlow.value_tonne,
                 EntsogFlow.value_m3,
                 value_eur_field,
-                Currency.currency,
-                value_currency_field,
                 pricing_scenario_field,
             )
             .join(DepartureCountry, DepartureCountry.iso2 == EntsogFlow.departure_iso2)
@@ -283,17 +293,23 @@ class EntsogFlowResource(Resource):
                     ),
                 ),
             )
-            .outerjoin(Currency, Currency.date == EntsogFlow.date)
             # .filter(EntsogFlow.destination_iso2 != "RU")
             # Very important for pricing to have a distinct statement! And to be sorted prior that
             # so that we pick those with port ids matching, then destination iso2s, then ship etc.
             .order_by(
                 EntsogFlow.id,
                 Price.scenario,
-                Currency.currency,
                 Price.destination_iso2s,
             )
-            .distinct(EntsogFlow.id, Price.scenario, Currency.currency)
+            .distinct(EntsogFlow.id, Price.scenario)
+        )
+
+        # One value_<ccy> column per currency, rather than one row per currency
+        flows_rich = add_currency_values(
+            flows_rich,
+            value_eur_field=value_eur_field,
+            date_field=EntsogFlow.date,
+            currencies=currencies,
         )
 
         # Return only >0 values. Otherwise we hit response size limit
@@ -332,17 +348,16 @@ class EntsogFlowResource(Resource):
         if type is not None:
             flows_rich = flows_rich.filter(EntsogFlow.type.in_(to_list(type)))
 
-        if currency is not None:
-            flows_rich = flows_rich.filter(Currency.currency.in_(to_list(currency)))
-
         if pricing_scenario is not None:
             flows_rich = flows_rich.filter(Price.scenario.in_(to_list(pricing_scenario)))
 
         # Aggregate
-        query = self.aggregate(query=flows_rich, aggregate_by=aggregate_by)
+        query = self.aggregate(query=flows_rich, aggregate_by=aggregate_by, currencies=currencies)
+        self.timer.lap("aggregate")
 
         # Query
         result = pd.read_sql(query.statement, session.bind)
+        self.timer.lap("read_sql", result)
 
         if len(result) == 0:
             return Response(
@@ -355,9 +370,11 @@ class EntsogFlowResource(Resource):
         result = self.roll_average(
             result=result, aggregate_by=aggregate_by, rolling_days=rolling_days
         )
+        self.timer.lap("roll_average", result)
 
         # Spread currencies
-        result = self.spread_currencies(result=result)
+        result = self.spread_currencies(result=result, currencies=currencies)
+        self.timer.lap("spread_currencies", result)
 
         if "date" in result.columns:
             result["date"] = pd.to_datetime(result["date"]).dt.date
@@ -369,9 +386,10 @@ class EntsogFlowResource(Resource):
             aggregate_by=aggregate_by,
             download=download,
         )
+        self.timer.lap("build_response")
         return response
 
-    def aggregate(self, query, aggregate_by):
+    def aggregate(self, query, aggregate_by, currencies):
         """Perform aggregation based on user agparameters"""
 
         if not aggregate_by:
@@ -384,18 +402,17 @@ class EntsogFlowResource(Resource):
             func.sum(subquery.c.value_tonne).label("value_tonne"),
             func.sum(subquery.c.value_m3).label("value_m3"),
             func.sum(subquery.c.value_eur).label("value_eur"),
-            func.sum(subquery.c.value_currency).label("value_currency"),
+            *get_currency_agg_cols(subquery, currencies),
         ]
 
         # Adding must have grouping columns
-        must_group_by = ["currency", "pricing_scenario"]
+        must_group_by = ["pricing_scenario"]
         aggregate_by.extend([x for x in must_group_by if x not in aggregate_by])
         if "" in aggregate_by:
             aggregate_by.remove("")
         # Aggregating
         aggregateby_cols_dict = {
             "type": [subquery.c.type],
-            "currency": [subquery.c.currency],
             "pricing_scenario": [subquery.c.pricing_scenario],
             "commodity": [subquery.c.commodity, subquery.c.commodity_group],
             "commodity_group": [subquery.c.commodity_group],
@@ -456,14 +473,15 @@ class EntsogFlowResource(Resource):
         if rolling_days is not None:
             date_col = "date"
             date_cols = ["date", "month", "year"]
-            value_cols = ["value_tonne", "value_m3", "value_eur", "value_currency"]
             min_date = result[date_col].min()
             max_date = result[date_col].max()  # change your date here
             daterange = pd.date_range(min_date, max_date).rename(date_col)
 
             result[date_col] = result[date_col].dt.floor("D")  # Should have been done already
             result = (
-                result.groupby([x for x in result.columns if x not in date_cols + value_cols])
+                result.groupby(
+                    [x for x in result.columns if x not in date_cols and not x.startswith("value_")]
+                )
                 .apply(
                     lambda x: x.set_index(date_col)
                     .resample("D")
@@ -478,27 +496,9 @@ class EntsogFlowResource(Resource):
 
         return result
 
-    def spread_currencies(self, result):
-        len_before = len(result)
-        n_currencies = len(result.currency.unique())
-
-        result["currency"] = "value_" + result.currency.str.lower()
-        index_cols = [
-            x for x in result.columns if x not in ["currency", "value_currency", "value_eur"]
-        ]
-
-        result = (
-            result[index_cols + ["currency", "value_currency"]]
-            .set_index(index_cols + ["currency"])["value_currency"]
-            .unstack(-1)
-            .reset_index()
-        )
-
-        # Quick sanity check
-        len_after = len(result)
-        assert len_after == len_before / n_currencies
-
-        return result
+    def spread_currencies(self, result, currencies):
+        # Currencies are already spread in SQL, see add_currency_values
+        return drop_unrequested_eur(result, currencies)
 
     def build_response(self, result, format, nest_in_data, aggregate_by, download):
         result.replace({np.nan: None}, inplace=True)
@@ -2,8 +2,6 @@ import json
 import pandas as pd
 import datetime as dt
 import numpy as np
-import geopandas as gpd
-from shapely import wkb
 from sqlalchemy.sql import text
 from sqlalchemy import func
 from flask import Response
@@ -89,6 +87,8 @@ class FlaringFacilityResource(Resource):
                 "geometry",
                 "anomaly_index",
             ]
+            from shapely import wkb
+
             result["geometry"] = result.geometry.apply(lambda x: wkb.loads(bytes(x)) if x else None)
             result = result.sort_values("anomaly_index", axis=0, ascending=False)
 
@@ -128,6 +128,8 @@ class FlaringFacilityResource(Resource):
             return Response(response=resp_content, status=200, mimetype="application/json")
 
         if format == "geojson":
+            import geopandas as gpd
+
             berths_gdf = gpd.GeoDataFrame(result, geometry="geometry")
             berths_geojson = berths_gdf.to_json(cls=JsonEncoder)
 
@@ -8,10 +8,11 @@ import base
 from .security import key_required
 from . import routes_api
 from .template import TemplateResource
+from .currency import get_currencies, add_currency_values, get_currency_agg_cols
 from base import PRICING_DEFAULT
 from base.logger import logger
 from base.db import session
-from base.models import KplerFlow, KplerProduct, Country, Price, Currency, Commodity
+from base.models import KplerFlow, KplerProduct, Country, Price, Commodity
 from base.utils import to_datetime, to_list, intersect, df_to_json
 
 KPLER_TOTAL = "Total"
@@ -134,9 +135,9 @@ class KplerFlowResource(TemplateResource):
         default=None,
     )
 
-    must_group_by = ["origin_type", "destination_type", "currency", "pricing_scenario"]
+    must_group_by = ["origin_type", "destination_type", "pricing_scenario"]
     date_cols = ["date"]
-    value_cols = ["value_tonne", "value_eur", "value_currency"]
+    value_cols = ["value_tonne", "value_eur"]
     pivot_dependencies = {
         "grade": ["commodity", "group", "family", "commodity_equivalent"],
         "commodity": ["group", "family", "commodity_equivalent"],
@@ -231,9 +232,15 @@ class KplerFlowResource(TemplateResource):
                 subquery.c.commodity_equivalent,
                 subquery.c.commodity_equivalent_group,
             ],
+            "commodity_equivalent_name": [
+                subquery.c.commodity_equivalent_name,
+                subquery.c.commodity_equivalent,
+                subquery.c.commodity_equivalent_group,
+            ],
+            "family": [subquery.c.family],
+            "destination_region": [subquery.c.destination_region],
             "origin_type": [subquery.c.origin_type],
             "destination_type": [subquery.c.destination_type],
-            "currency": [subquery.c.currency],
             "date": [subquery.c.date],
             # date_trunc month
             "month": [func.date_trunc("month", subquery.c.date).label("month")],
@@ -245,7 +252,7 @@ class KplerFlowResource(TemplateResource):
         return [
             func.sum(subquery.c.value_tonne).label("value_tonne"),
             func.sum(subquery.c.value_eur).label("value_eur"),
-            func.sum(subquery.c.value_currency).label("value_currency"),
+            *get_currency_agg_cols(subquery, get_currencies(params)),
         ]
 
     @routes_api.expect(parser)
@@ -340,8 +347,6 @@ class KplerFlowResource(TemplateResource):
                 Price.scenario.label("pricing_scenario"),
                 value_tonne_field,
                 value_eur_field,
-                Currency.currency,
-                (value_eur_field * Currency.per_eur).label("value_currency"),
                 Commodity.equivalent_id.label("commodity_equivalent"),  # For filtering
                 CommodityEquivalent.name.label("commodity_equivalent_name"),
                 CommodityEquivalent.group.label("commodity_equivalent_group"),
@@ -379,20 +384,25 @@ class KplerFlowResource(TemplateResource):
                     Price.commodity == pricing_commodity_id_field,
                 ),
             )
-            .outerjoin(Currency, Currency.date == KplerFlow.date)
             .order_by(
                 KplerFlow.id,
                 Price.scenario,
-                Currency.currency,
                 Price.destination_iso2s,
             )
             .distinct(
                 KplerFlow.id,
                 Price.scenario,
-                Currency.currency,
             )
         )
 
+        # One value_<ccy> column per currency, rather than one row per currency
+        query = add_currency_values(
+            query,
+            value_eur_field=value_eur_field,
+            date_field=KplerFlow.date,
+            currencies=get_currencies(params),
+        )
+
         # Only keep valid flows
         query = query.filter(KplerFlow.is_valid == True)
 
@@ -417,7 +427,6 @@ class KplerFlowResource(TemplateResource):
         date_from = params.get("date_from")
         date_to = params.get("date_to")
         pricing_scenario = params.get("pricing_scenario")
-        currency = params.get("currency")
 
         if origin_iso2:
             query = query.filter(KplerFlow.from_iso2.in_(to_list(origin_iso2)))
@@ -452,9 +461,6 @@ class KplerFlowResource(TemplateResource):
         if pricing_scenario:
             query = query.filter(Price.scenario.in_(to_list(pricing_scenario)))
 
-        if currency is not None:
-            query = query.filter(Currency.currency.in_(to_list(currency)))
-
         subquery = query.subquery()
         query = session.query(subquery)
 
@@ -17,6 +17,7 @@ from base.models.kpler import KplerSyncHistory
 from .security import key_required
 from . import routes_api
 from .template import TemplateResource
+from .currency import get_currencies, add_currency_values, get_currency_agg_cols
 from base import PRICING_DEFAULT
 from base import UNKNOWN_INSURER
 from base.logger import logger
@@ -24,7 +25,6 @@ from base.db import session
 from base.models import (
     KplerProduct,
     Country,
-    Currency,
     Commodity,
     KplerTrade,
     KplerTradeComputed,
@@ -348,14 +348,13 @@ class KplerTradeResource(TemplateResource):
         default=True,
     )
 
-    must_group_by = ["currency", "pricing_scenario"]
+    must_group_by = ["pricing_scenario"]
     date_cols = ["date", "origin_date", "destination_date"]
     value_cols = [
         "value_tonne",
         "value_m3",
         "value_gas_m3",
         "value_eur",
-        "value_currency",
         "avg_vessel_age",
         "trade_count",
         "n_inspections_2y",
@@ -557,7 +556,6 @@ class KplerTradeResource(TemplateResource):
                 subquery.c.commodity_equivalent_group,
                 subquery.c.commodity_equivalent_group_name,
             ],
-            "currency": [subquery.c.currency],
             "date": [func.date_trunc("day", subquery.c.origin_date_utc).label("date")],
             "origin_date": [
                 func.date_trunc("day", subquery.c.origin_date_utc).label("origin_date")
@@ -646,7 +644,7 @@ class KplerTradeResource(TemplateResource):
             func.sum(subquery.c.value_m3).label("value_m3"),
             func.sum(subquery.c.value_gas_m3).label("value_gas_m3"),
             func.sum(subquery.c.value_eur).label("value_eur"),
-            func.sum(subquery.c.value_currency).label("value_currency"),
+            *get_currency_agg_cols(subquery, get_currencies(params)),
             func.count(func.distinct(subquery.c.trade_id)).label("trade_count"),
         ]
 
@@ -1052,8 +1050,6 @@ class KplerTradeResource(TemplateResource):
             KplerTrade.value_m3,
             KplerTrade.value_gas_m3,
             value_eur_field,
-            Currency.currency,
-            (value_eur_field * Currency.per_eur).label("value_currency"),
             KplerTrade.vessel_imos,
             KplerTrade.buyer_names,
             KplerTrade.seller_names,
@@ -1092,7 +1088,6 @@ class KplerTradeResource(TemplateResource):
             )
             .join(Commodity, kpler_trade_computed_table.kpler_product_commodity_id == Commodity.id)
             .join(CommodityEquivalent, Commodity.equivalent_id == CommodityEquivalent.id)
-            .outerjoin(Currency, Currency.date == price_date)
             .outerjoin(
                 OriginInstallation, OriginInstallation.id == KplerTrade.departure_installation_id
             )
@@ -1117,11 +1112,18 @@ class KplerTradeResource(TemplateResource):
         if query_modifier:
             query = query_modifier(query, aliases)
 
+        # One value_<ccy> column per currency, rather than one row per currency
+        query = add_currency_values(
+            query,
+            value_eur_field=value_eur_field,
+            date_field=price_date,
+            currencies=get_currencies(params),
+        )
+
         query = query.order_by(
             KplerTrade.id,
             KplerTrade.flow_id,
             kpler_trade_computed_table.pricing_scenario,
-            Currency.currency,
         )
 
         # Only keep valid trades
@@ -1160,7 +1162,6 @@ class KplerTradeResource(TemplateResource):
         origin_date_from = params.get("origin_date_from")
         origin_date_to = params.get("origin_date_to")
         pricing_scenario = params.get("pricing_scenario")
-        currency = params.get("currency")
 
         buyer = params.get("buyer")
         seller = params.get("seller")
@@ -1220,9 +1221,6 @@ class KplerTradeResource(TemplateResource):
                 kpler_trade_computed_table.pricing_scenario.in_(to_list(pricing_scenario))
             )
 
-        if currency is not None:
-            query = query.filter(Currency.currency.in_(to_list(currency)))
-
         if buyer:
             query = query.filter(KplerTrade.buyer_names.overlap(to_list(buyer)))
 
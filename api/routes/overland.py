@@ -11,11 +11,18 @@ from sqlalchemy.orm import aliased
 from sqlalchemy import func, case, any_
 
 from . import routes_api
+from .timing import TimedResource, PROFILE_HELP
+from .currency import (
+    get_currencies,
+    add_currency_values,
+    get_currency_agg_cols,
+    drop_unrequested_eur,
+)
 from flask_restx import inputs
 
 import base
 from base.env import get_env
-from base.models import PipelineFlow, Country, Commodity, Currency, Price, PriceScenario
+from base.models import PipelineFlow, Country, Commodity, Price, PriceScenario
 from base.db import session
 from base.encoder import JsonEncoder
 from base.utils import to_list, to_datetime, to_bool
@@ -39,7 +46,7 @@ from .commodity import (
     strict_slashes=False,
     doc={"description": "Retrieve pipeline and roal/raid flows of fossil fuels."},
 )
-class PipelineFlowResource(Resource):
+class PipelineFlowResource(TimedResource):
     parser = reqparse.RequestParser()
 
     parser.add_argument(
@@ -205,6 +212,14 @@ class PipelineFlowResource(Resource):
         default=True,
     )
 
+    parser.add_argument(
+        "profile",
+        type=inputs.boolean,
+        help=PROFILE_HELP,
+        required=False,
+        default=False,
+    )
+
     @routes_api.expect(parser, validate=True)
     def get(self):
         params = PipelineFlowResource.parser.parse_args()
@@ -239,7 +254,7 @@ class PipelineFlowResource(Resource):
         nest_in_data = params.get("nest_in_data")
         download = params.get("download")
         rolling_days = params.get("rolling_days")
-        currency = params.get("currency")
+        currencies = get_currencies(params)
         sort_by = params.get("sort_by")
         limit = params.get("limit")
         keep_zeros = params.get("keep_zeros")
@@ -250,8 +265,6 @@ class PipelineFlowResource(Resource):
 
         value_eur_field = (PipelineFlow.value_tonne * Price.eur_per_tonne).label("value_eur")
 
-        value_currency_field = (value_eur_field * Currency.per_eur).label("value_currency")
-
         commodity_subquery = get_commodity_subquery(
             session=session, grouping_name=commodity_grouping
         )
@@ -299,8 +312,6 @@ class PipelineFlowResource(Resource):
                 PipelineFlow.value_tonne,
                 PipelineFlow.value_m3,
                 value_eur_field,
-                Currency.currency,
-                value_currency_field,
                 Price.scenario.label("pricing_scenario"),
                 PriceScenario.name.label("pricing_scenario_name"),
             )
@@ -333,20 +344,26 @@ class PipelineFlowResource(Resource):
                 ),
             )
             .outerjoin(PriceScenario, PriceScenario.id == Price.scenario)
-            .outerjoin(Currency, Currency.date == PipelineFlow.date)
             .filter(PipelineFlow.destination_iso2 != "RU")
             # Very important for pricing to have a distinct statement! And to be sorted prior that
             # so that we pick those with port ids matching, then destination iso2s, then ship etc.
             .order_by(
                 PipelineFlow.id,
                 Price.scenario,
-                Currency.currency,
                 Price.departure_port_ids,
                 Price.destination_iso2s,
                 Price.ship_insurer_iso2s,
                 Price.ship_owner_iso2s,
             )
-            .distinct(PipelineFlow.id, Price.scenario, Currency.currency)
+            .distinct(PipelineFlow.id, Price.scenario)
+        )
+
+        # One value_<ccy> column per currency, rather than one row per currency
+        flows_rich = add_currency_values(
+            flows_rich,
+            value_eur_field=value_eur_field,
+            date_field=PipelineFlow.date,
+            currencies=currencies,
         )
 
         # Return only >0 values. Otherwise we hit response size limit
@@ -390,9 +407,6 @@ class PipelineFlowResource(Resource):
                 DestinationCountry.region.in_(to_list(destination_region))
             )
 
-        if currency is not None:
-            flows_rich = flows_rich.filter(Currency.currency.in_(to_list(currency)))
-
         if pricing_scenario is not None:
             flows_rich = flows_rich.filter(Price.scenario.in_(to_list(pricing_scenario)))
 
@@ -408,10 +422,12 @@ class PipelineFlowResource(Resource):
             )
 
         # Aggregate
-        query = self.aggregate(query=flows_rich, aggregate_by=aggregate_by)
+        query = self.aggregate(query=flows_rich, aggregate_by=aggregate_by, currencies=currencies)
+        self.timer.lap("aggregate")
 
         # Query
         result = pd.read_sql(query.statement, session.bind)
+        self.timer.lap("read_sql", result)
 
         if len(result) == 0:
             return Response(
@@ -420,10 +436,12 @@ class PipelineFlowResource(Resource):
                 mimetype="application/json",
             )
 
-        result = self.spread_currencies(result)
+        result = self.spread_currencies(result, currencies=currencies)
+        self.timer.lap("spread_currencies", result)
 
         # Sort results
         result = self.sort_result(result=result, sort_by=sort_by)
+        self.timer.lap("sort", result)
 
         # Keep only n records
         if limit:
@@ -433,6 +451,7 @@ class PipelineFlowResource(Resource):
         result = self.roll_average(
             result=result, aggregate_by=aggregate_by, rolling_days=rolling_days
         )
+        self.timer.lap("roll_average", result)
         response = self.build_response(
             result=result,
             format=format,
@@ -440,9 +459,10 @@ class PipelineFlowResource(Resource):
             aggregate_by=aggregate_by,
             download=download,
         )
+        self.timer.lap("build_response")
         return response
 
-    def aggregate(self, query, aggregate_by):
+    def aggregate(self, query, aggregate_by, currencies):
         """Perform aggregation based on user agparameters"""
 
         if not aggregate_by:
@@ -455,11 +475,11 @@ class PipelineFlowResource(Resource):
             func.sum(subquery.c.value_tonne).label("value_tonne"),
             func.sum(subquery.c.value_m3).label("value_m3"),
             func.sum(subquery.c.value_eur).label("value_eur"),
-            func.sum(subquery.c.value_currency).label("value_currency"),
+            *get_currency_agg_cols(subquery, currencies),
         ]
 
         # Adding must have grouping columns
-        must_group_by = ["currency", "pricing_scenario"]
+        must_group_by = ["pricing_scenario"]
         aggregate_by.extend([x for x in must_group_by if x not in aggregate_by])
         if "" in aggregate_by:
             aggregate_by.remove("")
@@ -469,7 +489,6 @@ class PipelineFlowResource(Resource):
                 subquery.c.pricing_scenario,
                 subquery.c.pricing_scenario_name,
             ],
-            "currency": [subquery.c.currency],
             "commodity": [subquery.c.commodity, subquery.c.commodity_group],
             "commodity_group_name": [
                 subquery.c.commodity_group,
@@ -564,28 +583,9 @@ class PipelineFlowResource(Resource):
             result[date_column] = result.date.dt.date
         return result
 
-    def spread_currencies(self, result):
-        len_before = len(result)
-        n_currencies = len(result.currency.unique())
-
-        result["currency"] = "value_" + result.currency.str.lower()
-        index_cols = [
-            x for x in result.columns if x not in ["currency", "value_currency", "value_eur"]
-        ]
-
-        result = (
-            result[index_cols + ["currency", "value_currency"]]
-            .set_index(index_cols + ["currency"])["value_currency"]
-            .unstack(-1)
-            .reset_index()
-        )
-
-        # Quick sanity check
-        len_after = len(result)
-        assert len_after == len_before / n_currencies
-        result.replace({np.nan: None}, inplace=True)
-
-        return result
+    def spread_currencies(self, result, currencies):
+        # Currencies are already spread in SQL, see add_currency_values
+        return drop_unrequested_eur(result, currencies)
 
     def build_response(self, result, format, nest_in_data, aggregate_by, download):
         result.replace({np.nan: None}, inplace=True)
@@ -2,15 +2,17 @@ import pandas as pd
 import json
 import numpy as np
 import re
-from collections.abc import Iterable
+from sqlalchemy import func
 
 
 from . import routes_api
+from .timing import TimedResource, PROFILE_HELP
+from .currency import get_currencies, drop_unrequested_eur
 from flask_restx import inputs
 
 from base.db import session
 from base.encoder import JsonEncoder
-from base.utils import to_list, to_datetime, intersect
+from base.utils import to_list, to_datetime, intersect, get_list_columns, hash_df, unhash_df
 from base.logger import logger
 
 from http import HTTPStatus
@@ -19,7 +21,7 @@ from flask_restx import Resource, reqparse
 from abc import abstractmethod
 
 
-class TemplateResource(Resource):
+class TemplateResource(TimedResource):
     parser = reqparse.RequestParser()
 
     # Query processing
@@ -114,6 +116,13 @@ class TemplateResource(Resource):
         required=False,
         default=True,
     )
+    parser.add_argument(
+        "profile",
+        type=inputs.boolean,
+        help=PROFILE_HELP,
+        required=False,
+        default=False,
+    )
 
     # MUST BE FILLED
     must_group_by = []
@@ -200,11 +209,14 @@ class TemplateResource(Resource):
 
         # Create db query
         query = self.initial_query(params=params)
+        self.timer.lap("initial_query")
 
         query = self.filter(query=query, params=params)
+        self.timer.lap("filter")
 
         if check_complete:
             check_status, incomplete_reason = self.check_complete(query=query, params=params)
+            self.timer.lap("check_complete")
             if not check_status:
                 return Response(
                     status=HTTPStatus.NOT_FOUND,
@@ -216,9 +228,24 @@ class TemplateResource(Resource):
                 )
 
         query = self.aggregate(query=query, params=params)
+        self.timer.lap("aggregate")
+
+        # Keep only n groups, in SQL if possible
+        limited_query = self.limit_query(
+            query=query,
+            limit=limit,
+            aggregate_by=aggregate_by,
+            sort_by=sort_by,
+            limit_by=limit_by,
+            rolling_days=rolling_days,
+        )
+        if limited_query is not None:
+            query = limited_query
+            self.timer.lap("limit_query")
 
         # Collect
         result = pd.read_sql(query.statement, session.bind)
+        self.timer.lap("read_sql", result)
 
         if len(result) == 0:
             return Response(
@@ -232,31 +259,39 @@ class TemplateResource(Resource):
         # if date_cols:
         #     result = result.sort_values(date_cols)
 
-        # Hash i.e. convert list to tuples so that pandas can hash
-        result, list_columns = self.hash_df(result)
+        # List columns, which pandas can't group by, are replaced with integer codes
+        # until after the pivot. They are known from the query, rather than from the data
+        codes_values = {}
+        list_columns = [x for x in get_list_columns(query) if x not in to_list(pivot_by)]
+        limit_in_pandas = limit and limited_query is None
+        if list_columns and (rolling_days is not None or sort_by or limit_in_pandas or pivot_by):
+            result, codes_values = hash_df(result, list_columns)
+            self.timer.lap("hash_df", result)
 
         # Rolling average
         result = self.roll_average(
             result=result, aggregate_by=aggregate_by, rolling_days=rolling_days
         )
+        self.timer.lap("roll_average", result)
 
-        # Spread currencies
-        result = self.spread_currencies(result=result, prehashed=True)
-
-        # Unhash
-        result = self.unhash_df(result=result, list_columns=list_columns)
+        # Currencies are already spread in SQL
+        result = self.spread_currencies(result=result, params=params)
+        self.timer.lap("spread_currencies", result)
 
         # Sort results
         result = self.sort_result(result=result, sort_by=sort_by, aggregate_by=aggregate_by)
-
-        # Keep only n records
-        result = self.limit_result(
-            result=result,
-            limit=limit,
-            aggregate_by=aggregate_by,
-            sort_by=sort_by,
-            limit_by=limit_by,
-        )
+        self.timer.lap("sort", result)
+
+        # Keep only n records, unless already done in SQL
+        if limit_in_pandas:
+            result = self.limit_result(
+                result=result,
+                limit=limit,
+                aggregate_by=aggregate_by,
+                sort_by=sort_by,
+                limit_by=limit_by,
+            )
+            self.timer.lap("limit", result)
 
         # Pivot
         result = self.pivot_result(
@@ -265,11 +300,18 @@ class TemplateResource(Resource):
             pivot_value=pivot_value,
             pivot_fill_value=pivot_fill_value,
         )
+        self.timer.lap("pivot", result)
+
+        if codes_values:
+            result = unhash_df(result, codes_values)
+            self.timer.lap("unhash_df", result)
 
         # Post compute
         result = self.postcompute(result=result, params=params)
+        self.timer.lap("postcompute", result)
 
         result = self.select(result, select=select)
+        self.timer.lap("select", result)
 
         response = self.build_response(
             result=result,
@@ -278,6 +320,7 @@ class TemplateResource(Resource):
             aggregate_by=aggregate_by,
             download=download,
         )
+        self.timer.lap("build_response")
         return response
 
     def roll_average(self, result, aggregate_by, rolling_days):
@@ -319,7 +362,10 @@ class TemplateResource(Resource):
         max_date = result[date_column].max()
         daterange = pd.date_range(min_date, max_date).rename(date_column)
 
-        value_cols_present = intersect(self.value_cols, result.columns)
+        # Including the value_<ccy> columns of the currencies requested
+        value_cols_present = [
+            x for x in result.columns if x in self.value_cols or x.startswith("value_")
+        ]
         date_cols_present = intersect(self.date_cols, result.columns)
 
         result[date_column] = pd.to_datetime(result[date_column]).dt.floor(
@@ -460,7 +506,7 @@ class TemplateResource(Resource):
                     x
                     for x in aggregate_by
                     if not x in aggregate_by_dependencies
-                    and not x in ["date", "month", "year", "currency", "date_without_year"]
+                    and not x in ["date", "month", "year", "date_without_year"]
                     and x in result.columns
                 ]
 
@@ -476,12 +522,11 @@ class TemplateResource(Resource):
 
         return result
 
-    def limit_result(self, result, limit, aggregate_by, sort_by, limit_by):
-        if not limit:
-            return result
-
-        limit_by = to_list(limit_by) or []
-
+    def get_limit_groupers(self, aggregate_by, limit_by, columns):
+        """
+        The groups ranked by `limit`: aggregated columns other than commodities and dates,
+        plus those of `limit_by`, within which the top `limit` groups are kept.
+        """
         if not aggregate_by:
             group_by = ["destination_country"]
 
@@ -491,11 +536,61 @@ class TemplateResource(Resource):
                 for x in aggregate_by
                 if not x.startswith("commodity")
                 and not x in ["date", "month", "year"]
-                and x in result.columns
+                and x in columns
             ]
 
+        return group_by + [x for x in limit_by if x not in group_by]
+
+    def limit_query(self, query, limit, aggregate_by, sort_by, limit_by, rolling_days):
+        """
+        Keep only the top `limit` groups in the query itself, ranking the total of each group with
+        window functions, so that the other groups aren't sent by the database.
+
+        :return: the limited query, or None if the limit can't be applied in SQL, in which case
+        `limit_result` applies it to the result instead: when values are rolled (the ranking is
+        on rolled values), when not aggregating (records are returned in the query order), or
+        when sorting by something else than a column.
+        """
+        if not limit or not aggregate_by or rolling_days is not None:
+            return None
+
+        limit_by = to_list(limit_by) or []
+        sort_by = to_list(sort_by or "value_eur")[0]
+        subquery = query.subquery()
+        group_by = self.get_limit_groupers(aggregate_by, limit_by, columns=subquery.c.keys())
+        if any(x not in subquery.c for x in group_by + [sort_by]):
+            return None
+
+        # Total of each group. Groups with a null key are dropped, as pandas does in limit_result
+        groupers = [subquery.c[x] for x in group_by]
+        scored = (
+            session.query(
+                subquery,
+                func.sum(subquery.c[sort_by]).over(partition_by=groupers).label("_limit_total"),
+            )
+            .filter(*[x != None for x in groupers])
+            .subquery()
+        )
+
+        # Rank of each group within limit_by. Ordering by the group as well, so that groups with
+        # the same total get different ranks
+        rank = func.dense_rank().over(
+            partition_by=[scored.c[x] for x in limit_by] or None,
+            order_by=[scored.c._limit_total.desc().nullslast()] + [scored.c[x] for x in group_by],
+        )
+        ranked = session.query(scored, rank.label("_limit_rank")).subquery()
+
+        return session.query(*[ranked.c[x] for x in subquery.c.keys()]).filter(
+            ranked.c._limit_rank <= limit
+        )
+
+    def limit_result(self, result, limit, aggregate_by, sort_by, limit_by):
+        if not limit:
+            return result
+
+        limit_by = to_list(limit_by) or []
+        group_by = self.get_limit_groupers(aggregate_by, limit_by, columns=result.columns)
         sort_by = sort_by or "value_eur"
-        group_by = group_by + [x for x in limit_by if x not in group_by]
 
         # Can only take one
         sort_by = to_list(sort_by)[0]
@@ -515,87 +610,9 @@ class TemplateResource(Resource):
 
         return result
 
-    def hash_df(self, df):
-        # Create a hashable version
-        # find columns that are list and convert them to tuple
-        list_columns = [
-            col
-            for col in df.columns
-            if any(df[col].notna()) and any(df[col].apply(lambda x: type(x) == list))
-        ]
-
-        def to_tuple_if_iterable(x):
-            if x is None:
-                return None
-            if np.isscalar(x):
-                if pd.isna(x):
-                    return None
-                return x
-            if isinstance(x, Iterable) and not isinstance(x, (str, bytes)):
-                return tuple(x)
-            return x
-
-        for col in list_columns:
-            df[col] = df[col].apply(to_tuple_if_iterable)
-        return df, list_columns
-
-    def unhash_df(self, result, list_columns):
-        # Unhash the dataframe
-        def to_list_if_iterable(x):
-            if x is None or (np.isscalar(x) and pd.isna(x)):
-                return None
-            if isinstance(x, Iterable) and not isinstance(x, (str, bytes)):
-                return list(x)
-            return x
-
-        for col in list_columns:
-            result[col] = result[col].apply(to_list_if_iterable)
-        return result
-
-    def spread_currencies(self, result, prehashed=False):
-
-        if "currency" not in result.columns:
-            return result
-
-        # We simply want to pivot across currencies
-        # But pandas need clean non-null and hashable data, hence this whole function...
-        len_before = len(result)
-        n_currencies = len(result.currency.unique())
-
-        result["currency"] = "value_" + result.currency.str.lower()
-
-        # Replace nan with None
-        result.replace({np.nan: None}, inplace=True)
-
-        if not prehashed:
-            # Create a hashable version
-            # find columns that are list and convert them to tuple
-            list_columns = [
-                col
-                for col in result.columns
-                if any(result[col].notna()) and any(result[col].apply(lambda x: type(x) == list))
-            ]
-            for col in list_columns:
-                result[col] = result[col].apply(tuple)
-
-        # Round all value_ columns to prevent pivoting error when there is an epsilon diff
-        # Observed on kpler_trade once
-        value_cols = [x for x in result.columns if x.startswith("value_")]
-        result[value_cols] = result[value_cols].round(6)
-
-        index_cols = [
-            x for x in result.columns if x not in ["currency", "value_currency", "value_eur"]
-        ]
-
-        result = (
-            result[index_cols + ["currency", "value_currency"]]
-            .set_index(index_cols + ["currency"])["value_currency"]
-            .unstack(-1)
-            .reset_index()
-        )
-
-        # Quick sanity check
-        len_after = len(result)
-        assert len_after == len_before / n_currencies
-
-        return result
+    def spread_currencies(self, result, params):
+        """
+        One `value_<ccy>` column per currency is computed in the query (see `add_currency_values`),
+        so that only leaves EUR to drop if it wasn't requested.
+        """
+        return drop_unrequested_eur(result, get_currencies(params))
@@ -0,0 +1,133 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+
+import pandas as pd
+from decouple import config
+from flask import Response, request
+from flask_restx import Resource, inputs
+from flask_restx.utils import unpack
+from werkzeug.wrappers import Response as BaseResponse
+
+from base.logger import logger
+
+from .security import is_valid
+
+PROFILE_HELP = (
+    "Whether to return a profile of the request (cProfile report) instead of its data."
+    " Requires a valid api_key, unless API_PROFILE_ENABLED is set."
+)
+
+
+class RequestTimer:
+    """
+    Times the successive stages of a request: each call to `lap` closes the stage started
+    by the previous one, and records the number of rows of its result.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.stages = []
+
+    def lap(self, stage, result=None):
+        now = time.perf_counter()
+        rows = len(result) if isinstance(result, pd.DataFrame) else None
+        self.stages.append({"stage": stage, "ms": (now - self.last) * 1000, "rows": rows})
+        self.last = now
+        return result
+
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self):
+        """
+        Stages as a Server-Timing header value, which browsers show in their network panel.
+        """
+        metrics = []
+        for x in self.stages:
+            desc = f';desc="{x["rows"]} rows"' if x["rows"] is not None else ""
+            metrics.append(f"{x['stage']};dur={x['ms']:.1f}{desc}")
+        metrics.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(metrics)
+
+    def summary(self, resource):
+        return {
+            "resource": resource,
+            "path": request.path,
+            "total_ms": round(self.total_ms(), 1),
+            "stages": [{**x, "ms": round(x["ms"], 1)} for x in self.stages],
+        }
+
+
+class TimedResource(Resource):
+    """
+    Resource timing its stages (see `RequestTimer`): the timings of each request are logged,
+    and returned in a Server-Timing header. With `profile=true` (and a valid API key, unless
+    API_PROFILE_ENABLED), the request is run under cProfile and the report is returned instead
+    of the data, if the request succeeded.
+    """
+
+    _timer = None
+
+    @property
+    def timer(self) -> RequestTimer:
+        # Also available when get_from_params is called outside of a request
+        if self._timer is None:
+            self._timer = RequestTimer()
+        return self._timer
+
+    def dispatch_request(self, *args, **kwargs):
+        self._timer = RequestTimer()
+
+        if is_profile_requested():
+            if not is_profile_allowed():
+                return {"message": "Profiling requires a valid API key"}, 403
+            return self.profile_request(*args, **kwargs)
+
+        response = super().dispatch_request(*args, **kwargs)
+        logger.info(f"Request timing: {json.dumps(self.timer.summary(type(self).__name__))}")
+        if isinstance(response, BaseResponse):
+            response.headers["Server-Timing"] = self.timer.server_timing()
+        return response
+
+    def profile_request(self, *args, **kwargs):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = super().dispatch_request(*args, **kwargs)
+        finally:
+            profiler.disable()
+
+        # Errors (e.g. a missing API key) are returned as they are
+        status = response.status_code if isinstance(response, BaseResponse) else unpack(response)[1]
+        if not 200 <= status < 300:
+            return response
+
+        report = io.StringIO()
+        report.write(json.dumps(self.timer.summary(type(self).__name__), indent=2) + "\n\n")
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(50)
+        return Response(
+            response=report.getvalue(),
+            status=200,
+            mimetype="text/plain",
+            headers={"Server-Timing": self.timer.server_timing()},
+        )
+
+
+def is_profile_requested():
+    try:
+        return inputs.boolean(request.args.get("profile", False))
+    except ValueError:
+        return False
+
+
+def is_profile_allowed():
+    # Whether anyone can profile requests, e.g. locally. Only read from the local environment,
+    # so that requests don't look it up in Secret Manager
+    if config("API_PROFILE_ENABLED", default=False, cast=bool):
+        return True
+    api_key = request.args.get("api_key")
+    return api_key is not None and is_valid(api_key, request.path)
@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+from flask import Flask, request
+
+from asgi import ASGI_CHUNK_SIZE, LanedAsgiApp
+
+
+def call(asgi_app, path, query_string=b"", method="GET", headers=(), body=b"", sent=None):
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query_string,
+        "headers": [(b"host", b"localhost"), *headers],
+        "scheme": "http",
+        "client": ("127.0.0.1", 0),
+    }
+    # The request body in two messages
+    messages = [
+        {"type": "http.request", "body": body[:1], "more_body": True},
+        {"type": "http.request", "body": body[1:], "more_body": False},
+    ]
+    sent = [] if sent is None else sent
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app(scope, receive, send))
+    assert [x.get("more_body", False) for x in sent[1:]] == [True] * (len(sent) - 2) + [False]
+    return sent[0]["status"], b"".join(x["body"] for x in sent[1:])
+
+
+def test_asgi_light_lane(app):
+    asgi_app = LanedAsgiApp(app, heavy_workers=0)
+    try:
+        status, body = call(asgi_app, "/v0/environment")
+        assert status == 200
+        with app.test_client() as test_client:
+            assert json.loads(body) == test_client.get("/v0/environment").json
+    finally:
+        asgi_app.stop()
+
+
+def test_asgi_heavy_lane_full(app):
+    asgi_app = LanedAsgiApp(app, heavy_paths=["/v0/environment"], heavy_workers=1, heavy_queue=0)
+    try:
+        # Another heavy request is already running
+        asgi_app.heavy_admitted = 1
+        status, _ = call(asgi_app, "/v0/environment")
+        assert status == 503
+    finally:
+        asgi_app.stop()
+
+
+def test_asgi_light_lane_streams_body():
+    streaming_app = Flask(__name__)
+
+    @streaming_app.post("/echo/<name>")
+    def echo(name):
+        received = request.get_data()
+        line = f"{name} {request.args['n']} {request.content_type} {received.decode()}\n"
+        return streaming_app.response_class(
+            (line for _ in range(int(request.args["n"]))), mimetype="text/plain"
+        )
+
+    asgi_app = LanedAsgiApp(streaming_app, heavy_workers=0)
+    try:
+        sent = []
+        status, body = call(
+            asgi_app,
+            "/echo/é",
+            query_string=b"n=10000",
+            method="POST",
+            headers=[(b"content-type", b"text/plain")],
+            body=b"hello",
+            sent=sent,
+        )
+        assert status == 200
+        assert body == "é 10000 text/plain hello\n".encode() * 10000
+        # Sent as it was produced, in chunks
+        chunks = [x["body"] for x in sent[1:]]
+        assert len(chunks) > 1
+        assert all(len(x) >= ASGI_CHUNK_SIZE for x in chunks[:-1])
+    finally:
+        asgi_app.stop()
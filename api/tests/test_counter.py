@@ -10,6 +10,7 @@ import datetime as dt
 
 from base.models import Position, ShipmentArrivalBerth
 from base.db import session
+from base.env import get_env
 from base.utils import to_datetime
 from base import PRICING_DEFAULT, PRICING_ENHANCED
 
@@ -408,3 +409,24 @@ def test_pricing_scenario(app):
             scenario_values.loc[PRICING_ENHANCED][different_values]
             != scenario_values.loc[PRICING_DEFAULT][different_values]
         )
+
+
+def test_counter_timing(app):
+    with app.test_client() as test_client:
+        response = test_client.get("/v0/counter")
+        assert response.status_code == 200
+        server_timing = response.headers["Server-Timing"]
+        assert "read_sql;dur=" in server_timing
+        assert "total;dur=" in server_timing
+
+        # Profiling requires a valid API key
+        response = test_client.get("/v0/counter?profile=true")
+        assert response.status_code == 403
+
+        response = test_client.get(
+            "/v0/counter?"
+            + urllib.parse.urlencode({"profile": "true", "api_key": get_env("API_KEY")})
+        )
+        assert response.status_code == 200
+        assert response.mimetype == "text/plain"
+        assert "cumulative" in response.get_data(as_text=True)
@@ -147,6 +147,21 @@ def test_kpler_v1_key(app):
         assert response.status_code == 403
 
 
+def test_kpler_flow_profile_keeps_errors(app, monkeypatch):
+    monkeypatch.setenv("API_PROFILE_ENABLED", "true")
+    with app.test_client() as test_client:
+        params = {
+            "format": "json",
+            "date_from": "2022-12-01",
+            "date_to": "2022-12-31",
+            "api_key": "THISISNOTACORRECTKEY",
+            "profile": "true",
+        }
+        response = test_client.get("/v1/kpler_flow?" + urllib.parse.urlencode(params))
+        assert response.status_code == 403
+        assert response.json["message"] == "The provided API key is not valid"
+
+
 def test_kpler_crude_export(app):
     """
     Test values against manually collected ones
@@ -504,6 +519,42 @@ def test_kpler_trade_no_duplicates(app):
         assert len(grouped_trades[grouped_trades["size"] > 1]) == 0
 
 
+def test_kpler_trade_limit_by(app):
+    # Top groups are selected in SQL: compare with those of the full aggregation
+    with app.test_client() as test_client:
+        params = {
+            "format": "json",
+            "date_from": "2023-01-01",
+            "date_to": "2023-03-31",
+            "origin_iso2": "RU",
+            "aggregate_by": "destination_iso2,commodity",
+            "pricing_scenario": "default",
+            "api_key": get_env("API_KEY"),
+        }
+
+        response = test_client.get("/v1/kpler_trade?" + urllib.parse.urlencode(params))
+        assert response.status_code == 200
+        full = pd.DataFrame(response.json["data"])
+
+        response = test_client.get(
+            "/v1/kpler_trade?"
+            + urllib.parse.urlencode(params | {"limit": 3, "limit_by": "commodity"})
+        )
+        assert response.status_code == 200
+        limited = pd.DataFrame(response.json["data"])
+
+        expected = (
+            full.dropna(subset=["destination_iso2"])
+            .sort_values("value_eur", ascending=False)
+            .groupby("commodity")
+            .head(3)
+        )
+        assert len(limited) == len(expected)
+        assert set(zip(limited.commodity, limited.destination_iso2)) == set(
+            zip(expected.commodity, expected.destination_iso2)
+        )
+
+
 def test_kpler_trade_pricing(app):
     with app.test_client() as test_client:
         ID__FLOWS_1__SHIPS_1 = {
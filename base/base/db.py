@@ -34,13 +34,17 @@ def get_connection_string_from_env():
 
 connection = get_connection_string_from_env()
 
+# Connections each process can hold at once: at most DB_POOL_SIZE + DB_MAX_OVERFLOW
+DB_POOL_SIZE = 5
+DB_MAX_OVERFLOW = 2
+
 engine = None
 try:
     engine = create_engine(
         connection,
         convert_unicode=True,
-        pool_size=5,
-        max_overflow=2,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
         pool_pre_ping=True,
         pool_timeout=30,
         pool_recycle=1800,
@@ -91,7 +95,21 @@ def init_db(drop_first=False):
 # For upsert: https://stackovershipment.com/questions/55187884/insert-into-postgresql-table-from-pandas-with-on-conflict-update
 meta = None
 
-# For old counter data
-from pymongo import MongoClient
+# For old counter data, only connected to on first use
+_mongo_client = None
+
+
+def get_mongo_client():
+    global _mongo_client
+    if _mongo_client is None:
+        from pymongo import MongoClient
+
+        _mongo_client = MongoClient(get_env("CREA_MONGODB_URL"))
+    return _mongo_client
+
 
-mongo_client = MongoClient(get_env("CREA_MONGODB_URL"))
+def __getattr__(name):
+    # Keeps `from base.db import mongo_client` working
+    if name == "mongo_client":
+        return get_mongo_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
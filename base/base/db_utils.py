@@ -1,6 +1,7 @@
+import sys
+
 import sqlalchemy
 from sqlalchemy.dialects.postgresql import insert
-import geopandas as gpd
 import pandas as pd
 from tqdm import tqdm
 
@@ -43,7 +44,30 @@ def get_upsert_method(constraint_name, show_progress=True):
     return upsert
 
 
-def upsert(df, table, constraint_name, dtype={}, show_progress=True, chunksize=10000):
+def get_bulk_upsert_method(constraint_name):
+    """
+    Same as get_upsert_method, but sends each chunk as a single multi-row
+    INSERT ... ON CONFLICT DO UPDATE statement. Rows within a chunk must not conflict
+    with each other.
+    """
+
+    def upsert(table, conn, keys, data_iter):
+        global meta
+        data = [{k: row[i] for i, k in enumerate(keys)} for row in data_iter]
+        if not data:
+            return
+
+        insert_stmt = insert(meta.tables[table.name]).values(data)
+        upsert_stmt = insert_stmt.on_conflict_do_update(
+            constraint=constraint_name,
+            set_={k: insert_stmt.excluded[k] for k in keys},
+        )
+        conn.execute(upsert_stmt)
+
+    return upsert
+
+
+def upsert(df, table, constraint_name, dtype={}, show_progress=True, chunksize=10000, bulk=False):
     """
     This function upserts data into a specific table using chunks determined by chunksize
 
@@ -53,6 +77,7 @@ def upsert(df, table, constraint_name, dtype={}, show_progress=True, chunksize=1
     :param dtype:
     :param show_progress:
     :param chunksize:
+    :param bulk: whether to upsert each chunk in a single statement rather than row by row
     :return:
     """
     global meta
@@ -61,7 +86,9 @@ def upsert(df, table, constraint_name, dtype={}, show_progress=True, chunksize=1
         meta.bind = engine
         meta.reflect(views=False, resolve_fks=False)
 
-    if isinstance(df, gpd.GeoDataFrame):
+    # No need to import geopandas to check: a GeoDataFrame implies it already is
+    gpd = sys.modules.get("geopandas")
+    if gpd is not None and isinstance(df, gpd.GeoDataFrame):
         # TODO upsert not yet supported. Not sure what's the best way to proceed
         # It will fail if constraint is violated
         # A way would be to first remove db records violating the constraint
@@ -73,7 +100,11 @@ def upsert(df, table, constraint_name, dtype={}, show_progress=True, chunksize=1
             con=engine,
             if_exists="append",
             index=False,
-            method=get_upsert_method(constraint_name, show_progress=show_progress),
+            method=(
+                get_bulk_upsert_method(constraint_name)
+                if bulk
+                else get_upsert_method(constraint_name, show_progress=show_progress)
+            ),
             chunksize=chunksize,
             dtype=dtype,
         )
@@ -2,7 +2,6 @@
 # depending on the infrastructure (e.g. GCE, GAE, local etc.)
 import os
 from decouple import config
-from google.cloud.secretmanager_v1 import SecretManagerServiceClient, SecretVersion
 
 
 project_id = config("PROJECT_ID")
@@ -11,10 +10,22 @@ cred = config("GOOGLE_APPLICATION_CREDENTIALS", None)
 if cred is not None:
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = cred
 
-try:
-    client = SecretManagerServiceClient()
-except Exception:
-    client = None
+# Created on the first key that isn't set locally: most processes never need it
+_client = None
+_client_created = False
+
+
+def get_secret_client():
+    global _client, _client_created
+    if not _client_created:
+        _client_created = True
+        try:
+            from google.cloud.secretmanager_v1 import SecretManagerServiceClient
+
+            _client = SecretManagerServiceClient()
+        except Exception:
+            _client = None
+    return _client
 
 
 def get_env(key, default=None):
@@ -29,8 +40,10 @@ def get_env(key, default=None):
     # Try without default
     c = config(key, default=None)
     g = None
-    if client and c is None:
+    client = get_secret_client() if c is None else None
+    if client:
         try:
+            from google.cloud.secretmanager_v1 import SecretVersion
             from base.logger import logger
 
             logger.info("...Looking for %s in Google Secret" % (key,))
@@ -10,6 +10,7 @@ from .counter import *
 from .country import *
 from .currency import *
 from .flaring import *
+from .integrity import *
 from .kpler import *
 from .pipeline import *
 from .price import *
@@ -0,0 +1,30 @@
+from sqlalchemy import (
+    Column,
+    String,
+    DateTime,
+    Numeric,
+    BigInteger,
+    Boolean,
+)
+from sqlalchemy import Index
+
+from base.db import Base
+
+from .table_names import *
+
+
+class IntegrityCheckRun(Base):
+    """
+    Outcome and duration of each integrity step, one row per step and run.
+    """
+
+    id = Column(BigInteger, autoincrement=True, primary_key=True)
+    run_started_on = Column(DateTime(timezone=False), nullable=False)
+    step = Column(String, nullable=False)
+    success = Column(Boolean, nullable=False)
+    timed_out = Column(Boolean, nullable=False, default=False)
+    duration_seconds = Column(Numeric)
+    error = Column(String)
+
+    __tablename__ = DB_TABLE_INTEGRITY_CHECK_RUN
+    __table_args__ = (Index("idx_integrity_check_run_step_started_on", "step", "run_started_on"),)
@@ -158,6 +158,13 @@ class KplerTrade(Base):
         Index("idx_kpler_trade_product_id", "product_id"),
         Index("idx_kpler_flow_departure_zone_id", "departure_zone_id"),
         Index("idx_kpler_flow_arrival_zone_id", "arrival_zone_id"),
+        # Covers the per-country, per-day aggregations used to validate trades against Kpler
+        Index(
+            "idx_kpler_trade_departure_zone_id_departure_date_utc",
+            "departure_zone_id",
+            "departure_date_utc",
+            postgresql_include=["value_tonne", "arrival_zone_id", "product_id", "is_valid"],
+        ),
     )
 
     __tablename__ = DB_TABLE_KPLER_TRADE
@@ -302,6 +309,7 @@ class KplerZone(Base):
     area = Column(String)
 
     __tablename__ = DB_TABLE_KPLER_ZONE
+    __table_args__ = (Index("idx_kpler_zone_country_iso2", "country_iso2"),)
 
 
 class KplerInstallation(Base):
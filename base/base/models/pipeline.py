@@ -39,6 +39,11 @@ class EntsogFlowRaw(Base):
     value_kwh = Column(Numeric)
     gcv_kwh_m3 = Column(Numeric)
 
+    # Checksum of the values as last downloaded, and as last processed into EntsogFlow.
+    # Rows where they differ need to be processed again.
+    checksum = Column(String)
+    processed_checksum = Column(String)
+
     updated_on = Column(DateTime, server_default=func.now(), server_onupdate=func.now())
     __tablename__ = DB_TABLE_ENTSOGFLOW_RAW
     __table_args__ = (Index("idx_entsogflow_raw_pointkey", "pointKey"),)
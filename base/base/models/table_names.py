@@ -76,3 +76,5 @@ DB_TABLE_SHIP_SANCTION = "ship_sanction"
 DB_TABLE_SANCTION_PACKAGE = "sanction_package"
 
 DB_TABLE_SHIP_INSPECTIONS = "ship_inspection"
+
+DB_TABLE_INTEGRITY_CHECK_RUN = "integrity_check_run"
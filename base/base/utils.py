@@ -1,14 +1,11 @@
 from typing import Any, Optional
-from shapely import geometry
-import shapely
-import pyproj
 import datetime as dt
 import pandas as pd
+import sqlalchemy as sa
 from geoalchemy2 import WKTElement, WKBElement
 from base.encoder import JsonEncoder
 import json
 import numpy as np
-from collections.abc import Iterable
 
 
 def daterange_intersection(daterange1, daterange2):
@@ -158,6 +155,9 @@ def distance_between_points(p1, p2, ellps="WGS84"):
     Distance in meters
 
     """
+    import pyproj
+    import shapely.wkt
+
     geod = pyproj.Geod(ellps=ellps)
 
     try:
@@ -180,6 +180,8 @@ def distance_between_points(p1, p2, ellps="WGS84"):
 
 
 def latlon_to_point(lat, lon, wkt=True):
+    from shapely import geometry
+
     try:
         return "SRID=4326;" + geometry.Point(float(lon), float(lat)).wkt
     except TypeError:
@@ -239,6 +241,8 @@ def try_parse_date(date_str: str, *, formats: list[str]) -> dt.datetime:
 
 
 def wkb_to_shape(geom):
+    import shapely.errors
+    import shapely.geometry
     from shapely import wkb
 
     if isinstance(geom, shapely.geometry.base.BaseGeometry):
@@ -311,40 +315,43 @@ def read_json(path):
         return json.load(f)
 
 
-def hash_df(df):
-    # Create a hashable version
-    # find columns that are list and convert them to tuple
-    list_columns = [
-        col
-        for col in df.columns
-        if any(df[col].notna()) and any(df[col].apply(lambda x: type(x) == list))
+def get_list_columns(query):
+    """
+    Columns of a query returning lists i.e. ARRAY columns, read from its metadata rather than
+    from the values returned.
+    """
+    return [
+        name
+        for name, column in query.statement.selected_columns.items()
+        if isinstance(column.type, sa.ARRAY)
     ]
 
-    def to_tuple_if_iterable(x):
-        if x is None:
-            return None
-        if np.isscalar(x):
-            if pd.isna(x):
-                return None
-            return x
-        if isinstance(x, Iterable) and not isinstance(x, (str, bytes)):
-            return tuple(x)
-        return x
-
-    for col in list_columns:
-        df[col] = df[col].apply(to_tuple_if_iterable)
-    return df, list_columns
-
-
-def unhash_df(df, list_columns):
-    # Unhash the dataframe
-    def to_list_if_iterable(x):
-        if x is None or (np.isscalar(x) and pd.isna(x)):
-            return None
-        if isinstance(x, Iterable) and not isinstance(x, (str, bytes)):
-            return list(x)
-        return x
 
-    for col in list_columns:
-        df[col] = df[col].apply(to_list_if_iterable)
+def hash_df(df, list_columns):
+    """
+    Replace list columns, which pandas can't group by, with integer codes.
+
+    Equal lists share the same code: they are factorised on their string representation,
+    computed in one vectorised pass rather than with a Python function per cell.
+    :return: df, and the values of each code to restore them with `unhash_df`
+    """
+    codes_values = {}
+    for col in intersect(list_columns, df.columns):
+        codes, _ = pd.factorize(df[col].astype(str))
+        _, first = np.unique(codes, return_index=True)
+        codes_values[col] = df[col].to_numpy()[first]
+        df[col] = codes
+    return df, codes_values
+
+
+def unhash_df(df, codes_values):
+    for col, values in codes_values.items():
+        if col not in df.columns:
+            continue
+        # Codes may have become floats with missing values e.g. after a concat
+        codes = df[col].to_numpy()
+        valid = pd.notna(codes)
+        unhashed = np.full(len(codes), None, dtype=object)
+        unhashed[valid] = values[codes[valid].astype(int)]
+        df[col] = unhashed
     return df
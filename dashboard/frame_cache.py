@@ -0,0 +1,83 @@
+import functools
+import hashlib
+import json
+
+import pandas as pd
+import pyarrow as pa
+import redis
+
+from logger import logger
+
+
+class FrameCache:
+    """
+    Redis cache for DataFrames, stored as Arrow IPC streams.
+
+    Compared to flask_caching, which pickles whatever the function returns, frames are
+    stored column by column: they are several times smaller and load without going through
+    Python objects.
+
+    Each level of processing (e.g. raw, aggregated, rolled) is memoized under its own key,
+    so that changing a parameter only recomputes the levels that depend on it.
+    """
+
+    def __init__(self, redis_url, timeout, prefix="frames"):
+        self.client = redis.Redis.from_url(redis_url)
+        self.timeout = timeout
+        self.prefix = prefix
+
+    def key(self, level, name, *args, **kwargs):
+        arguments = json.dumps([args, kwargs], sort_keys=True, default=str)
+        digest = hashlib.sha1(arguments.encode()).hexdigest()
+        return f"{self.prefix}:{level}:{name}:{digest}"
+
+    def get(self, key):
+        try:
+            buffer = self.client.get(key)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Failed to read {key} from cache: {e}")
+            return None
+
+        if buffer is None:
+            return None
+
+        with pa.ipc.open_stream(buffer) as reader:
+            return reader.read_pandas()
+
+    def set(self, key, df):
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except pa.ArrowException as e:
+            logger.warning(f"Failed to convert {key} to arrow, not caching it: {e}")
+            return
+
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+
+        try:
+            self.client.set(key, sink.getvalue().to_pybytes(), ex=self.timeout)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Failed to write {key} to cache: {e}")
+
+    def memoize(self, level):
+        """
+        Decorator caching the DataFrame returned by a function, keyed by its level, name and
+        arguments.
+        """
+
+        def decorator(f):
+            @functools.wraps(f)
+            def wrapper(*args, **kwargs):
+                key = self.key(level, f.__name__, *args, **kwargs)
+                df = self.get(key)
+                if df is None:
+                    df = f(*args, **kwargs)
+                    if isinstance(df, pd.DataFrame):
+                        self.set(key, df)
+                return df
+
+            wrapper.cache_key = functools.partial(self.key, level, f.__name__)
+            return wrapper
+
+        return decorator
@@ -6,25 +6,56 @@ from dash import Input, Output, html, State
 from dash.exceptions import PreventUpdate
 
 from logger import logger
-from server import app, cache
+from server import app, frame_cache
 from . import COUNTRY_GLOBAL
 from . import FACET_NONE
 from . import COMMODITY_ALL
-from .utils import to_list, roll_average_kpler
+from .utils import to_list
 
 """
 We create several level of kpler data.
 Not all parameter changes require a new data query to the API, or roll-averaging.
+
+Each level is cached in redis separately (see FrameCache):
+- raw: the unaggregated API result, only used for downloads
+- aggregated: daily series per colour and facet, aggregated and roll-averaged by the API
+- top: the aggregated series, with colours outside the top-N grouped into "Others"
 """
 
+KPLER_FLOW_URL = "https://api.russiafossiltracker.com/v1/kpler_flow"
+
+# Dashboard columns that are returned by a differently named API aggregation
+API_AGGREGATE_BY = {
+    "origin_name": "origin",
+    "destination_name": "destination",
+}
+
+
+def get_kpler_params(origin_iso2, origin_type, destination_iso2, destination_type, commodity):
+    params = {
+        "origin_iso2": ",".join(to_list(origin_iso2)),
+        "origin_type": origin_type,
+        "destination_type": destination_type,
+        "api_key": config("API_KEY"),
+    }
+
+    if COUNTRY_GLOBAL not in to_list(destination_iso2):
+        params["destination_iso2"] = ",".join(to_list(destination_iso2))
 
-# perform expensive computations in this "global store"
-# these computations are cached in a globally available
-# redis memory store which is available across processes
-# and for all time.
-@cache.memoize()
+    if COMMODITY_ALL not in to_list(commodity):
+        params["commodity_equivalent"] = ",".join(to_list(commodity))
+
+    return params
+
+
+def query_kpler_flow(params):
+    r = requests.get(KPLER_FLOW_URL, params=params)
+    data = r.json()
+    return pd.DataFrame(data.get("data"))
+
+
+@frame_cache.memoize("raw")
 def get_kpler0(origin_iso2, origin_type, destination_iso2, destination_type, commodity):
-    # simulate expensive query
     print("=== loading kpler ===")
     columns = [
         "origin_name",
@@ -40,47 +71,53 @@ def get_kpler0(origin_iso2, origin_type, destination_iso2, destination_type, com
         "value_eur",
         "value_usd",
     ]
-    params = {
-        "origin_iso2": ",".join(to_list(origin_iso2)),
-        "origin_type": origin_type,
-        "destination_type": destination_type,
-        "api_key": config("API_KEY"),
-        "select": ",".join(columns),
-    }
+    params = get_kpler_params(
+        origin_iso2, origin_type, destination_iso2, destination_type, commodity
+    )
+    params["select"] = ",".join(columns)
 
+    df = query_kpler_flow(params)
+    print("=== done ===")
+    return df
 
-    if COUNTRY_GLOBAL not in to_list(destination_iso2):
-        params["destination_iso2"] = ",".join(to_list(destination_iso2))
 
-    if COMMODITY_ALL not in to_list(commodity):
-        params["commodity_equivalent"] = ",".join(to_list(commodity))
+@frame_cache.memoize("aggregated")
+def get_kpler_aggregated(
+    origin_iso2,
+    origin_type,
+    destination_iso2,
+    destination_type,
+    commodity,
+    colour_by,
+    facet,
+    rolling_days,
+):
+    """
+    Daily series per colour and facet. The API does the aggregation and the rolling average,
+    so that only a few thousand rows come back.
+    """
+    aggregate_by = list(dict.fromkeys([x for x in ["date", colour_by, facet] if x is not None]))
+
+    params = get_kpler_params(
+        origin_iso2, origin_type, destination_iso2, destination_type, commodity
+    )
+    params["aggregate_by"] = ",".join(
+        dict.fromkeys(API_AGGREGATE_BY.get(x, x) for x in aggregate_by)
+    )
+    if rolling_days and rolling_days > 1:
+        params["rolling_days"] = rolling_days
+
+    df = query_kpler_flow(params)
+
+    # The API also returns related columns (e.g. country and iso2 along with region)
+    value_cols = [x for x in df.columns if x.startswith("value_")]
+    df = df.groupby(aggregate_by, dropna=False)[value_cols].sum(min_count=1).reset_index()
+    df["date"] = pd.to_datetime(df["date"])
 
-    url = "https://api.russiafossiltracker.com/v1/kpler_flow"
-    r = requests.get(url, params=params)
-    data = r.json()
-    print("=== done ===")
-    return data.get("data")
-
-
-# @dash.callback(
-#     output=Output("kpler0", "data"),
-#     inputs=[
-#         State("kpler-origin-country", "value"),
-#         State("kpler-origin-type", "value"),
-#         State("kpler-destination-country", "value"),
-#         State("kpler-destination-type", "value"),
-#         State("kpler-commodity", "value"),
-#         Input("kpler-refresh", "n_clicks"),
-#     ],
-# )
-# def load_kpler0(origin_iso2, origin_type, destination_iso2, destination_type, commodity, n):
-#     if n is not None:
-#         return get_kpler0(origin_iso2, origin_type, destination_iso2, destination_type, commodity)
-#     else:
-#         raise PreventUpdate
-
-
-@cache.memoize()
+    return df
+
+
+@frame_cache.memoize("top")
 def get_kpler_full(
     origin_iso2,
     origin_type,
@@ -93,15 +130,21 @@ def get_kpler_full(
     top_n=9,
 ):
 
-    kpler0 = get_kpler0(origin_iso2, origin_type, destination_iso2, destination_type, commodity)
- 
-    df = pd.DataFrame(kpler0)
-    
+    df = get_kpler_aggregated(
+        origin_iso2,
+        origin_type,
+        destination_iso2,
+        destination_type,
+        commodity,
+        colour_by,
+        facet,
+        rolling_days,
+    )
+
     aggregate_by = list(set(["date"] + [colour_by] + [facet]))
     aggregate_by = [x for x in aggregate_by if x is not None]
 
     value_cols = [x for x in df.columns if x.startswith("value_")]
-    df = df.groupby(aggregate_by, dropna=False)[value_cols].sum().reset_index()
 
     # Replace unknown with Unknodn in colour_by column
     df[colour_by] = df[colour_by].replace("unknown", "Unknown")
@@ -110,11 +153,10 @@ def get_kpler_full(
     # Group largest colours together
     largest = df.groupby(colour_by)[value_cols].sum().nlargest(top_n, columns=value_cols[0]).index
     df.loc[~df[colour_by].isin(largest), colour_by] = "Others"
-    df = df.groupby(aggregate_by, dropna=False)[value_cols].sum().reset_index()
+    df = df.groupby(aggregate_by, dropna=False)[value_cols].sum(min_count=1).reset_index()
 
     # Remove all first rows of df until the first date with a non-zero value
     min_date = df.loc[(df[value_cols] > 0).apply(any, axis=1)]["date"].min()
     df = df[df["date"] >= min_date]
-    df = roll_average_kpler(df, rolling_days)
 
     return df
@@ -20,8 +20,7 @@ from .data import get_kpler_full, get_kpler0
 )
 def download_kpler0(n, origin_iso2, origin_type, destination_iso2, destination_type, commodity):
 
-    kpler0 = get_kpler0(origin_iso2, origin_type, destination_iso2, destination_type, commodity)
-    df = pd.DataFrame(kpler0)
+    df = get_kpler0(origin_iso2, origin_type, destination_iso2, destination_type, commodity)
     return dcc.send_data_frame(df.to_csv, "kpler_raw.csv")
 
 
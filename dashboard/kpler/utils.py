@@ -8,51 +8,6 @@ def intersect(list1, list2):
     return list(set(list1) & set(list2))
 
 
-def roll_average_kpler(kpler, rolling_days):
-    daterange = pd.date_range(min(kpler.date), max(kpler.date)).rename("date")
-    data = kpler.copy()
-    data["date"] = pd.to_datetime(data["date"])
-    data = (
-        data.groupby(
-            intersect(
-                [
-                    "origin_iso2",
-                    "origin_country",
-                    "origin_region",
-                    "origin_type",
-                    "origin_name",
-                    "destination_iso2",
-                    "destination_country",
-                    "destination_region",
-                    "destination_type",
-                    "destination_name",
-                    "product",
-                    "grade",
-                    "group",
-                    "family",
-                    "pricing_scenario",
-                    "commodity",
-                    "commodity_equivalent_name",
-                ],
-                data.columns,
-            ),
-            dropna=False,
-        )
-        .apply(
-            lambda x: x.set_index("date")
-            .resample("D")
-            .sum(numeric_only=True)
-            .reindex(daterange)
-            .fillna(0)
-            .rolling(rolling_days, min_periods=rolling_days)
-            .mean()
-        )
-        .reset_index()
-        .replace({np.nan: None})
-    )
-    return data
-
-
 def to_list(d, convert_tuple=False):
     if d is None:
         return []
@@ -8,6 +8,8 @@ import dash_bootstrap_components as dbc
 from dash import DiskcacheManager, CeleryManager, Input, Output, html
 from flask_caching import Cache
 
+from frame_cache import FrameCache
+
 launch_uid = "RFT"
 
 # Create a Dash app
@@ -34,3 +36,9 @@ CACHE_CONFIG = {
 }
 cache = Cache()
 cache.init_app(app.server, config=CACHE_CONFIG)
+
+# DataFrames are cached separately, as Arrow buffers
+frame_cache = FrameCache(
+    redis_url=CACHE_CONFIG["CACHE_REDIS_URL"],
+    timeout=CACHE_CONFIG["CACHE_DEFAULT_TIMEOUT"],
+)
@@ -1,40 +1,64 @@
 import pandas as pd
 import dash
-import diskcache
 import os
-from dash import DiskcacheManager, CeleryManager, Input, Output, html, State
+from dash import Input, Output
 from dash.exceptions import PreventUpdate
-from server import app, background_callback_manager, cache
+from server import frame_cache
+
+from . import COUNTRY_GLOBAL
+from .utils import roll_average_voyage
+
+
+@frame_cache.memoize("raw")
+def get_voyages():
+    print("=== loading voyages ===")
+    file = "voyages.csv"
+    if not os.path.exists(file):
+        storage_options = {"User-Agent": "Mozilla/5.0"}
+        url = "https://api.russiafossiltracker.com/v0/voyage?date_from=2022-01-01&format=csv&select_set=light"
+        voyages = pd.read_csv(url, storage_options=storage_options)
+        voyages.to_csv(file, index=False)
+    else:
+        voyages = pd.read_csv("voyages.csv")
+    return voyages
+
+
+@frame_cache.memoize("aggregated")
+def get_voyages_aggregated(departure_country, destination_country, status, colour_by, facet, value):
+    df = get_voyages()
+    if departure_country and COUNTRY_GLOBAL not in departure_country:
+        df = df[df["commodity_origin_country"] == departure_country]
+    if destination_country and COUNTRY_GLOBAL not in destination_country:
+        df = df[df["commodity_destination_country"].isin(destination_country)]
+
+    df = df[df.commodity_destination_country != df.commodity_origin_country]
+    df = df[df.status.isin(status)]
+    df["date"] = pd.to_datetime(df["departure_date_utc"]).dt.date
+    aggregate_by = list(set(["date"] + [colour_by] + [facet]))
+    aggregate_by = [x for x in aggregate_by if x is not None]
+
+    return df.groupby(aggregate_by)[value].sum().reset_index()
+
+
+@frame_cache.memoize("rolled")
+def get_voyages_rolled(
+    departure_country, destination_country, status, colour_by, facet, value, rolling_days
+):
+    df = get_voyages_aggregated(
+        departure_country, destination_country, status, colour_by, facet, value
+    )
+    return roll_average_voyage(df, rolling_days, value)
 
 
 @dash.callback(
     output=Output("voyages", "data"),
     inputs=[Input("interval-component", "n_intervals")],
-    # background=True,
-    # manager=background_callback_manager,
 )
 def load_voyages(n):
     if n == 1:
-        # TODO Lohit: this is using a local cache
-        # Wanting to use a redis cache
-        # Like shown here:https://dash.plotly.com/background-callback-caching
-        # Should probably use Google Cloud Memorystrore
-        # cached_data = cache.get("voyages")
-        # if cached_data is not None:
-        #     return cached_data
-
-        print("=== loading voyages ===")
-        file = "voyages.csv"
-        if not os.path.exists(file):
-            storage_options = {"User-Agent": "Mozilla/5.0"}
-            url = "https://api.russiafossiltracker.com/v0/voyage?date_from=2022-01-01&format=csv&select_set=light"
-            voyages = pd.read_csv(url, storage_options=storage_options)
-            voyages.to_csv(file, index=False)
-        else:
-            voyages = pd.read_csv("voyages.csv")
-
-        data = voyages.to_json(date_format="iso", orient="split")
-        cache.set("voyages", data)
-        return data
+        get_voyages()
+        # The frame stays in the server-side cache: the browser only gets its key,
+        # and charts get the aggregated series they need
+        return get_voyages.cache_key()
     else:
         raise PreventUpdate
@@ -2,13 +2,13 @@ import pandas as pd
 import plotly.express as px
 from dash import DiskcacheManager, CeleryManager, Input, Output, html, State
 from dash.exceptions import PreventUpdate
-from server import app, cache
+from server import app
 from utils import palette
 
 from . import COUNTRY_GLOBAL
 from . import FACET_NONE
 from . import units
-from .utils import roll_average_voyage
+from .data import get_voyages, get_voyages_rolled
 
 
 @app.callback(
@@ -19,7 +19,7 @@ from .utils import roll_average_voyage
 def update_departure_country(voyages, value):
     if not voyages:
         raise PreventUpdate
-    voyages = pd.read_json(voyages, orient="split")
+    voyages = get_voyages()
     options = [COUNTRY_GLOBAL] + list(voyages["departure_country"].unique())
     return [{"label": o, "value": o} for o in options if o is not None]
 
@@ -32,7 +32,7 @@ def update_departure_country(voyages, value):
 def update_destination_country(voyages, value):
     if not voyages:
         raise PreventUpdate
-    voyages = pd.read_json(voyages, orient="split")
+    voyages = get_voyages()
     options = [COUNTRY_GLOBAL] + list(voyages["destination_country"].unique())
 
     return [{"label": o, "value": o} for o in options if o is not None]
@@ -66,28 +66,17 @@ def update_voyages(
         facet = None
     if json_data is None:
         raise PreventUpdate
-    df = pd.read_json(json_data, orient="split")
-    if departure_country and COUNTRY_GLOBAL not in departure_country:
-        df = df[df["commodity_origin_country"] == departure_country]
-    if destination_country and COUNTRY_GLOBAL not in destination_country:
-        df = df[df["commodity_destination_country"].isin(destination_country)]
-
-    df = df[df.commodity_destination_country != df.commodity_origin_country]
-    df = df[df.status.isin(status)]
-    df["date"] = pd.to_datetime(df["departure_date_utc"]).dt.date
-    aggregate_by = list(set(["date"] + [colour_by] + [facet]))
-    aggregate_by = [x for x in aggregate_by if x is not None]
     unit = units[unit_id]
     value = unit["column"]
     unit_str = unit["label"]
     unit_format = unit["format"]
     unit_scale = unit["scale"]
-    df[value] = df[value] * unit_scale
 
     hovertemplate = f"%{{customdata[0]}}: %{{y:{unit_format}}} {unit_str}<extra></extra>"
-    df = df.groupby(aggregate_by)[value].sum().reset_index()
-
-    df = roll_average_voyage(df, rolling_days, value)
+    df = get_voyages_rolled(
+        departure_country, destination_country, status, colour_by, facet, value, rolling_days
+    )
+    df[value] = df[value].astype(float) * unit_scale
 
     # Remove all first rows of df until the first date with a non-zero value
     min_date = df.loc[df[value] > 0]["date"].min()
@@ -3,7 +3,7 @@ from enum import Enum
 import math
 import random
 import time
-from typing import Optional
+from typing import Callable, Optional
 from tqdm import tqdm
 from base.env import get_env
 from base.logger import logger, logger_slack
@@ -14,18 +14,26 @@ from tqdm.contrib.logging import logging_redirect_tqdm
 import logging
 
 
-from engines.company_scraper import OnDemandEquasisSessionManager, EquasisSessionPoolExhausted
+from engines.company_scraper import (
+    OnDemandEquasisSessionManager,
+    EquasisConcurrentSessionPool,
+    EquasisSessionPoolExhausted,
+)
 
 from engines.company_scraper.accounts import EquasisAccountCreatorError
 from engines.ship_details_datasource import (
     select_ships_to_update_inspections,
     select_ships_to_update_core_details,
-    update_ship_core_details,
+    ShipCoreDetailsBatchWriter,
     update_ships_inspections,
     clean_ship_details,
 )
 
 DEFAULT_UPDATE_LIMIT: int = int(get_env("EQUASIS_UPDATE_LIMIT", 1000))
+# Number of Equasis sessions to fetch with concurrently, one worker each. 0 means sequential.
+DEFAULT_CONCURRENT_SESSIONS: int = int(get_env("EQUASIS_CONCURRENT_SESSIONS", 0))
+# Number of ships whose details are written to the database in a single commit.
+DEFAULT_WRITE_BATCH_SIZE: int = int(get_env("EQUASIS_WRITE_BATCH_SIZE", 50))
 
 global_equasis_client: EquasisClient | None = None
 
@@ -67,12 +75,15 @@ def update(
     steps: list[EquasisUpdateSteps] = [step for step in EquasisUpdateSteps],
     filter_departing_iso2s: Optional[list[str]] = None,
     filter_minimum_departure_date: Optional[date] = None,
+    concurrent_sessions: int = DEFAULT_CONCURRENT_SESSIONS,
 ) -> EquasisUpdateStatus:
     """
     This function updates the company information in the database from Equasis and insurers.
     @param force_unknown: whether to force update of unknown insurers
     @param max_updates: maximum number of ships to update, defaults to environment variable
     `EQUASIS_UPDATE_LIMIT`. negative value means no limit
+    @param concurrent_sessions: number of Equasis sessions to fetch with in parallel, defaults to
+    environment variable `EQUASIS_CONCURRENT_SESSIONS`. 0 means one ship at a time
     """
     logger_slack.info("=== Company update ===")
     # For crude oil and oil products, force a daily refresh
@@ -85,6 +96,7 @@ def update(
                 max_updates=math.floor(max_updates / 2),
                 filter_departing_iso2s=filter_departing_iso2s,
                 filter_minimum_departure_date=filter_minimum_departure_date,
+                concurrent_sessions=concurrent_sessions,
             )
 
             if result.status == EquasisStepCompletionStatus.EQUASIS_EXHAUSTED_FAILURE:
@@ -98,6 +110,7 @@ def update(
                 max_updates=math.floor(max_updates / 2),
                 filter_departing_iso2s=filter_departing_iso2s,
                 filter_minimum_departure_date=filter_minimum_departure_date,
+                concurrent_sessions=concurrent_sessions,
             )
 
             if result.status == EquasisStepCompletionStatus.EQUASIS_EXHAUSTED_FAILURE:
@@ -145,6 +158,7 @@ def update_ships_inspections_from_equasis(
     max_updates: Optional[int] = DEFAULT_UPDATE_LIMIT / 2,
     filter_departing_iso2s: Optional[list[str]] = None,
     filter_minimum_departure_date: Optional[date] = None,
+    concurrent_sessions: int = DEFAULT_CONCURRENT_SESSIONS,
 ) -> EquasisStepSyncResults:
     ships_to_update = select_ships_to_update_inspections(
         max_updates=max_updates,
@@ -152,6 +166,22 @@ def update_ships_inspections_from_equasis(
         filter_minimum_departure_date=filter_minimum_departure_date,
     )
 
+    if concurrent_sessions > 0:
+
+        def write_inspections(imo, inspection_info):
+            if inspection_info is None:
+                return False
+            update_ships_inspections(imo, inspection_info)
+            return True
+
+        return update_concurrently_from_equasis(
+            ships_to_update.imo.tolist(),
+            fetch=lambda equasis, imo: equasis.get_inspections(imo=imo),
+            write=write_inspections,
+            concurrent_sessions=concurrent_sessions,
+            max_updates=max_updates,
+        )
+
     equasis = get_global_equasis_client()
 
     n_checked = 0
@@ -193,6 +223,7 @@ def update_info_from_equasis(
     max_updates: int,
     filter_departing_iso2s: Optional[list[str]] = None,
     filter_minimum_departure_date: Optional[date] = None,
+    concurrent_sessions: int = DEFAULT_CONCURRENT_SESSIONS,
 ) -> EquasisStepSyncResults:
     """
     Collect infos from equasis about shipments that either don't have infos,
@@ -213,6 +244,26 @@ def update_info_from_equasis(
 
     imos_to_update = top_ships.imo.unique().tolist()
 
+    writer = ShipCoreDetailsBatchWriter(batch_size=DEFAULT_WRITE_BATCH_SIZE)
+
+    if concurrent_sessions > 0:
+
+        def write_ship_infos(imo, equasis_infos):
+            logger.info(f"Details from equasis to update in database for {imo}: {equasis_infos}")
+            writer.add(imo, equasis_infos)
+            return True
+
+        try:
+            return update_concurrently_from_equasis(
+                imos_to_update,
+                fetch=lambda equasis, imo: equasis.get_ship_infos(imo=imo.replace("NOTFOUND_", "")),
+                write=write_ship_infos,
+                concurrent_sessions=concurrent_sessions,
+                max_updates=max_updates,
+            )
+        finally:
+            writer.flush()
+
     equasis = get_global_equasis_client()
 
     logger.info(f"Updating {len(imos_to_update)} ships from Equasis")
@@ -232,7 +283,7 @@ def update_info_from_equasis(
                     f"Details from equasis to update in database for {imo_equasis}: {equasis_infos}"
                 )
 
-                update_ship_core_details(imo, equasis_infos)
+                writer.add(imo, equasis_infos)
                 n_updated += 1
 
     except EquasisSessionPoolExhausted:
@@ -242,6 +293,10 @@ def update_info_from_equasis(
             max_updates=max_updates,
             status=EquasisStepCompletionStatus.EQUASIS_EXHAUSTED_FAILURE,
         )
+    finally:
+        # Keep whatever was fetched, even if the sync stopped early
+        writer.flush()
+
     return EquasisStepSyncResults(
         n_checked=n_checked,
         n_updated=n_updated,
@@ -250,5 +305,51 @@ def update_info_from_equasis(
     )
 
 
+def update_concurrently_from_equasis(
+    imos: list[str],
+    *,
+    fetch: Callable[[EquasisClient, str], object],
+    write: Callable[[str, object], bool],
+    concurrent_sessions: int,
+    max_updates: int,
+) -> EquasisStepSyncResults:
+    """
+    Fetch from Equasis with one worker per session, each paced with `random_wait`, while
+    writing every result to the database from this thread.
+    @param fetch: gets the Equasis data for an IMO using the worker's client
+    @param write: writes the fetched data for an IMO, returns whether it was updated
+    """
+    pool = EquasisConcurrentSessionPool.with_account_generator(
+        n_accounts=concurrent_sessions, wait=random_wait
+    )
+
+    logger.info(f"Updating {len(imos)} ships from Equasis with {len(pool.sessions)} sessions")
+
+    with logging_redirect_tqdm(loggers=[logging.root]), warnings.catch_warnings():
+        progress = tqdm(total=len(imos), unit="ships")
+
+        def write_and_track(imo, result):
+            progress.update(1)
+            return write(imo, result)
+
+        result = pool.run(
+            imos,
+            fetch=lambda session, imo: fetch(EquasisClient(session_manager=session), imo),
+            write=write_and_track,
+        )
+        progress.close()
+
+    return EquasisStepSyncResults(
+        n_checked=result.n_checked,
+        n_updated=result.n_updated,
+        max_updates=max_updates,
+        status=(
+            EquasisStepCompletionStatus.EQUASIS_EXHAUSTED_FAILURE
+            if result.exhausted
+            else EquasisStepCompletionStatus.SUCCESS
+        ),
+    )
+
+
 def random_wait():
     time.sleep(random.uniform(0.25, 0.5))
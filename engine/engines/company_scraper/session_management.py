@@ -1,3 +1,5 @@
+import queue
+import threading
 from abc import ABC, abstractmethod
 from typing import Callable, Union
 
@@ -116,3 +118,136 @@ class EquasisFixedInitialisationSessionPool(EquasisSessionManager):
         if self.current_session_idx >= len(self.sessions):
             self.current_session_idx = 0
         return self.sessions[self.current_session_idx]
+
+
+class EquasisConcurrentSessionPool:
+    """
+    Runs one worker thread per Equasis session, each with its own pacing, and hands every
+    result back to the calling thread so that database writes stay on a single session.
+
+    A session that becomes unavailable stops its worker and gives its current item back to
+    the queue. If all workers stop while items remain, the pool is exhausted: whatever was
+    written so far is kept and the run reports the exhaustion.
+    """
+
+    @staticmethod
+    def with_account_generator(
+        n_accounts=N_ACCOUNTS_TO_GENERATE,
+        generator: Callable[
+            [int], list[EquasisAccount]
+        ] = default_multiple_accounts_from_env_generator,
+        **kwargs,
+    ):
+        accounts = generator(n_accounts)
+        sessions = [EquasisSession(x.username, x.password) for x in accounts]
+        return EquasisConcurrentSessionPool(sessions, **kwargs)
+
+    def __init__(self, sessions, *, wait: Callable[[], None] = lambda: None):
+        self.sessions: list[EquasisSession] = sessions
+        self.wait = wait
+
+    def run(
+        self,
+        items: list,
+        fetch: Callable[[EquasisSession, object], object],
+        write: Callable[[object, object], bool],
+        result_timeout: float = 0.5,
+    ) -> "EquasisConcurrentRunResult":
+        """
+        Fetches every item with `fetch(session, item)` across the pool and calls
+        `write(item, result)` from the calling thread for each fetched item. `write` returns
+        whether the item was updated.
+
+        Returns the number of items checked and updated, and whether the pool was exhausted
+        before the queue was drained. Any other error raised by a worker stops the run and is
+        re-raised once the workers have finished.
+        """
+        work = queue.Queue()
+        for item in items:
+            work.put(item)
+
+        results = queue.Queue()
+        stop = threading.Event()
+
+        workers = [
+            threading.Thread(
+                target=self._work,
+                args=(session, fetch, work, results, stop),
+                name=f"equasis-{session.username}",
+                daemon=True,
+            )
+            for session in self.sessions
+        ]
+        for worker in workers:
+            worker.start()
+
+        n_checked = 0
+        n_updated = 0
+        error = None
+        try:
+            while True:
+                try:
+                    item, result, worker_error = results.get(timeout=result_timeout)
+                except queue.Empty:
+                    if not any(worker.is_alive() for worker in workers) and results.empty():
+                        break
+                    continue
+
+                if worker_error is not None:
+                    error = error or worker_error
+                    stop.set()
+                    continue
+
+                n_checked += 1
+                if write(item, result):
+                    n_updated += 1
+        finally:
+            # Also stops the workers when writing fails
+            stop.set()
+
+        if error is not None:
+            raise error
+
+        return EquasisConcurrentRunResult(
+            n_checked=n_checked,
+            n_updated=n_updated,
+            exhausted=not work.empty(),
+        )
+
+    def _work(self, session, fetch, work, results, stop, idle_timeout=0.1):
+        while not stop.is_set():
+            try:
+                item = work.get(timeout=idle_timeout)
+            except queue.Empty:
+                # Another worker may still hand its item back, so only stop once nothing is
+                # in flight.
+                if work.unfinished_tasks == 0:
+                    return
+                continue
+
+            try:
+                result = fetch(session, item)
+            except EquasisSessionUnavailable:
+                logger.info(
+                    f"Equasis session {session.username} unavailable, stopping its worker.",
+                    exc_info=True,
+                )
+                work.put(item)
+                work.task_done()
+                return
+            except Exception as e:
+                logger.info("Equasis session had an error.", exc_info=True, stack_info=True)
+                results.put((item, None, e))
+                work.task_done()
+                return
+
+            results.put((item, result, None))
+            work.task_done()
+            self.wait()
+
+
+class EquasisConcurrentRunResult:
+    def __init__(self, *, n_checked: int, n_updated: int, exhausted: bool):
+        self.n_checked = n_checked
+        self.n_updated = n_updated
+        self.exhausted = exhausted
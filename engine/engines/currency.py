@@ -1,4 +1,4 @@
-from itertools import product
+import numpy as np
 import pandas as pd
 import datetime as dt
 import geopandas as gpd
@@ -40,7 +40,7 @@ def update(date_from=dt.date(2022, 1, 1), date_to=None, force=False):
 
         exchanges = get_exchange_rates(converter, currencies, dates)
 
-        upsert(exchanges, DB_TABLE_CURRENCY, "unique_currency")
+        upsert(exchanges, DB_TABLE_CURRENCY, "unique_currency", bulk=True)
         session.commit()
 
     except Exception as e:
@@ -52,18 +52,54 @@ def update(date_from=dt.date(2022, 1, 1), date_to=None, force=False):
 
 
 def get_exchange_rates(converter, currencies, dates):
-    exchanges = pd.DataFrame(list(product(dates, currencies)), columns=["date", "currency"])
+    """
+    Build the dates x currencies table of rates per EUR.
 
-    exchanges["per_eur"] = exchanges.progress_apply(
-        lambda row: converter.convert(
-            amount=1, currency="EUR", new_currency=row.currency, date=row.date
-        ),
-        axis=1,
+    Each currency's rate series is read from the converter once and aligned onto the dates,
+    rather than calling `converter.convert` for every row. Missing rates were already filled
+    by the converter when loading; dates outside a currency's bounds use its first or last
+    rate, as `fallback_on_wrong_date` does.
+    """
+    dates = pd.DatetimeIndex(dates)
+    days = dates.values.astype("datetime64[D]")
+
+    exchanges = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "date": dates,
+                    "currency": currency,
+                    "per_eur": get_rates_per_eur(converter, currency, days),
+                }
+            )
+            for currency in currencies
+        ],
+        ignore_index=True,
     )
+
+    # Same order as the dates x currencies product
+    exchanges = exchanges.sort_values("date", kind="stable", ignore_index=True)
     exchanges["estimated"] = False
     return exchanges
 
 
+def get_rates_per_eur(converter, currency, days):
+    """
+    Rates of `currency` per EUR for each of `days` (datetime64[D] array).
+    """
+    if currency == converter.ref_currency:
+        return np.ones(len(days))
+
+    rates = converter._rates[currency]
+    first_date, last_date = converter.bounds[currency]
+
+    rate_days = np.array(sorted(rates), dtype="datetime64[D]")
+    rate_values = np.array([rates[day] for day in sorted(rates)], dtype=float)
+
+    days = np.clip(days, np.datetime64(first_date, "D"), np.datetime64(last_date, "D"))
+    return rate_values[np.searchsorted(rate_days, days)]
+
+
 def get_currency_names(converter, date_to):
     currencies = [
         currency
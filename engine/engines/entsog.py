@@ -43,9 +43,8 @@ from base.db import engine
 from base.db import session
 from base.logger import logger, logger_slack
 from base.utils import to_list, to_datetime
-from base.db_utils import upsert
+from base.db_utils import upsert, execute_statement
 from base.models import DB_TABLE_ENTSOGFLOW, DB_TABLE_ENTSOGFLOW_RAW, EntsogFlow, EntsogFlowRaw
-from base.db_utils import upsert
 
 
 s = requests.Session()
@@ -57,6 +56,9 @@ s.mount("https://", HTTPAdapter(max_retries=retries))
 ENTSOG_FLOW_DEFAULT_SAVE_OUTPUT = "outputs/entsog_flows.csv"
 ENTSOG_FLOW_INTERMEDIATE_DEFAULT_SAVE_OUTPUT = "outputs/entsog_flows_intermediary.csv"
 
+# Values of a raw flow whose changes need it to be processed again
+ENTSOG_RAW_VALUE_COLUMNS = ["periodFrom", "periodTo", "flowStatus", "value_kwh", "gcv_kwh_m3"]
+
 
 class EntsogApi:
     def split(x, f):
@@ -339,8 +341,27 @@ class EntsogDb:
         )
         return flows_raw
 
+    @staticmethod
+    def add_checksum_columns():
+        """
+        One-off migration of databases created before the checksum columns, see
+        run/subset/add_entsog_checksum_columns.py. Not part of updates, as altering the table
+        locks it.
+        """
+        execute_statement(
+            sa.text(
+                f"ALTER TABLE {DB_TABLE_ENTSOGFLOW_RAW} "
+                "ADD COLUMN IF NOT EXISTS checksum varchar, "
+                "ADD COLUMN IF NOT EXISTS processed_checksum varchar"
+            )
+        )
+
     @staticmethod
     def upload_flows_raw(flows):
+        """
+        Upload raw flows, skipping those unchanged since their last download.
+        :return: number of new or changed raw flows
+        """
         to_upload = flows[
             [
                 "id",
@@ -356,16 +377,84 @@ class EntsogDb:
             ]
         ]
 
-        to_upload = to_upload[~pd.isna(to_upload.value_kwh)]
+        to_upload = to_upload[~pd.isna(to_upload.value_kwh)].drop_duplicates(
+            subset=["id"], keep="last"
+        )
+        if to_upload.empty:
+            return 0
+
+        to_upload = to_upload.assign(checksum=get_checksums(to_upload[ENTSOG_RAW_VALUE_COLUMNS]))
+
+        existing = pd.read_sql(
+            session.query(EntsogFlowRaw.id, EntsogFlowRaw.checksum)
+            .filter(
+                EntsogFlowRaw.date >= to_upload.date.min(),
+                EntsogFlowRaw.date <= to_upload.date.max(),
+            )
+            .statement,
+            session.bind,
+        )
+        to_upload = to_upload.merge(
+            existing, on="id", how="left", suffixes=("", "_existing"), indicator=True
+        )
+        is_new = to_upload._merge == "left_only"
+        is_changed = ~is_new & (to_upload.checksum != to_upload.checksum_existing)
+        to_upload = to_upload.drop(columns=["checksum_existing", "_merge"])
+
+        logger.info(
+            f"Uploading {is_new.sum()} new and {is_changed.sum()} changed raw ENTSOG flows"
+            f" ({(~is_new & ~is_changed).sum()} unchanged)"
+        )
+
         try:
-            to_upload.to_sql(DB_TABLE_ENTSOGFLOW_RAW, con=engine, if_exists="append", index=False)
+            to_upload[is_new].to_sql(
+                DB_TABLE_ENTSOGFLOW_RAW, con=engine, if_exists="append", index=False
+            )
         except sa.exc.IntegrityError:
             logger.info("Failed at inserting. Trying upserting instead (much slower).")
-            upsert(
-                df=to_upload,
-                table=DB_TABLE_ENTSOGFLOW_RAW,
-                constraint_name=DB_TABLE_ENTSOGFLOW_RAW + "_pkey",
+            is_changed = is_changed | is_new
+
+        upsert(
+            df=to_upload[is_changed],
+            table=DB_TABLE_ENTSOGFLOW_RAW,
+            constraint_name=DB_TABLE_ENTSOGFLOW_RAW + "_pkey",
+            bulk=True,
+        )
+        return int((is_new | is_changed).sum())
+
+    @staticmethod
+    def get_unprocessed_flows_raw(points, date_from, date_to):
+        """
+        Raw flows of `points` that changed since they were last processed.
+        """
+        query = session.query(
+            EntsogFlowRaw.id,
+            EntsogFlowRaw.pointKey,
+            EntsogFlowRaw.operatorKey,
+            EntsogFlowRaw.directionKey,
+            EntsogFlowRaw.date,
+        ).filter(
+            EntsogFlowRaw.pointKey.in_(points.pointKey.to_list()),
+            EntsogFlowRaw.date >= date_from,
+            EntsogFlowRaw.date <= date_to,
+            EntsogFlowRaw.checksum.is_distinct_from(EntsogFlowRaw.processed_checksum),
+        )
+        flows_raw = pd.read_sql(query.statement, session.bind)
+        return flows_raw.merge(
+            points[["pointKey", "operatorKey", "directionKey", "country", "partner"]],
+            how="inner",
+        )
+
+    @staticmethod
+    def mark_processed(ids, chunksize=10000):
+        for i in range(0, len(ids), chunksize):
+            session.query(EntsogFlowRaw).filter(
+                EntsogFlowRaw.id.in_(ids[i : i + chunksize])
+            ).update(
+                {EntsogFlowRaw.processed_checksum: EntsogFlowRaw.checksum},
+                synchronize_session=False,
             )
+        session.commit()
 
     @staticmethod
     def upload_flows(flows, delete_before_upload=False):
@@ -517,6 +606,20 @@ def fix_opd_countries(opd):
     return opd
 
 
+def get_checksums(df):
+    return pd.util.hash_pandas_object(df, index=False).map("{:016x}".format)
+
+
+def get_pairs(df):
+    """
+    Unordered country pair of each row, e.g. "DE-PL" for both DE->PL and PL->DE.
+    Processed flows of a pair and date only depend on raw flows of the same pair and date.
+    """
+    country = df.country.fillna("")
+    partner = df.partner.fillna("")
+    return np.where(country < partner, country + "-" + partner, partner + "-" + country)
+
+
 def get_points(
     country_iso2=None,
     remove_operators=[],
@@ -686,6 +789,38 @@ def process_flows_raw(
         suffixes=["_import", "_export"],
     )
 
+    # Keys identifying a flow at a point, on both sides
+    point_keys = [
+        "pointKey",
+        "date",
+        "type",
+        "operatorKey_import",
+        "operatorKey_export",
+        "operatorLabel_import",
+        "operatorLabel_export",
+        "pointLabel_import",
+        "pointLabel_export",
+        "country_import",
+        "country_export",
+        "partner_import",
+        "partner_export",
+    ]
+    status_keys = point_keys[:9] + ["flowStatus_import", "flowStatus_export"] + point_keys[9:]
+    value_columns = [
+        "value_kwh_import",
+        "value_kwh_export",
+        "gcv_kwh_m3_import",
+        "gcv_kwh_m3_export",
+    ]
+
+    def add_group_codes(df):
+        # Factorise group keys once into integers, rather than hashing all of them in each step.
+        # Codes of status groups follow the sorted order of their keys.
+        df = df.reset_index(drop=True)
+        df["point_group"] = df.groupby(point_keys, dropna=False, sort=False).ngroup()
+        df["status_group"] = df.groupby(status_keys, dropna=False, sort=True).ngroup()
+        return df
+
     def keep_max_duration(df):
         # Take those with max duration only
         df["duration_import"] = df["periodTo_import"] - df["periodFrom_import"]
@@ -693,26 +828,7 @@ def process_flows_raw(
 
         df = (
             df.sort_values(by=["duration_import", "duration_export"], ascending=False)
-            .groupby(
-                [
-                    "pointKey",
-                    "date",
-                    "type",
-                    "operatorKey_import",
-                    "operatorKey_export",
-                    "operatorLabel_import",
-                    "operatorLabel_export",
-                    "pointLabel_import",
-                    "pointLabel_export",
-                    "flowStatus_import",
-                    "flowStatus_export",
-                    "country_import",
-                    "country_export",
-                    "partner_import",
-                    "partner_export",
-                ],
-                dropna=False,
-            )
+            .groupby("status_group")
             .head(1)
             .reset_index(drop=True)
         )
@@ -722,65 +838,28 @@ def process_flows_raw(
         # Confirmed < Provisional
         df = (
             df.sort_values(by=["flowStatus_import", "flowStatus_export"], ascending=True)
-            .groupby(
-                [
-                    "pointKey",
-                    "date",
-                    "type",
-                    "operatorKey_import",
-                    "operatorKey_export",
-                    "operatorLabel_import",
-                    "operatorLabel_export",
-                    "pointLabel_import",
-                    "pointLabel_export",
-                    "country_import",
-                    "country_export",
-                    "partner_import",
-                    "partner_export",
-                ],
-                dropna=False,
-            )
+            .groupby("point_group")
             .head(1)
             .reset_index(drop=True)
         )
         return df
 
     def average_both_sides(df):
-        def nanmean(x):
-            # If all is nan return nan without warning
-            if np.all(x != x):
-                return np.NaN
-            if np.all(x == 0):
-                return 0
-            if (np.std(x) / np.nanmean(x)) > 0.1:
-                logger.warning("Flows are dissimilar before averaging")
-            return np.nanmean(x)
-
-        # Average on both sides: export and import
-        df = (
-            df.groupby(
-                [
-                    "pointKey",
-                    "date",
-                    "type",
-                    "operatorKey_import",
-                    "operatorKey_export",
-                    "operatorLabel_import",
-                    "operatorLabel_export",
-                    "pointLabel_import",
-                    "pointLabel_export",
-                    "flowStatus_import",
-                    "flowStatus_export",
-                    "country_import",
-                    "country_export",
-                    "partner_import",
-                    "partner_export",
-                ],
-                dropna=False,
-            )[["value_kwh_import", "value_kwh_export", "gcv_kwh_m3_import", "gcv_kwh_m3_export"]]
-            .agg(nanmean)
-            .reset_index()
-        )
+        # Average on both sides: export and import, ignoring NaNs
+        grouped = df.groupby("status_group")[value_columns]
+        count = grouped.count()
+        mean = grouped.sum() / count.where(count > 0)
+
+        # Flows are dissimilar if their std is over 10% of their mean, when none is missing
+        std = grouped.std(ddof=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dissimilar = count.eq(grouped.size(), axis=0) & (std / mean > 0.1)
+        n_dissimilar = int(dissimilar.values.sum())
+        if n_dissimilar > 0:
+            logger.warning(f"Flows are dissimilar before averaging ({n_dissimilar} values)")
+
+        keys = df.drop_duplicates(subset="status_group").set_index("status_group")[status_keys]
+        df = pd.concat([keys.loc[mean.index], mean], axis=1).reset_index(drop=True)
         return df
 
     def coalesce_and_aggregate(df):
@@ -837,6 +916,7 @@ def process_flows_raw(
 
     def process(df):
         df = remove_outliers(df)
+        df = add_group_codes(df)
         df = keep_max_duration(df)
         df = keep_confirmed_over_provisional(df)
         df = average_both_sides(df)
@@ -886,6 +966,9 @@ def process_flows_raw(
 
 
 def update_db(date_from="2022-01-01", date_to=dt.date.today(), force=False):
+    """
+    :return: number of new or changed raw flows
+    """
     # Last date
     if not force:
         date_from = session.query(sa.func.max(EntsogFlowRaw.updated_on)).first()[0] or date_from
@@ -904,7 +987,9 @@ def update_db(date_from="2022-01-01", date_to=dt.date.today(), force=False):
             points=points, date_from=date_from, date_to=date_to
         )
         # Save to DB
-        EntsogDb.upload_flows_raw(flows_raw)
+        return EntsogDb.upload_flows_raw(flows_raw)
+
+    return 0
 
 
 def get_flows(
@@ -944,6 +1029,66 @@ def get_flows(
     return flows
 
 
+def get_flows_incremental(
+    date_from="2022-01-01",
+    date_to=dt.date.today(),
+    country_iso2=None,
+    use_csv_selection=True,
+    remove_pipe_in_pipe=False,
+    force=False,
+    save_intermediary_to_file=False,
+    intermediary_filename=None,
+    save_to_file=False,
+    filename=None,
+):
+    """
+    Same as get_flows, but only processes the (country pair, date) cells with raw flows that
+    changed since they were last processed.
+
+    :return: processed flows of these cells, and ids of the raw flows to mark as processed
+    once they are uploaded
+    """
+    # ENTSOG API -> ENTSOG DB
+    update_db(date_from=date_from, date_to=date_to, force=force)
+
+    points = get_points(
+        country_iso2=country_iso2,
+        remove_pipe_in_pipe=remove_pipe_in_pipe,
+        use_csv_selection=use_csv_selection,
+    )
+    points["pair"] = get_pairs(points)
+
+    unprocessed = EntsogDb.get_unprocessed_flows_raw(
+        points=points, date_from=date_from, date_to=date_to
+    )
+    unprocessed["pair"] = get_pairs(unprocessed)
+    cells = unprocessed[["pair", "date"]].drop_duplicates()
+    logger.info(
+        f"{len(unprocessed)} raw ENTSOG flows changed, touching {len(cells)} (pair, date) cells"
+    )
+    if cells.empty:
+        return None, []
+
+    # All the raw flows of the touched cells, changed or not
+    flows_raw = EntsogDb.get_physical_flows(
+        points=points[points.pair.isin(cells.pair)],
+        date_from=cells.date.min(),
+        date_to=cells.date.max(),
+    )
+    flows_raw["pair"] = get_pairs(flows_raw)
+    flows_raw = flows_raw.merge(cells, on=["pair", "date"]).drop(columns=["pair"])
+
+    flows = process_flows_raw(
+        flows_raw=flows_raw,
+        save_intermediary_to_file=save_intermediary_to_file,
+        intermediary_filename=intermediary_filename,
+        save_to_file=save_to_file,
+        filename=filename,
+    )
+
+    return flows, unprocessed.id.to_list()
+
+
 def update(
     date_from=-7,
     date_to=dt.date.today(),
@@ -956,6 +1101,7 @@ def update(
     force=False,
     delete_before_upload=False,
     remove_pipe_in_pipe=True,
+    incremental=True,
 ):
     """
 
@@ -964,6 +1110,9 @@ def update(
     :param filename:
     :param save_to_file:
     :param nodata_error_date_from: if no data after this date, raise an error. Can be an integer
+    :param incremental: only process and upload flows of the (country pair, date) cells with raw
+    flows that changed since they were last processed. Not used with force or
+    delete_before_upload, which process the whole period.
     :return:
     """
 
@@ -975,14 +1124,18 @@ def update(
         )
         date_from = to_datetime(last_date) + dt.timedelta(days=date_from)
 
+    incremental = incremental and not force and not delete_before_upload
+
     flows = None
+    processed_ids = None
+    up_to_date = False
     itry = 0
     ntries = 3
 
-    while flows is None and itry <= ntries:
+    while flows is None and not up_to_date and itry <= ntries:
         itry += 1
         try:
-            flows = get_flows(
+            get_flows_args = dict(
                 date_from=date_from,
                 date_to=date_to,
                 country_iso2=country_iso2,
@@ -993,24 +1146,36 @@ def update(
                 save_to_file=save_to_file,
                 filename=filename,
             )
+            if incremental:
+                flows, processed_ids = get_flows_incremental(**get_flows_args)
+                up_to_date = not processed_ids
+            else:
+                flows = get_flows(**get_flows_args)
         except TypeError:
             logger.warning("ENTSOG failed. Trying again")
             continue
 
-    if flows is None:
+    if up_to_date:
+        logger_slack.info("No new or changed ENTSOG flows")
+    elif flows is None:
         logger_slack.error("Failed to get ENTSOG data")
         raise ValueError("Failed to get ENTSOG data.")
-
-    EntsogDb.upload_flows(flows, delete_before_upload=delete_before_upload)
+    else:
+        EntsogDb.upload_flows(flows, delete_before_upload=delete_before_upload)
+        if processed_ids:
+            EntsogDb.mark_processed(processed_ids)
 
     # Raise alert if no recent data was found
+    last_date = (
+        session.query(sa.func.max(EntsogFlow.date)).filter(EntsogFlow.value_m3 > 0).first()[0]
+    )
     if (
         nodata_error_date_from is not None
-        and flows.date.max() < to_datetime(nodata_error_date_from).date()
+        and to_datetime(last_date).date() < to_datetime(nodata_error_date_from).date()
     ):
         logger_slack.error(
             "No ENTSOG flow found after %s (most recent is %s)"
-            % (to_datetime(nodata_error_date_from).date(), flows.date.max())
+            % (to_datetime(nodata_error_date_from).date(), to_datetime(last_date).date())
         )
 
     return flows
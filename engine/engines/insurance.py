@@ -9,9 +9,13 @@ from sqlalchemy import nullslast
 import pandas as pd
 
 import datetime as dt
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from base.db import session
-from base.logger import logger_slack
+from base.env import get_env
+from base.logger import logger, logger_slack
 from engines.insurance_scraper import *
 from base.models import ShipInsurer
 
@@ -32,39 +36,127 @@ known_insurers = {
     # 109: SverigesAngfartysInsuranceScraper(),
 }
 
+# Pause between two requests to the same insurer's site
+INSURER_REQUEST_INTERVAL_SECONDS = float(get_env("INSURER_REQUEST_INTERVAL_SECONDS", 1))
+WRITE_BATCH_SIZE = 100
 
-def update():
+
+def update(write_batch_size=WRITE_BATCH_SIZE):
+    """
+    Update the insurer start dates of the latest insurance of ships with a known insurer.
+
+    Each insurer has its own queue of ships, scraped in its own thread with its own pause
+    between requests, so that the insurers' sites are queried in parallel while each one is
+    queried politely. Dates are written from this thread, `write_batch_size` at a time.
+
+    A ship failing to scrape is skipped, but an insurer failing for all its ships (most likely
+    a broken scraper) is reported to slack and makes the update fail once dates are written.
+    """
     logger_slack.info("=== Update insurance dates ===")
     all_insurance_to_update = get_all_insurance_to_update()
 
-    with logging_redirect_tqdm(loggers=[logging.root]), warnings.catch_warnings():
-        for insurance_to_update in tqdm(
-            all_insurance_to_update.itertuples(),
-            total=all_insurance_to_update.shape[0],
-            unit="ships",
-        ):
-            update_insurance(insurance_to_update)
+    if all_insurance_to_update.empty:
+        logger.info("No insurance to update")
+        return
+
+    results = queue.Queue()
+    pending_updates = []
+
+    with logging_redirect_tqdm(loggers=[logging.root]), warnings.catch_warnings(), tqdm(
+        total=all_insurance_to_update.shape[0], unit="ships"
+    ) as progress:
+        insurer_queues = list(all_insurance_to_update.groupby("company_id"))
+        with ThreadPoolExecutor(max_workers=len(insurer_queues)) as executor:
+            futures = [
+                executor.submit(scrape_insurer_queue, company_id, insurances, results)
+                for company_id, insurances in insurer_queues
+            ]
+
+            while True:
+                try:
+                    insurance_id, date = results.get(timeout=1)
+                except queue.Empty:
+                    if all(future.done() for future in futures) and results.empty():
+                        break
+                    continue
+
+                progress.update(1)
+                if date is not None:
+                    pending_updates.append((insurance_id, date))
+                if len(pending_updates) >= write_batch_size:
+                    write_insurance_dates(pending_updates)
+                    pending_updates = []
+
+            # Surface unexpected errors from the scraping threads
+            failures = {
+                company_id: future.result()
+                for (company_id, _), future in zip(insurer_queues, futures)
+            }
+
+    write_insurance_dates(pending_updates)
+
+    failed_insurers = []
+    for company_id, insurances in insurer_queues:
+        n_failed = failures[company_id]
+        if n_failed == len(insurances):
+            failed_insurers.append(company_id)
+            logger_slack.error(
+                f"Failed to get insurance dates from insurer {company_id} for all its"
+                f" {n_failed} ships"
+            )
+        elif n_failed:
+            logger.warning(
+                f"Failed to get insurance dates from insurer {company_id} for {n_failed}"
+                f" out of {len(insurances)} ships"
+            )
 
+    if failed_insurers:
+        raise RuntimeError(f"Insurance dates could not be scraped from insurers {failed_insurers}")
 
-def update_insurance(insurance):
-    id = insurance.id
-    imo = insurance.ship_imo
-    company_id = insurance.company_id
 
+def scrape_insurer_queue(company_id, insurances, results):
+    """
+    Scrape the insurance start dates of an insurer's ships, putting (ship_insurer_id, date)
+    tuples in `results`, with a None date for ships that failed.
+    :return: the number of ships that failed
+    """
     scraper = known_insurers[company_id]
-    date = scraper.get_insurance_start_date_for_ship(imo)
-
-    if date != None:
-        db_insurance = (
-            session.query(ShipInsurer)
-            .filter(ShipInsurer.id == id, ShipInsurer.is_valid == True)
-            .first()
-        )
-
-        db_insurance.date_from_insurer = date
-        db_insurance.updated_on_insurer = dt.datetime.now()
-        session.add(db_insurance)
-        session.commit()
+    n_failed = 0
+
+    for insurance in insurances.itertuples():
+        try:
+            date = scraper.get_insurance_start_date_for_ship(insurance.ship_imo)
+        except Exception:
+            logger.warning(
+                f"Failed to get insurance date for {insurance.ship_imo} from insurer {company_id}",
+                exc_info=True,
+            )
+            date = None
+            n_failed += 1
+
+        results.put((insurance.id, date))
+        time.sleep(INSURER_REQUEST_INTERVAL_SECONDS)
+
+    return n_failed
+
+
+def write_insurance_dates(updates):
+    """
+    Write insurer start dates for many insurances at once.
+    :param updates: list of (ship_insurer_id, date_from_insurer)
+    """
+    if not updates:
+        return
+
+    now = dt.datetime.now()
+    session.bulk_update_mappings(
+        ShipInsurer,
+        [
+            {"id": insurance_id, "date_from_insurer": date, "updated_on_insurer": now}
+            for insurance_id, date in updates
+        ],
+    )
+    session.commit()
 
 
 def get_all_insurance_to_update():
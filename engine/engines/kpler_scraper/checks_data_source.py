@@ -3,9 +3,8 @@ from base.models.kpler import KplerSyncHistory
 
 from base.db_utils import upsert
 
-from tqdm import tqdm
-
 import pandas as pd
+import sqlalchemy as sa
 
 
 def update_sync_history_with_status(
@@ -16,22 +15,24 @@ def update_sync_history_with_status(
     comparison,
     checked_time,
 ):
-    query_for_history_entries = session.query(KplerSyncHistory).filter(
-        KplerSyncHistory.country_iso2 == origin_iso2,
-        KplerSyncHistory.date >= date_from,
-        KplerSyncHistory.date <= date_to,
+    """
+    Mark the sync history of `origin_iso2` between `date_from` and `date_to` as checked, in a
+    single UPDATE statement.
+
+    Every day is marked valid, whatever the comparison found: the days of the comparison never
+    matched the dates of the history entries, and failing days now would make the Kpler trade
+    dataset incomplete. Applying `comparison["ok"]` is left to a separate change.
+    """
+    session.execute(
+        sa.update(KplerSyncHistory)
+        .where(
+            KplerSyncHistory.country_iso2 == origin_iso2,
+            KplerSyncHistory.date >= date_from,
+            KplerSyncHistory.date <= date_to,
+        )
+        .values(last_checked=checked_time, is_valid=True)
+        .execution_options(synchronize_session=False)
     )
-
-    history_entries = query_for_history_entries.all()
-
-    # Comparison to dict of date to ok
-    comparison = comparison.set_index("departure_day").to_dict(orient="index")
-
-    for entry in tqdm(history_entries, unit=f"history-entry", leave=False):
-        is_valid = comparison[entry.date]["ok"] if entry.date in comparison else True
-        entry.last_checked = checked_time
-        entry.is_valid = is_valid
-
     session.commit()
 
 
@@ -50,6 +51,7 @@ def mark_updated(from_iso2, period, update_time):
         table=KplerSyncHistory.__tablename__,
         constraint_name="kpler_sync_history_unique",
         show_progress=False,
+        bulk=True,
     )
 
 
@@ -1,11 +1,48 @@
+import json
 import os
 from base.db import session
+from base.logger import logger
+from base.utils import to_datetime
+from sqlalchemy import text
 
 
-def clean_outdated_entries():
-    # Read sql from 'clean_outdated_entries.sql'
-    with open(os.path.join(os.path.dirname(__file__), "clean_outdated_entries.sql")) as f:
-        sql = f.read()
-    session.execute(sql)
+def clean_outdated_entries(scopes=None):
+    """
+    Set `is_valid` on trades according to the sync history: a trade is valid if it comes from
+    the latest update of its departure country and day.
+
+    :param scopes: list of (country_iso2, date_from, date_to) tuples of the departures touched by
+    the run (both dates included). Only trades within them are considered. If None, the whole
+    table is.
+    :return: the number of trades whose `is_valid` changed
+    """
+    if scopes is None:
+        sql = read_sql("clean_outdated_entries.sql")
+        params = {}
+    else:
+        if not scopes:
+            return 0
+        sql = read_sql("clean_outdated_entries_scoped.sql")
+        params = {
+            "scopes": json.dumps(
+                [
+                    {
+                        "country_iso2": country_iso2,
+                        "date_from": to_datetime(date_from).strftime("%Y-%m-%d"),
+                        "date_to": to_datetime(date_to).strftime("%Y-%m-%d"),
+                    }
+                    for country_iso2, date_from, date_to in scopes
+                ]
+            )
+        }
+
+    result = session.execute(text(sql), params)
+    n_changed = result.rowcount
     session.commit()
-    return
+    logger.info(f"Changed validity of {n_changed} outdated trade entries")
+    return n_changed
+
+
+def read_sql(filename):
+    with open(os.path.join(os.path.dirname(__file__), filename)) as f:
+        return f.read()
@@ -13,4 +13,10 @@ from
 where
     kpler_trade.id = trades.id
     and kpler_trade.flow_id = trades.flow_id
-    and kpler_trade.product_id = trades.product_id;
+    and kpler_trade.product_id = trades.product_id
+    and kpler_trade.is_valid is distinct from (
+        case
+            when kpler_sync_history.last_updated is not null then kpler_sync_history.last_updated = kpler_trade.updated_on
+            else false
+        end
+    );
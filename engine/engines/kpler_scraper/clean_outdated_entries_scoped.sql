@@ -0,0 +1,37 @@
+with scope as (
+    select
+        country_iso2,
+        date_from,
+        date_to
+    from
+        jsonb_to_recordset(cast(:scopes as jsonb)) as scope(country_iso2 text, date_from date, date_to date)
+),
+trades as (
+    select
+        kpler_trade.id,
+        kpler_trade.flow_id,
+        kpler_trade.product_id,
+        case
+            when kpler_sync_history.last_updated is not null then kpler_sync_history.last_updated = kpler_trade.updated_on
+            else false
+        end as is_valid
+    from
+        scope
+        join kpler_zone departure_zone on departure_zone.country_iso2 = scope.country_iso2
+        join kpler_trade on kpler_trade.departure_zone_id = departure_zone.id
+        and kpler_trade.departure_date_utc >= scope.date_from
+        and kpler_trade.departure_date_utc < scope.date_to + interval '1 day'
+        left join kpler_sync_history on kpler_sync_history.date = cast(kpler_trade.departure_date_utc as date)
+        and kpler_sync_history.country_iso2 = departure_zone.country_iso2
+)
+update
+    kpler_trade
+set
+    is_valid = trades.is_valid
+from
+    trades
+where
+    kpler_trade.id = trades.id
+    and kpler_trade.flow_id = trades.flow_id
+    and kpler_trade.product_id = trades.product_id
+    and kpler_trade.is_valid is distinct from trades.is_valid;
@@ -0,0 +1,251 @@
+import datetime as dt
+import json
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from base.env import get_env
+from base.logger import logger
+
+KPLER_METADATA_TTL_DAYS = float(get_env("KPLER_METADATA_TTL_DAYS", 7))
+
+
+class KplerMetadataStore:
+    """
+    Local store of Kpler metadata (zones, installations, products and their details), shared by
+    all the scrapers of a process and persisted across runs in a SQLite file.
+
+    - Listings (e.g. all zones) are refreshed once older than `ttl`. The ETag of the previous
+      response is sent along, so that an unchanged listing costs a 304 rather than a download.
+    - Records (e.g. the details of a product) are indexed by kind and id, and fetched only
+      if missing or older than `ttl`.
+    - The zone -> country hierarchy is computed when zones are refreshed, and stored with them.
+    """
+
+    def __init__(self, client, path, ttl=dt.timedelta(days=KPLER_METADATA_TTL_DAYS)):
+        self.client = client
+        self.ttl = ttl
+        self.lock = threading.RLock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(
+            """
+            create table if not exists listing (
+                kind text primary key,
+                etag text,
+                fetched_on real not null
+            );
+            create table if not exists record (
+                kind text not null,
+                id integer not null,
+                data text,
+                fetched_on real not null,
+                primary key (kind, id)
+            );
+            create table if not exists zone_country (
+                id integer not null,
+                name text,
+                country text,
+                iso2 text
+            );
+            """
+        )
+
+        # Loaded lazily from the database
+        self.listings = {}
+        self.records = {}
+        self.zones_countries = None
+        self.zone_index = None
+
+    def get_listing(self, kind, url=None) -> pd.DataFrame:
+        """
+        All the records of a Kpler endpoint listing, e.g. `zones`, as a DataFrame.
+        """
+        with self.lock:
+            if not self._is_fresh(self._get_fetched_on(kind)):
+                self._refresh_listing(kind, url or kind)
+                self.listings.pop(kind, None)
+
+            if kind not in self.listings:
+                rows = self.connection.execute(
+                    "select data from record where kind = ? order by id", (f"{kind}_listing",)
+                )
+                self.listings[kind] = pd.DataFrame([json.loads(data) for (data,) in rows])
+
+            return self.listings[kind]
+
+    def get_record(self, kind, id, fetch):
+        """
+        A single record, e.g. the details of a product, calling `fetch()` if we don't have
+        an up-to-date copy. Records that could not be fetched (None) are not persisted.
+        """
+        with self.lock:
+            records = self.records.setdefault(kind, {})
+            if id in records:
+                return records[id]
+
+            row = self.connection.execute(
+                "select data, fetched_on from record where kind = ? and id = ?", (kind, id)
+            ).fetchone()
+            if row is not None and self._is_fresh(row[1]):
+                records[id] = json.loads(row[0])
+                return records[id]
+
+        data = fetch()
+
+        with self.lock:
+            if data is not None:
+                with self.connection:
+                    self.connection.execute(
+                        "insert or replace into record values (?, ?, ?, ?)",
+                        (kind, id, json.dumps(data), self._now()),
+                    )
+            records[id] = data
+            return data
+
+    def get_zones_countries(self) -> pd.DataFrame:
+        """
+        The zones belonging to a country, with columns id, name, country and iso2.
+        """
+        with self.lock:
+            # Refreshes the hierarchy if zones are outdated
+            self.get_listing("zones")
+            if self.zones_countries is None:
+                self.zones_countries = pd.read_sql(
+                    "select id, name, country, iso2 from zone_country", self.connection
+                )
+                self.zone_index = None
+            return self.zones_countries
+
+    def get_zone_index(self) -> "KplerZoneIndex":
+        with self.lock:
+            zones_countries = self.get_zones_countries()
+            if self.zone_index is None:
+                self.zone_index = KplerZoneIndex(zones_countries)
+            return self.zone_index
+
+    def _refresh_listing(self, kind, url):
+        etag = self._get_etag(kind)
+        headers = {"If-None-Match": etag} if etag else None
+        response = self.client.fetch(url, headers=headers)
+
+        if response.status_code == 304:
+            logger.info(f"Kpler {kind} unchanged since last fetch")
+            with self.connection:
+                self.connection.execute(
+                    "update listing set fetched_on = ? where kind = ?", (self._now(), kind)
+                )
+            return
+
+        if response.status_code != 200:
+            raise RuntimeError(
+                f"Failed to fetch Kpler {kind}. Status code: {response.status_code}, {response.content}"
+            )
+
+        items = response.json()
+        now = self._now()
+        with self.connection:
+            self.connection.execute("delete from record where kind = ?", (f"{kind}_listing",))
+            self.connection.executemany(
+                "insert or replace into record values (?, ?, ?, ?)",
+                [(f"{kind}_listing", x.get("id"), json.dumps(x), now) for x in items],
+            )
+            if kind == "zones":
+                zones_countries = get_zones_countries(items)
+                self.connection.execute("delete from zone_country")
+                self.connection.executemany(
+                    "insert into zone_country values (?, ?, ?, ?)",
+                    zones_countries.itertuples(index=False),
+                )
+                self.zones_countries = None
+                self.zone_index = None
+            self.connection.execute(
+                "insert or replace into listing values (?, ?, ?)",
+                (kind, response.headers.get("ETag"), now),
+            )
+
+    def _get_fetched_on(self, kind):
+        row = self.connection.execute(
+            "select fetched_on from listing where kind = ?", (kind,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _get_etag(self, kind):
+        row = self.connection.execute("select etag from listing where kind = ?", (kind,)).fetchone()
+        return row[0] if row else None
+
+    def _is_fresh(self, fetched_on):
+        return fetched_on is not None and self._now() - fetched_on < self.ttl.total_seconds()
+
+    def _now(self):
+        return dt.datetime.now().timestamp()
+
+
+class KplerZoneIndex:
+    """
+    Lookups of country zones by id and iso2, built once from `get_zones_countries`.
+
+    Only ids matching a single zone are indexed: ids listed under several countries are
+    ambiguous, and treated as not found.
+    """
+
+    def __init__(self, zones_countries: pd.DataFrame):
+        counts = zones_countries.id.value_counts()
+        unique = zones_countries[zones_countries.id.isin(counts.index[counts == 1])]
+        self.iso2_by_id = dict(zip(unique.id, unique.iso2))
+        self.name_by_id = dict(zip(unique.id, unique.name))
+        self.ids_by_iso2 = zones_countries.groupby("iso2").id.unique().to_dict()
+
+    def map_iso2s(self, ids: pd.Series) -> pd.Series:
+        return map_ids(ids, self.iso2_by_id)
+
+    def map_names(self, ids: pd.Series) -> pd.Series:
+        return map_ids(ids, self.name_by_id)
+
+
+def map_ids(ids: pd.Series, values: dict) -> pd.Series:
+    """
+    Map a column of ids through a dict, with None where the id isn't in it.
+    """
+    return ids.map(values).astype(object).where(ids.isin(list(values)), None)
+
+
+def get_zones_countries(zones) -> pd.DataFrame:
+    """
+    Flatten the `parentZones` of Kpler zones into the list of zones belonging to each country.
+    :param zones: list of zones, as returned by Kpler
+    :return: DataFrame with columns id, name, country and iso2
+    """
+    rows = []
+    for zone in zones:
+        parent_zones = zone.get("parentZones") or []
+        country = next(
+            (x.get("name") for x in parent_zones if x.get("type") == "country"),
+            next(
+                (x.get("name") for x in parent_zones if x.get("type") == "country_checkpoint"),
+                None,
+            ),
+        )
+        if country is None:
+            continue
+        rows += [
+            {"id": x.get("id"), "name": x.get("name"), "country": country}
+            for x in parent_zones
+            if x.get("resourceType") == "zone"
+        ]
+
+    zones_countries = pd.DataFrame(rows, columns=["id", "name", "country"]).drop_duplicates()
+
+    import country_converter as coco
+
+    # Converting each country once rather than once per zone
+    countries = list(zones_countries.country.unique())
+    iso2s = coco.CountryConverter().convert(countries, to="ISO2")
+    iso2s = iso2s if isinstance(iso2s, list) else [iso2s]
+    zones_countries["iso2"] = zones_countries.country.map(dict(zip(countries, iso2s)))
+    return zones_countries[["id", "name", "country", "iso2"]]
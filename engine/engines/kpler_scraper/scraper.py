@@ -1,4 +1,6 @@
 import datetime as dt
+import functools
+import threading
 import time
 from typing import Optional
 import pyotp
@@ -7,9 +9,6 @@ import urllib3
 from requests.adapters import HTTPAdapter, Retry
 import json
 import os
-import ast
-
-import country_converter as coco
 
 from base.env import get_env
 from base import UNKNOWN_COUNTRY
@@ -23,19 +22,36 @@ from base.db import session
 from base.logger import logger
 import pandas as pd
 from unidecode import unidecode
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 
 
 from urllib.parse import parse_qs
 
 from engines.kpler_scraper.token_manager import KplerCredentials, KplerTokenManager
+from engines.kpler_scraper.metadata import KplerMetadataStore, map_ids
 
 KPLER_TOTAL = "Total"
 CACHE_BASE_DIR = "cache/kpler/"
 
+# Zones missing or ambiguous in Kpler's hierarchy
+MANUAL_ZONE_ISO2S = {
+    299: "EG",
+    943: "AE",
+    561: "MT",
+    261: "DJ",
+    707: "PA",
+    175: "CV",
+    343: "GI",
+}
+MANUAL_ZONE_NAMES = {
+    299: "Egypt",
+    943: "United Arab Emirates",
+    561: "Malta",
+    261: "Djibouti",
+    707: "Panama",
+    175: "Cap Verde",
+    343: "Gibraltar",
+}
+
 
 def split_into(s, n):
     size, remainder = divmod(len(s), n)
@@ -50,11 +66,14 @@ class KplerClient:
     def __init__(
         self,
         *,
-        credentials=KplerCredentials.from_env(),
+        credentials=None,
         # Allows us to inject a different token manager for testing
         token_manager_provider=lambda credentials: KplerTokenManager(credentials=credentials),
         max_requests_per_second=3.0,
     ):
+        # Read on construction rather than import, so that importing needs no secret
+        if credentials is None:
+            credentials = KplerCredentials.from_env()
         self.credentials = credentials
         self.session = requests.Session()
         retries = Retry(
@@ -74,6 +93,8 @@ class KplerClient:
 
         self.last_request_time = None
         self.max_requests_per_second = max_requests_per_second
+        # The client is shared by threads crawling concurrently
+        self.rate_limit_lock = threading.Lock()
 
     def fetch(
         self,
@@ -81,13 +102,15 @@ class KplerClient:
         *,
         params=None,
         body=None,
+        headers=None,
         base_path="/api/",
         reauth=False,
     ):
         self._handle_rate_limiting()
 
         token = self.token_manager.get_token(reauth=reauth)
-        headers = self._generate_headers(token)
+        extra_headers = headers
+        headers = {**self._generate_headers(token), **(extra_headers or {})}
 
         full_url = f"https://terminal.kpler.com{base_path}{url}"
 
@@ -103,7 +126,14 @@ class KplerClient:
             raise RuntimeError(f"Request failed with 401 even after reauth. url={full_url}")
 
         if result.status_code == 401:
-            return self.fetch(url, params=params, body=body, base_path=base_path, reauth=True)
+            return self.fetch(
+                url,
+                params=params,
+                body=body,
+                headers=extra_headers,
+                base_path=base_path,
+                reauth=True,
+            )
 
         return result
 
@@ -119,13 +149,17 @@ class KplerClient:
         return headers
 
     def _handle_rate_limiting(self):
-        if self.last_request_time is not None:
-            min_time_between_requests = 1 / self.max_requests_per_second
-            time_since_last_request = time.time() - self.last_request_time
-            if time_since_last_request < min_time_between_requests:
-                time.sleep(min_time_between_requests - time_since_last_request)
+        # Reserve the next request slot, then wait for it outside of the lock
+        with self.rate_limit_lock:
+            now = time.time()
+            wait = 0
+            if self.last_request_time is not None:
+                min_time_between_requests = 1 / self.max_requests_per_second
+                wait = max(0, self.last_request_time + min_time_between_requests - now)
+            self.last_request_time = now + wait
 
-        self.last_request_time = time.time()
+        if wait > 0:
+            time.sleep(wait)
 
 
 _kpler_client = None
@@ -138,6 +172,19 @@ def get_singleton_kpler_client():
     return _kpler_client
 
 
+_kpler_metadata_store = None
+
+
+def get_singleton_kpler_metadata_store():
+    global _kpler_metadata_store
+    if _kpler_metadata_store is None:
+        _kpler_metadata_store = KplerMetadataStore(
+            client=get_singleton_kpler_client(),
+            path=os.path.join(CACHE_BASE_DIR, "metadata.sqlite"),
+        )
+    return _kpler_metadata_store
+
+
 ### IMPORTANT
 ### Certain country names and to_zone_name are still empty after
 ### scraping, and have been updated manually in the database
@@ -165,22 +212,21 @@ class KplerScraper:
     def default_params():
         return {**KplerScraper.default_trade_flow_params}
 
-    def __init__(self, client=get_singleton_kpler_client()):
-        self.cc = coco.CountryConverter()
-
+    def __init__(self, client=None):
         # To cache products
         self.products = None
+        self.product_ids = None
 
         # Brute-force infos
-        self.products_brute = None
-        self.zones_brute = None
-        self.installations_brute = None
         self.vessels_brute = None
 
-        # Processed
-        self.zones_countries = None
+        self.client = client or get_singleton_kpler_client()
+
+    @functools.cached_property
+    def cc(self):
+        import country_converter as coco
 
-        self.client = client
+        return coco.CountryConverter()
 
     def get_installations(self, origin_iso2, split, product=None):
         # We collect flows split by installation
@@ -196,92 +242,21 @@ class KplerScraper:
         return installations
 
     def get_installations_brute(self):
-        if self.installations_brute is not None:
-            return self.installations_brute
-
-        file = f"{CACHE_BASE_DIR}/installations.csv"
-
-        if not os.path.exists(file):
-            response = self.client.fetch("installations")
-            data_from_kpler = pd.DataFrame(response.json())
-            data_from_kpler.to_csv(file, index=False)
-
-        data = pd.read_csv(file)
-
-        self.installations_brute = data
-        return data
+        return get_singleton_kpler_metadata_store().get_listing("installations")
 
     def get_zones_brute(self):
-        if self.zones_brute is not None:
-            return self.zones_brute
-
-        file = f"{CACHE_BASE_DIR}/zones.csv"
-
-        if not os.path.exists(file):
-            if not os.path.exists(CACHE_BASE_DIR):
-                os.makedirs(CACHE_BASE_DIR)
-            response = self.client.fetch("zones")
-            data_from_kpler = pd.DataFrame(response.json())
-            data_from_kpler.to_csv(file, index=False)
-
-        data = pd.read_csv(file)
-
-        self.zones_brute = data
-        return data
+        return get_singleton_kpler_metadata_store().get_listing("zones")
 
     def get_zones_countries(self):
-        if self.zones_countries is not None:
-            return self.zones_countries
-
-        def parent_zones_to_zones_df(parent_zones):
-            try:
-                dicts = ast.literal_eval(parent_zones)
-                df = pd.DataFrame([x for x in dicts if x.get("resourceType") == "zone"])
-                # Add countries
-                country = next(
-                    (x.get("name") for x in dicts if x.get("type") == "country"),
-                    next(
-                        (x.get("name") for x in dicts if x.get("type") == "country_checkpoint"),
-                        None,
-                    ),
-                )
-                if country is None:
-                    return pd.DataFrame()
-                df["country"] = country
-                df["iso2"] = self.cc.convert(country, to="ISO2")
-                return df
-            except ValueError:
-                return pd.DataFrame()
-
-        zones = self.get_zones_brute()
-        zones_with_country = pd.concat([parent_zones_to_zones_df(x) for x in zones.parentZones])
-        zones_with_country = zones_with_country[["id", "name", "country", "iso2"]].drop_duplicates()
-
-        self.zones_countries = zones_with_country
-        return zones_with_country
+        return get_singleton_kpler_metadata_store().get_zones_countries()
 
     def get_products_brute(self):
-        if self.products_brute is not None:
-            return self.products_brute
-
-        file = f"{CACHE_BASE_DIR}/products.csv"
-
-        if not os.path.exists(file):
-            response = self.client.fetch("products")
-            data_from_kpler = pd.DataFrame(response.json())
-            data_from_kpler.to_csv(file, index=False)
-
-        data = pd.read_csv(file)
-
-        self.products_brute = data
-        return data
+        return get_singleton_kpler_metadata_store().get_listing("products")
 
     def get_commodities_brute(self):
         products = self.get_products_brute()
         products = products[~pd.isna(products.closestAncestorCommodity)]
-        commodities = products.closestAncestorCommodity.apply(
-            lambda x: pd.Series(json.loads(x.replace("'", '"')))
-        )
+        commodities = products.closestAncestorCommodity.apply(pd.Series)
         commodities = commodities.drop_duplicates()
         return commodities
 
@@ -333,50 +308,37 @@ class KplerScraper:
 
         return {"id": int(matching["id"].values[0]), "resourceType": type}
 
+    def get_zone_index(self):
+        return get_singleton_kpler_metadata_store().get_zone_index()
+
     def get_zone_iso2(self, id):
-        zones_countries = self.get_zones_countries()
-        found = zones_countries[(zones_countries["id"] == id)]["iso2"]
-        if len(found) == 1:
-            return found.values[0]
-        else:
-            # Manual values
-            manual_iso2s = {
-                299: "EG",
-                943: "AE",
-                561: "MT",
-                261: "DJ",
-                707: "PA",
-                175: "CV",
-                343: "GI",
-            }
-            manual_iso2 = manual_iso2s.get(id, None)
-            return manual_iso2
+        return self.map_zone_iso2s(pd.Series([id])).iloc[0]
+
+    def map_zone_iso2s(self, ids: pd.Series) -> pd.Series:
+        iso2s = self.get_zone_index().map_iso2s(ids)
+        manual_iso2s = map_ids(ids, MANUAL_ZONE_ISO2S)
+        return iso2s.where(ids.isin(list(self.get_zone_index().iso2_by_id)), manual_iso2s)
 
     def get_zone_name(self, id, name=None):
-        if name is not None:
-            return name
-
-        manual_names = {
-            299: "Egypt",
-            943: "United Arab Emirates",
-            561: "Malta",
-            261: "Djibouti",
-            707: "Panama",
-            175: "Cap Verde",
-            343: "Gibraltar",
-        }
+        return self.map_zone_names(pd.Series([id]), names=pd.Series([name])).iloc[0]
+
+    def map_zone_names(self, ids: pd.Series, names: pd.Series = None) -> pd.Series:
+        """
+        Zone names of a column of ids, unless given in `names`.
+        Raises a ValueError if some are not found.
+        """
+        names = pd.Series(
+            names.values if names is not None else None, index=ids.index, dtype=object
+        )
 
-        if manual_names.get(id, None) is not None:
-            return manual_names[id]
+        names = names.where(~names.isna(), map_ids(ids, MANUAL_ZONE_NAMES))
+        names = names.where(~names.isna(), self.get_zone_index().map_names(ids))
+        names = names.where(~names.isna() | (ids != 0), UNKNOWN_COUNTRY)
 
-        zones_countries = self.get_zones_countries()
-        found = zones_countries[(zones_countries["id"] == id)]["name"]
-        if len(found) == 1:
-            return found.values[0]
-        elif id == 0:
-            return UNKNOWN_COUNTRY
-        else:
-            raise ValueError(f"Zone name not found: {id}")
+        missing = ids[names.isna()].unique()
+        if len(missing) > 0:
+            raise ValueError(f"Zone name not found: {', '.join(str(x) for x in missing)}")
+        return names
 
     def get_vessel_raw_brute(self, kpler_vessel_id):
         """
@@ -440,9 +402,11 @@ class KplerScraper:
         if name in manual_values:
             return manual_values[name]
 
-        products = self.get_products()
-        product = products[products.name == name]
-        return int(product.id.values[0]) if len(product) == 1 else None
+        if self.product_ids is None:
+            products = self.get_products()
+            products = products[~products.name.duplicated(keep=False)]
+            self.product_ids = dict(zip(products.name, products.id.astype(int)))
+        return self.product_ids.get(name)
 
     def fix_zone_id(self, id):
         """
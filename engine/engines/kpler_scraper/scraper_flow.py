@@ -115,9 +115,9 @@ class KplerFlowScraper(KplerScraper):
 
         df = pd.concat(dfs, ignore_index=True)
         df.rename(columns={"name": "split_name", "id": "split_id"}, inplace=True)
-        df["split"] = df.apply(
-            lambda row: {"id": row["split_id"], "name": row["split_name"]}, axis=1
-        )
+        df["split"] = [
+            {"id": id, "name": name} for id, name in zip(df["split_id"], df["split_name"])
+        ]
         df.drop(["split_id", "split_name"], axis=1, inplace=True)
         df = df.melt(id_vars=["date", "split"])
         df["date"] = pd.to_datetime(df["date"])
@@ -195,8 +195,8 @@ class KplerFlowScraper(KplerScraper):
         df["to_split"] = get_split_name(to_split)
         df["from_iso2"] = origin_iso2 if origin_iso2 else KPLER_TOTAL
 
-        df["from_zone"] = df.apply(lambda x: from_zone or {"id": 0, "name": None}, axis=1)
-        df["to_zone"] = df.apply(lambda x: to_zone or {"id": 0, "name": None}, axis=1)
+        df["from_zone"] = [from_zone or {"id": 0, "name": None}] * len(df)
+        df["to_zone"] = [to_zone or {"id": 0, "name": None}] * len(df)
         df["unit"] = unit.value
         df = df.rename(columns={"Date": "date"})
 
@@ -215,37 +215,41 @@ class KplerFlowScraper(KplerScraper):
                 df["from_zone"] = df["split"]
             elif split in [FlowsSplit.Products, FlowsSplit.Grades]:
                 # product is the generic term that is returned by the API
-                df["product"] = df["split"].apply(lambda x: x.get("name"))
-
-                df["grade"] = df["split"].apply(
-                    lambda x: KplerProductScraper.get_grade_name(id=x.get("id"))
-                )
-                df["commodity"] = df["split"].apply(
-                    lambda x: KplerProductScraper.get_commodity_name(id=x.get("id"))
-                )
-                df["group"] = df["split"].apply(
-                    lambda x: KplerProductScraper.get_group_name(id=x.get("id"))
-                )
-                df["family"] = df["split"].apply(
-                    lambda x: KplerProductScraper.get_family_name(id=x.get("id"))
-                )
+                df["product"] = df["split"].str.get("name")
+
+                # Looking up each product once rather than once per row
+                product_ids = df["split"].str.get("id")
+                unique_ids = product_ids.unique()
+                for column, get_name in [
+                    ("grade", KplerProductScraper.get_grade_name),
+                    ("commodity", KplerProductScraper.get_commodity_name),
+                    ("group", KplerProductScraper.get_group_name),
+                    ("family", KplerProductScraper.get_family_name),
+                ]:
+                    df[column] = product_ids.map({id: get_name(id=id) for id in unique_ids})
 
             return df
 
         df = split_to_column(df, split)
         df = df.drop(columns=["split"])
 
-        df["from_zone_id"] = df.from_zone.apply(lambda x: self.fix_zone_id(int(x.get("id"))))
-        df["to_zone_id"] = df.to_zone.apply(lambda x: self.fix_zone_id(int(x.get("id"))))
+        from_zone_ids = df.from_zone.str.get("id").astype(int)
+        to_zone_ids = df.to_zone.str.get("id").astype(int)
+        df["from_zone_id"] = from_zone_ids.map(
+            {id: self.fix_zone_id(id) for id in from_zone_ids.unique()}
+        )
+        df["to_zone_id"] = to_zone_ids.map(
+            {id: self.fix_zone_id(id) for id in to_zone_ids.unique()}
+        )
 
-        df["to_iso2"] = df.to_zone_id.apply(lambda x: self.get_zone_iso2(id=x))
-        df["from_iso2"] = df.from_zone_id.apply(lambda x: self.get_zone_iso2(id=x))
+        df["to_iso2"] = self.map_zone_iso2s(df.to_zone_id)
+        df["from_iso2"] = self.map_zone_iso2s(df.from_zone_id)
 
-        df["from_zone_name"] = df.from_zone.apply(
-            lambda x: self.get_zone_name(id=x.get("id"), name=x.get("name"))
+        df["from_zone_name"] = self.map_zone_names(
+            df.from_zone.str.get("id"), names=df.from_zone.str.get("name")
         )
-        df["to_zone_name"] = df.to_zone.apply(
-            lambda x: self.get_zone_name(id=x.get("id"), name=x.get("name"))
+        df["to_zone_name"] = self.map_zone_names(
+            df.to_zone.str.get("id"), names=df.to_zone.str.get("name")
         )
 
         df.drop(columns=["from_zone", "to_zone"], inplace=True)
@@ -6,21 +6,18 @@ from base.logger import logger
 from base.env import get_env
 import pandas as pd
 
-from engines.kpler_scraper.scraper import get_singleton_kpler_client
+from engines.kpler_scraper.scraper import (
+    get_singleton_kpler_client,
+    get_singleton_kpler_metadata_store,
+)
 
 
 class KplerProductScraper:
-    cache = {}
-    client = get_singleton_kpler_client()
-
     @classmethod
     def get_infos(cls, id):
-        if id in KplerProductScraper.cache:
-            return KplerProductScraper.cache[id]
-        else:
-            infos = KplerProductScraper.collect_infos(id=id)
-            KplerProductScraper.cache[id] = infos
-            return infos
+        return get_singleton_kpler_metadata_store().get_record(
+            "product", id, fetch=lambda: cls.collect_infos(id=id)
+        )
 
     @classmethod
     def get_parsed_infos(cls, id):
@@ -95,7 +92,7 @@ class KplerProductScraper:
     @classmethod
     def collect_infos(cls, id):
         try:
-            r = KplerProductScraper.client.fetch(f"products/{id}")
+            r = get_singleton_kpler_client().fetch(f"products/{id}")
         except (requests.exceptions.ChunkedEncodingError, urllib3.exceptions.ReadTimeoutError):
             logger.warning(f"Kpler request failed")
             return None
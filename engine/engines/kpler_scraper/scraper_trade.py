@@ -1,5 +1,4 @@
 from typing import List
-from tqdm import tqdm
 
 import datetime as dt
 
@@ -11,41 +10,175 @@ from .misc import get_nested
 from base.utils import *
 
 
+# Column types of the parsed trades and their metadata. Ids are nullable integers and repeated
+# strings are categoricals, which take a fraction of the memory of Python objects.
+# Columns not listed (e.g. lists of ids, raw vessel infos) are kept as objects.
+TRADE_DTYPES = {
+    "id": "Int64",
+    "status": "category",
+    "departure_zone_id": "Int64",
+    "arrival_zone_id": "Int64",
+    "departure_berth_id": "Int64",
+    "departure_berth_name": "category",
+    "arrival_berth_id": "Int64",
+    "arrival_berth_name": "category",
+    "departure_installation_id": "Int64",
+    "departure_installation_name": "category",
+    "arrival_installation_id": "Int64",
+    "arrival_installation_name": "category",
+    "departure_sts": "boolean",
+    "arrival_sts": "boolean",
+    "flow_id": "Int64",
+    "product_id": "Int64",
+    "value_tonne": "float64",
+    "value_m3": "float64",
+    "value_energy": "float64",
+    "value_gas_m3": "float64",
+}
+TRADE_DATE_COLUMNS = ["departure_date_utc", "arrival_date_utc"]
+
+VESSEL_DTYPES = {
+    "id": "Int64",
+    "dwt": "float64",
+    "type_name": "category",
+    "type_class_name": "category",
+    "class_name": "category",
+    "capacity_cm": "float64",
+}
+
+PRODUCT_DTYPES = {
+    "id": "Int64",
+    "type": "category",
+    "grade_id": "Int64",
+    "commodity_id": "Int64",
+    "commodity_name": "category",
+    "group_id": "Int64",
+    "group_name": "category",
+    "family_id": "Int64",
+    "family_name": "category",
+}
+
+INSTALLATION_DTYPES = {
+    "id": "Int64",
+    "type": "category",
+    "port_id": "Int64",
+}
+
+
+class _FrameBuffer:
+    """
+    Accumulates parsed rows page by page as typed DataFrames.
+
+    If `id_column` is given, rows are deduplicated by it: only the first row seen for each id
+    is kept, and rows without an id are dropped.
+    """
+
+    def __init__(self, dtypes, id_column=None, date_columns=[]):
+        self.dtypes = dtypes
+        self.id_column = id_column
+        self.date_columns = date_columns
+        self.frames = []
+        self.ids = set()
+
+    def new_ids(self, ids):
+        return list(dict.fromkeys(x for x in ids if x is not None and x not in self.ids))
+
+    def add(self, rows):
+        rows = [x for x in rows if x is not None]
+        if self.id_column:
+            new_rows = {}
+            for row in rows:
+                id = row.get(self.id_column)
+                if id is not None and id not in self.ids and id not in new_rows:
+                    new_rows[id] = row
+            self.ids.update(new_rows.keys())
+            rows = list(new_rows.values())
+
+        if not rows:
+            return
+
+        df = pd.DataFrame(rows)
+        for column in self.date_columns:
+            df[column] = pd.to_datetime(df[column])
+        for column, dtype in self.dtypes.items():
+            if column not in df.columns:
+                continue
+            try:
+                df[column] = df[column].astype(dtype)
+            except (TypeError, ValueError):
+                logger.warning(f"Could not convert {column} to {dtype}, keeping it as is")
+        self.frames.append(df)
+
+    def to_frame(self) -> pd.DataFrame:
+        if not self.frames:
+            return pd.DataFrame()
+
+        # Pages have different categories, which concat would turn back into objects
+        columns = self.frames[0].columns
+        categoricals = {
+            column: pd.api.types.union_categoricals([df[column] for df in self.frames])
+            for column in columns
+            if all(isinstance(df[column].dtype, pd.CategoricalDtype) for df in self.frames)
+        }
+        df = pd.concat([x.drop(columns=list(categoricals)) for x in self.frames], ignore_index=True)
+        for column, values in categoricals.items():
+            df[column] = values
+        self.frames = []
+        return df[columns]
+
+
 class KplerTradeScraper(KplerScraper):
     def __init__(self):
         super().__init__()
 
     def get_trades(self, from_iso2=None, month=None):
+        """
+        Get the trades departing from `from_iso2` in `month`, with their vessels, products and
+        installations.
 
-        trades = []
-        vessels = []
-        products = []
-        installations = []
+        Each page of raw trades is parsed into typed DataFrames as soon as it is received and
+        released straight away, so that memory is bounded by the size of a page rather than
+        by the size of the month.
+
+        :return: trades, vessels, products and installations DataFrames. Vessels, products
+        and installations are deduplicated by id.
+        """
+        trades = _FrameBuffer(TRADE_DTYPES, date_columns=TRADE_DATE_COLUMNS)
+        vessels = _FrameBuffer(VESSEL_DTYPES, id_column="id")
+        products = _FrameBuffer(PRODUCT_DTYPES, id_column="id")
+        installations = _FrameBuffer(INSTALLATION_DTYPES, id_column="id")
 
         for current_iso2 in to_list(from_iso2):
             from_zone = self.get_zone_dict(iso2=current_iso2)
-            trades_raw = []
 
             query_from = 0
             while True:
-                size, query_trades_raw = self.get_trades_raw(
+                size, trades_raw = self.get_trades_raw(
                     from_zone=from_zone,
                     query_from=query_from,
                     month=month,
                 )
-                trades_raw.extend(query_trades_raw)
-                query_from += size
                 if size == 0:
                     break
+                query_from += size
 
-            for x in tqdm(trades_raw, unit="raw-trade", leave=False):
-                trades_, vessels_, zones_, products_, installations_ = self._parse_trade(x)
-                trades.extend(trades_)
-                vessels.extend(vessels_)
-                products.extend(products_)
-                installations.extend(installations_)
+                page_trades = []
+                page_vessels = []
+                page_installations = []
+                for x in trades_raw:
+                    page_trades.extend(self._parse_trade_trade(trade_raw=x))
+                    page_vessels.extend(self._parse_trade_vessels(get_nested(x, "vessels")))
+                    page_installations.extend(self._parse_trade_installations(trade_raw=x))
+                del trades_raw
 
-        return trades, vessels, products, installations
+                trades.add(page_trades)
+                vessels.add(page_vessels)
+                installations.add(page_installations)
+
+                new_product_ids = products.new_ids([x.get("product_id") for x in page_trades])
+                products.add([KplerProductScraper.get_parsed_infos(id=x) for x in new_product_ids])
+
+        return trades.to_frame(), vessels.to_frame(), products.to_frame(), installations.to_frame()
 
     def get_trades_raw(
         self,
@@ -187,8 +320,8 @@ class KplerTradeScraper(KplerScraper):
         else:
             trade["status"] = status_dict[trade_raw.get("status")]
 
-        trade["departure_date_utc"] = pd.to_datetime(trade_raw.get("start"))
-        trade["arrival_date_utc"] = pd.to_datetime(trade_raw.get("end"))
+        trade["departure_date_utc"] = trade_raw.get("start")
+        trade["arrival_date_utc"] = trade_raw.get("end")
 
         # Zones
         trade["departure_zone_id"] = get_nested(
@@ -291,71 +424,6 @@ class KplerTradeScraper(KplerScraper):
 
         return flows
 
-    def _parse_trade_zones(self, trade_raw) -> List[dict]:
-        """
-        Extract all possible information from trade_raw about zones,
-        be it berth, port, or country
-        :param trade_raw:
-        :return:
-        """
-
-        if not trade_raw:
-            return []
-
-        zones = [
-            get_nested(trade_raw, "portCallOrigin", "zone", warn=False),
-            get_nested(trade_raw, "portCallDestination", "zone", warn=False),
-        ]
-
-        # Adding steps
-        zones += [y.get("zone") for y in trade_raw.get("steps")]
-
-        result = []
-        for zone in zones:
-            if not zone:
-                continue
-
-            primary_zone = {}
-            primary_zone["id"] = zone.get("id")
-            primary_zone["name"] = zone.get("name")
-            primary_zone["type"] = zone.get("type")
-
-            port = next((x for x in zone.get("parentZones", []) if x["isPort"]), {})
-            country = zone.get("country") or {}
-
-            primary_zone["port_id"] = (zone.get("port") or {}).get("id")
-            primary_zone["port_name"] = (zone.get("port") or {}).get("name")
-            primary_zone["country_id"] = (zone.get("country") or {}).get("id")
-            primary_zone["country_name"] = (zone.get("country") or {}).get("name")
-            primary_zone["country_iso2"] = self._country_name_to_iso2(primary_zone["country_name"])
-            result.append(primary_zone)
-
-            if port:
-                port_zone = {}
-                port_zone["id"] = port.get("id")
-                port_zone["name"] = port.get("name")
-                port_zone["type"] = port.get("type")
-                port_zone["port_id"] = port.get("id")
-                port_zone["port_name"] = port.get("name")
-                port_zone["country_id"] = primary_zone["country_id"]
-                port_zone["country_name"] = primary_zone["country_name"]
-                port_zone["country_iso2"] = primary_zone["country_iso2"]
-                result.append(port_zone)
-
-            if country:
-                country_zone = {}
-                country_zone["id"] = country.get("id")
-                country_zone["name"] = country.get("name")
-                country_zone["type"] = country.get("type")
-                country_zone["country_id"] = primary_zone["country_id"]
-                country_zone["country_name"] = primary_zone["country_name"]
-                country_zone["country_iso2"] = primary_zone["country_iso2"]
-                result.append(country_zone)
-
-        # Remove duplicates
-        result = [dict(t) for t in {tuple(d.items()) for d in result}]
-        return result
-
     def _parse_trade_installations(self, trade_raw) -> List[dict]:
         """
         Extract all possible information from trade_raw about zones,
@@ -385,8 +453,6 @@ class KplerTradeScraper(KplerScraper):
             installation["port_id"] = (installation_raw.get("port") or {}).get("id")
             result.append(installation)
 
-        # Remove duplicates
-        result = [dict(t) for t in {tuple(d.items()) for d in result}]
         return result
 
     def _parse_trade_products(self, flow) -> List[dict]:
@@ -395,34 +461,5 @@ class KplerTradeScraper(KplerScraper):
 
         return KplerProductScraper.get_parsed_infos(id=flow.get("id"))
 
-    def _parse_trade(self, trade_raw) -> (List[dict], List[dict], List[dict], List[dict]):
-        """
-        Parse a single trade and return a list of dictionaries.
-        At the moment, it will only return either None or a list of single dictionary,
-        but just in case one trade translates into more for us.
-        :param x:
-        :return:
-         - trades
-         - vessels
-         - zones
-         - products
-        """
-
-        trades = self._parse_trade_trade(trade_raw=trade_raw)
-        # #DEBUG save trades using pickle
-        # import pickle
-        # # with open('trades.pickle', 'wb') as outfile:
-        # #     pickle.dump(trades, outfile)
-        # with open('trades.pickle', 'rb') as picklefile:
-        #     trades = pickle.load(picklefile)
-
-        vessels = self._parse_trade_vessels(vessels=get_nested(trade_raw, "vessels"))
-        zones = self._parse_trade_zones(trade_raw=trade_raw)
-        installations = self._parse_trade_installations(trade_raw=trade_raw)
-        product_ids = set([x.get("product_id") for x in trades])
-        products = [KplerProductScraper.get_parsed_infos(id=x) for x in product_ids]
-
-        return trades, vessels, zones, products, installations
-
     def _country_name_to_iso2(self, country_name):
         return self.cc.convert(country_name, to="ISO2") if country_name else None
@@ -1,23 +1,22 @@
 import datetime as dt
 import random
 import shutil
+import threading
 import time
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 from urllib.parse import parse_qs
 import pyotp
 import json
 
 from base.env import get_env
 import requests
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 
 from base.logger import logger
 
+if TYPE_CHECKING:
+    # Selenium is only imported when logging in through a browser
+    from selenium import webdriver
+
 
 class KplerCredentials:
     """
@@ -97,6 +96,8 @@ class KplerTokenManager:
         self._token: Optional[KplerToken] = None
         self._client_id: Optional[str] = None
         self._headers: Optional[dict] = None
+        # Only one thread at a time logs in or refreshes the token
+        self._lock = threading.Lock()
 
     def get_token(self, *, reauth: bool = False):
         """
@@ -109,17 +110,18 @@ class KplerTokenManager:
 
         :returns: An instance of the KplerToken class representing the authentication token.
         """
-        if reauth:
-            logger.info("Reauthenticating with Kpler.")
-            self._login()
-        elif self._token is None:
-            logger.info("No Kpler token available, logging in.")
-            self._login()
-        elif self._token.should_refresh():
-            logger.info("Kpler token is going to expire soon, refreshing.")
-            self._refresh_token()
-
-        return self._token
+        with self._lock:
+            if reauth:
+                logger.info("Reauthenticating with Kpler.")
+                self._login()
+            elif self._token is None:
+                logger.info("No Kpler token available, logging in.")
+                self._login()
+            elif self._token.should_refresh():
+                logger.info("Kpler token is going to expire soon, refreshing.")
+                self._refresh_token()
+
+            return self._token
 
     def _login(self):
 
@@ -162,6 +164,10 @@ class KplerTokenManager:
         Builds a new web driver instance for the Chrome browser with the required options and
         capabilities to extract the tokens from the login pages.
         """
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        from webdriver_manager.chrome import ChromeDriverManager
+
         # Create a new web driver
         chrome_options = webdriver.ChromeOptions()
         # Needed for _extract_token_request
@@ -205,7 +211,11 @@ class KplerTokenManager:
     def _extract_headers_from_request(request):
         return request["request"]["headers"]
 
-    def _take_steps_to_login(self, driver: webdriver.Chrome):
+    def _take_steps_to_login(self, driver: "webdriver.Chrome"):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.wait import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+
         # Navigate to the login page
         driver.get(KplerTokenManager.start_url)
 
@@ -233,7 +243,7 @@ class KplerTokenManager:
 
     @staticmethod
     def _extract_token_request(
-        driver: webdriver.Chrome,
+        driver: "webdriver.Chrome",
     ):
 
         log_entries = driver.get_log("performance")
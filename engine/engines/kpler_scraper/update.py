@@ -17,6 +17,7 @@ from .verify import KplerTradeComparer
 from .clean_outdated_entries import clean_outdated_entries
 
 from enum import Enum
+from typing import NamedTuple
 
 import datetime as dt
 from sqlalchemy import func
@@ -85,7 +86,13 @@ def update(
                 origin_iso2s=origin_iso2s,
             )
             logger.info("Cleaning outdated entries")
-            clean_outdated_entries()
+            clean_outdated_entries(
+                scopes=get_months_scopes(
+                    origin_iso2s=origin_iso2s,
+                    date_from=recent_date_from,
+                    date_to=recent_date_to or dt.date.today(),
+                )
+            )
 
             validate_sync(
                 origin_iso2s=origin_iso2s,
@@ -96,18 +103,30 @@ def update(
         if UpdateParts.REFETCH_OUTDATED_HISTORIC_ENTRIES in parts:
             logger.info("Fix invalid historic entries")
 
-            update_historic_trades(
+            # Shared so that the sync check reuses what was fetched to decide what to refetch
+            comparer = KplerTradeComparer()
+
+            historic_checks = update_historic_trades(
                 origin_iso2s=origin_iso2s,
                 date_from=historic_date_from,
                 date_to=historic_date_to,
+                comparer=comparer,
             )
             logger.info("Cleaning outdated entries")
-            clean_outdated_entries()
+            clean_outdated_entries(
+                scopes=[
+                    (origin_iso2, month.start_time.date(), month.end_time.date())
+                    for origin_iso2, check in historic_checks.items()
+                    for month in check.refetched_months
+                ]
+            )
 
             validate_sync(
                 origin_iso2s=origin_iso2s,
                 date_from=historic_date_from,
                 date_to=historic_date_to,
+                comparer=comparer,
+                historic_checks=historic_checks,
             )
 
         return UpdateStatus.SUCCESS
@@ -122,12 +141,34 @@ def update(
         return UpdateStatus.FAILED
 
 
+def get_months_scopes(*, origin_iso2s, date_from, date_to):
+    """
+    (country_iso2, date_from, date_to) scopes covering the whole months `update_trades` refetches
+    for the given range.
+    """
+    date_from = to_datetime(date_from).date().replace(day=1)
+    date_to = pd.Period(to_datetime(date_to), freq="M").end_time.date()
+    return [(origin_iso2, date_from, date_to) for origin_iso2 in origin_iso2s]
+
+
+class HistoricCheck(NamedTuple):
+    comparison: pd.DataFrame
+    refetched_months: list[pd.Period]
+
+
 def update_historic_trades(
     *,
     origin_iso2s,
     date_from,
     date_to,
-):
+    comparer=None,
+) -> dict[str, HistoricCheck]:
+    """
+    Compare historic trades to Kpler live flows and refetch the months with problems.
+
+    :return: for each origin, the comparison made before refetching and the months that were
+    refetched, so that `validate_sync` only has to re-check those months.
+    """
 
     date_from = to_datetime(date_from).date() if date_from is not None else dt.date(2021, 1, 1)
     date_to = (
@@ -140,7 +181,8 @@ def update_historic_trades(
 
     logger.info("Checking for invalid historic entries")
 
-    comparer = KplerTradeComparer()
+    comparer = comparer or KplerTradeComparer()
+    historic_checks = {}
 
     for origin_iso2 in origin_iso2s:
 
@@ -171,12 +213,26 @@ def update_historic_trades(
                     update_time=update_time,
                 )
 
+        historic_checks[origin_iso2] = HistoricCheck(
+            comparison=comparison, refetched_months=list(failed_months)
+        )
+
+    return historic_checks
+
 
 def validate_sync(
     origin_iso2s=None,
     date_from=None,
     date_to=None,
+    comparer=None,
+    historic_checks: dict[str, HistoricCheck] = None,
 ):
+    """
+    Compare trades to Kpler live flows and record the result in the sync history.
+
+    When `historic_checks` are given (see `update_historic_trades`) for the same date range,
+    their comparisons are reused and only the refetched months are compared again.
+    """
 
     date_from = to_datetime(date_from).date() if date_from is not None else dt.date(2021, 1, 1)
     date_to = (
@@ -184,21 +240,57 @@ def validate_sync(
         if date_to is not None
         else dt.date.today() - dt.timedelta(days=1)
     )
-    comparer = KplerTradeComparer()
+    comparer = comparer or KplerTradeComparer()
+    historic_checks = historic_checks or {}
     checked_time = dt.datetime.now()
     for origin_iso2 in origin_iso2s:
 
-        comparison = comparer.compare_to_live_flows(
+        if origin_iso2 in historic_checks:
+            comparison = recheck_refetched_months(
+                comparer,
+                origin_iso2=origin_iso2,
+                historic_check=historic_checks[origin_iso2],
+                date_from=date_from,
+                date_to=date_to,
+                checked_time=checked_time,
+            )
+        else:
+            comparison = comparer.compare_to_live_flows(
+                origin_iso2=origin_iso2,
+                date_from=date_from,
+                date_to=date_to,
+                checked_time=checked_time,
+            )
+
+        update_sync_history_with_status(
             origin_iso2=origin_iso2,
             date_from=date_from,
             date_to=date_to,
+            comparison=comparison,
             checked_time=checked_time,
         )
 
-        update_sync_history_with_status(
+
+def recheck_refetched_months(
+    comparer, *, origin_iso2, historic_check, date_from, date_to, checked_time
+):
+    comparison = historic_check.comparison
+    if not historic_check.refetched_months:
+        return comparison
+
+    rechecked = [
+        comparer.compare_to_live_flows(
             origin_iso2=origin_iso2,
-            date_from=date_from,
-            date_to=date_to,
-            comparison=comparison,
+            date_from=max(month.start_time.date(), date_from),
+            date_to=min(month.end_time.date(), date_to),
             checked_time=checked_time,
         )
+        for month in historic_check.refetched_months
+    ]
+
+    was_refetched = (
+        comparison["departure_day"].dt.to_period("M").isin(historic_check.refetched_months)
+    )
+    return pd.concat([comparison[~was_refetched], *rechecked], ignore_index=True).sort_values(
+        "departure_day"
+    )
@@ -2,10 +2,13 @@ import datetime as dt
 import logging
 import os
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
 
 from base.utils import to_datetime
 from base import UNKNOWN_COUNTRY
 from base.db import session
+from base.env import get_env
 from base.logger import logger, logger_slack
 import pandas as pd
 from tqdm import tqdm
@@ -16,6 +19,8 @@ from . import KplerScraper
 from . import KplerFlowScraper
 from .upload import upload_flows
 
+KPLER_FLOW_MAX_WORKERS = int(get_env("KPLER_FLOW_MAX_WORKERS", 4))
+
 
 def update_flow_is_valid():
     # Read sql from 'update_is_valid.sql'
@@ -82,6 +87,86 @@ def get_to_zones(
         return zones_unique
 
 
+class FlowLeaf(NamedTuple):
+    """
+    A single `get_flows` request of the crawl. `to_zone` is None for the total flows of
+    `from_zone`, from which the unknown destinations are computed.
+    """
+
+    origin_iso2: str
+    from_split: FlowsSplit
+    from_zone: dict
+    to_split: FlowsSplit
+    to_zone: dict | None
+
+
+def plan_flow_leaves(
+    scraper, executor, origin_iso2s, from_splits, to_splits, add_unknown
+) -> list[FlowLeaf]:
+    """
+    List all the leaf requests of the crawl, grouped by from_zone (and in crawl order).
+    The listings of from and to zones are themselves requested through `executor`.
+    """
+    from_keys = [
+        (origin_iso2, from_split) for origin_iso2 in origin_iso2s for from_split in from_splits
+    ]
+    from_zones = executor.map(
+        lambda key: get_from_zones(scraper=scraper, product=None, origin_iso2=key[0], split=key[1]),
+        from_keys,
+    )
+
+    to_keys = [
+        (origin_iso2, from_split, from_zone, to_split)
+        for (origin_iso2, from_split), zones in zip(from_keys, from_zones)
+        for from_zone in zones
+        for to_split in to_splits
+    ]
+    to_zones = executor.map(
+        lambda key: get_to_zones(scraper=scraper, from_zone=key[2], split=key[3], product=None),
+        to_keys,
+    )
+
+    leaves = []
+    for (origin_iso2, from_split, from_zone, to_split), zones in zip(to_keys, to_zones):
+        leaves += [FlowLeaf(origin_iso2, from_split, from_zone, to_split, x) for x in zones]
+        if add_unknown:
+            leaves.append(FlowLeaf(origin_iso2, from_split, from_zone, to_split, None))
+    return leaves
+
+
+def get_unknown_flows(total, df_zones, origin_iso2, from_zone):
+    """
+    The flows of `total` not accounted for by the flows to known zones `df_zones`,
+    attributed to UNKNOWN_COUNTRY.
+    """
+    if len(df_zones) == 0:
+        logger.warning("No flows found for %s", from_zone)
+        return None
+
+    known_zones = pd.concat(df_zones)
+    known_zones_total = known_zones.groupby(["date", "product"]).value.sum().reset_index()
+    if total is None:
+        raise ValueError(
+            "No total flows found for %s | %s",
+            origin_iso2,
+            from_zone,
+        )
+
+    unknown = total.merge(
+        known_zones_total,
+        on=["product", "date"],
+        how="left",
+        suffixes=("", "_byzone"),
+    )
+    unknown["value_byzone"] = unknown["value_byzone"].fillna(0)
+    unknown["value_unknown"] = unknown["value"] - unknown["value_byzone"]
+    unknown = unknown[unknown["value_unknown"] > 0]
+    unknown["to_zone_name"] = UNKNOWN_COUNTRY
+    unknown["value"] = unknown["value_unknown"]
+    unknown["updated_on"] = dt.datetime.now()
+    return unknown[known_zones.columns]
+
+
 def update_flows(
     date_from=None,
     date_to=None,
@@ -93,95 +178,78 @@ def update_flows(
     # add_total_installation=True,
     add_unknown=True,
     add_unknown_only=False,
+    max_workers=KPLER_FLOW_MAX_WORKERS,
 ):
+    """
+    Crawl Kpler flows origin -> from_zone -> to_zone and upload them.
+
+    All the leaf requests are planned first, then run by a pool of `max_workers` threads
+    (which all go through the rate limit of the shared Kpler client). Flows are uploaded
+    in one batch per from_zone, once all its leaves are in, along with the unknown residual.
+    """
     scraper = KplerFlowScraper()
     date_from = to_datetime(date_from) if date_from is not None else to_datetime("2013-01-01")
     date_to = to_datetime(date_to) if date_to is not None else dt.date.today()
 
-    with logging_redirect_tqdm(loggers=[logging.root]), warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-
-        for origin_iso2 in tqdm(origin_iso2s, unit="origin", leave=False):
-            logger.info(f"Updating flows for  {origin_iso2}")
-            for from_split in tqdm(from_splits, unit="from-splits", leave=False):
-                from_zones = get_from_zones(
-                    scraper=scraper,
-                    product=None,
-                    origin_iso2=origin_iso2,
-                    split=from_split,
-                )
-
-                for from_zone in tqdm(from_zones, unit="from-zone", leave=False):
-                    for to_split in tqdm(to_splits, unit="to-splits", leave=False):
-                        to_zones = get_to_zones(
-                            scraper=scraper,
-                            from_zone=from_zone,
-                            split=to_split,
-                            product=None,
-                        )
+    def get_leaf_flows(leaf: FlowLeaf):
+        return scraper.get_flows(
+            origin_iso2=leaf.origin_iso2,
+            date_from=date_from,
+            date_to=date_to,
+            from_zone=leaf.from_zone,
+            from_split=leaf.from_split,
+            to_zone=leaf.to_zone,
+            to_split=leaf.to_split,
+            split=FlowsSplit.Grades,
+        )
 
-                        df_zones = []
-                        for to_zone in tqdm(to_zones, unit="to-zone", leave=False):
-                            df = scraper.get_flows(
-                                origin_iso2=origin_iso2,
-                                date_from=date_from,
-                                date_to=date_to,
-                                from_zone=from_zone,
-                                from_split=from_split,
-                                to_zone=to_zone,
-                                to_split=to_split,
-                                split=FlowsSplit.Grades,
-                            )
-                            if df is not None:
-                                df_zones.append(df)
-                            if not add_unknown_only:
-                                upload_flows(df)
-
-                        if add_unknown:
-                            # Add an unknown one
-                            total = scraper.get_flows(
-                                origin_iso2=origin_iso2,
-                                date_from=date_from,
-                                date_to=date_to,
-                                from_zone=from_zone,
-                                from_split=from_split,
-                                to_zone=None,
-                                to_split=to_split,
-                                split=FlowsSplit.Grades,
-                            )
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        with logging_redirect_tqdm(loggers=[logging.root]), warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+
+            leaves = plan_flow_leaves(
+                scraper=scraper,
+                executor=executor,
+                origin_iso2s=origin_iso2s,
+                from_splits=from_splits,
+                to_splits=to_splits,
+                add_unknown=add_unknown,
+            )
+            logger.info(f"Updating flows for {origin_iso2s}: {len(leaves)} requests")
+
+            # Leaves are submitted in crawl order, so from_zones complete roughly in order too
+            jobs_by_from_zone = {}
+            for leaf in leaves:
+                key = (leaf.origin_iso2, leaf.from_split, leaf.from_zone["id"])
+                job = (leaf, executor.submit(get_leaf_flows, leaf))
+                jobs_by_from_zone.setdefault(key, []).append(job)
+
+            for key in tqdm(list(jobs_by_from_zone), unit="from-zone", leave=False):
+                # Popped so that results are released once uploaded
+                jobs = jobs_by_from_zone.pop(key)
+                origin_iso2, from_zone = jobs[0][0].origin_iso2, jobs[0][0].from_zone
+                flows = []
+                for to_split in dict.fromkeys(leaf.to_split for leaf, _ in jobs):
+                    split_jobs = [(leaf, f) for leaf, f in jobs if leaf.to_split == to_split]
+                    df_zones = [
+                        df
+                        for leaf, future in split_jobs
+                        if leaf.to_zone is not None and (df := future.result()) is not None
+                    ]
+                    if not add_unknown_only:
+                        flows += df_zones
+
+                    if add_unknown:
+                        total = next(f.result() for leaf, f in split_jobs if leaf.to_zone is None)
+                        flows.append(get_unknown_flows(total, df_zones, origin_iso2, from_zone))
 
-                            if len(df_zones) == 0:
-                                logger.warning("No flows found for %s", from_zone)
-                            else:
-                                known_zones = pd.concat(df_zones)
-                                known_zones_total = (
-                                    known_zones.groupby(["date", "product"])
-                                    .value.sum()
-                                    .reset_index()
-                                )
-                                if total is None:
-                                    raise ValueError(
-                                        "No total flows found for %s | %s",
-                                        origin_iso2,
-                                        from_zone,
-                                    )
-
-                                unknown = total.merge(
-                                    known_zones_total,
-                                    on=["product", "date"],
-                                    how="left",
-                                    suffixes=("", "_byzone"),
-                                )
-                                unknown["value_byzone"] = unknown["value_byzone"].fillna(0)
-                                unknown["value_unknown"] = (
-                                    unknown["value"] - unknown["value_byzone"]
-                                )
-                                unknown = unknown[unknown["value_unknown"] > 0]
-                                unknown["to_zone_name"] = UNKNOWN_COUNTRY
-                                unknown["value"] = unknown["value_unknown"]
-                                unknown["updated_on"] = dt.datetime.now()
-                                unknown = unknown[known_zones.columns]
-                                upload_flows(unknown)
+                flows = [x for x in flows if x is not None]
+                if flows:
+                    upload_flows(pd.concat(flows))
+    finally:
+        # Don't keep crawling if we stopped early
+        executor.shutdown(wait=True, cancel_futures=True)
 
 
 def update_flows_reverse(
@@ -4,16 +4,10 @@ from requests import session
 from engines.kpler_scraper.scraper import KplerScraper
 from engines.kpler_scraper.upload import update_zone_areas, upload_zones
 
-import ast
-
-
-import country_converter as coco
 
 from base.utils import latlon_to_point
 from base.models.kpler import KplerZone
 
-cc = coco.CountryConverter()
-
 
 def update_zones():
     scraper = KplerScraper()
@@ -86,18 +80,19 @@ def update_zones():
 
 
 def attach_geo_info(zones):
-    zones["geo"] = zones["geo"].replace({np.nan: None})
-    zones["geo"] = zones.apply(
-        lambda zone: ast.literal_eval(zone["geo"]) if zone["geo"] is not None else None, axis=1
-    )
     zones["geo"] = zones["geo"].apply(
-        lambda geom: latlon_to_point(lat=geom["lat"], lon=geom["lon"]) if geom is not None else None
+        lambda geom: (
+            latlon_to_point(lat=geom["lat"], lon=geom["lon"]) if isinstance(geom, dict) else None
+        )
     )
     zones["geometry"] = zones["geo"]
     return zones
 
 
 def attach_country_info(zones):
+    import country_converter as coco
+
+    cc = coco.CountryConverter()
     zones = zones.assign(
         country_id=zones.parentZones.apply(extract(["country", "country_checkpoint"], "id")),
         country_name=zones.parentZones.apply(extract(["country", "country_checkpoint"], "name")),
@@ -142,8 +137,8 @@ def parse_parent_zones(zone):
     :return:
     """
 
-    dicts = ast.literal_eval(zone["parentZones"])
-    return dicts
+    parent_zones = zone["parentZones"]
+    return parent_zones if isinstance(parent_zones, list) else []
 
 
 def extract(types, key):
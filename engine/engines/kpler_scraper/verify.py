@@ -10,7 +10,7 @@ from base.models import DB_TABLE_KPLER_SYNC_COMPARISON_DETAILS
 
 from engines.kpler_scraper.scraper_flow import KplerFlowScraper
 
-from sqlalchemy import func
+from sqlalchemy import func, select, tuple_
 from sqlalchemy.orm import aliased
 
 import pandas as pd
@@ -25,16 +25,24 @@ ALLOWED_PROBLEMS_PER_DAY = 3
 class KplerTradeComparer:
     def __init__(self):
         self.scraper = KplerFlowScraper()
+        # Kpler flows already fetched, keyed by (origin_iso2, date_from, date_to, split)
+        self.flows_cache = {}
 
     def compare_to_live_flows(
         self, origin_iso2=None, date_from=None, date_to=None, checked_time=dt.datetime.now()
     ):
 
-        comparison_per_dest = self.compare_to_live_flows_for_dest(origin_iso2, date_from, date_to)
-        comparison_per_product = self.compare_to_live_flows_for_product(
+        actual_per_dest, actual_per_product = self.get_grouped_trades(
             origin_iso2, date_from, date_to
         )
 
+        comparison_per_dest = self.compare_to_live_flows_for_dest(
+            origin_iso2, date_from, date_to, actual=actual_per_dest
+        )
+        comparison_per_product = self.compare_to_live_flows_for_product(
+            origin_iso2, date_from, date_to, actual=actual_per_product
+        )
+
         self.update_sync_comparison_details(
             origin_iso2=origin_iso2,
             comparison_details=self.combine_comparison_details(
@@ -95,141 +103,143 @@ class KplerTradeComparer:
 
         session.commit()
 
-    def compare_to_live_flows_for_dest(self, origin_iso2, date_from, date_to):
+    def compare_to_live_flows_for_dest(self, origin_iso2, date_from, date_to, actual=None):
 
         logger.info(f"Comparing {origin_iso2} from {date_from} to {date_to} by destination")
 
-        flows_from_kpler = self.scraper.get_flows(
-            origin_iso2=origin_iso2,
-            granularity=FlowsPeriod.Daily,
-            unit=FlowsMeasurementUnit.T,
-            date_from=date_from,
-            date_to=date_to,
-            split=FlowsSplit.DestinationCountries,
+        flows_from_kpler = self.get_flows_from_kpler(
+            origin_iso2, date_from, date_to, FlowsSplit.DestinationCountries
         )[["date", "to_iso2", "value"]]
 
-        departure_day = func.date_trunc("day", KplerTrade.departure_date_utc).label("departure_day")
-
-        destination_zone = aliased(KplerZone)
-        origin_zone = aliased(KplerZone)
-
-        grouped_trades_query = (
-            session.query(
-                departure_day,
-                destination_zone.country_iso2,
-                func.sum(KplerTrade.value_tonne).label("value_tonne"),
-            )
-            .outerjoin(
-                origin_zone,
-                KplerTrade.departure_zone_id == origin_zone.id,
-            )
-            .outerjoin(
-                destination_zone,
-                KplerTrade.arrival_zone_id == destination_zone.id,
-            )
-            .filter(
-                origin_zone.country_iso2 == origin_iso2,
-                departure_day >= date_from,
-                departure_day <= date_to,
-                KplerTrade.is_valid == True,
-            )
-            .group_by(departure_day, destination_zone.country_iso2)
-        )
-
-        actual = pd.read_sql(grouped_trades_query.statement, session.bind)
-        actual.country_iso2 = actual.country_iso2.fillna("unknown")
+        if actual is None:
+            actual, _ = self.get_grouped_trades(origin_iso2, date_from, date_to)
 
         expected = flows_from_kpler.rename(
             columns={"date": "departure_day", "to_iso2": "country_iso2", "value": "value_tonne"}
         )
         expected.country_iso2 = expected.country_iso2.fillna("unknown")
 
-        # Using pandas, merge actual and expected
-        comparison = pd.merge(
-            expected,
-            actual,
-            on=["departure_day", "country_iso2"],
-            how="outer",
-            suffixes=(".expected", ".actual"),
-        )
+        return self._compare(expected, actual, "country_iso2", date_from, date_to)
 
-        departure_date = pd.to_datetime(comparison["departure_day"]).dt.date
-        comparison = comparison[(departure_date >= date_from) & (departure_date <= date_to)]
+    def compare_to_live_flows_for_product(self, origin_iso2, date_from, date_to, actual=None):
 
-        expected_as_floats = np.array(comparison["value_tonne.expected"], dtype=float)
-        actual_as_floats = np.array(comparison["value_tonne.actual"], dtype=float)
+        logger.info(f"Comparing {origin_iso2} from {date_from} to {date_to} by product")
 
-        not_close = ~np.isclose(
-            expected_as_floats,
-            actual_as_floats,
-            rtol=TOLERANCE_FOR_VALUE_ERROR,
-            atol=ABSOLUTE_TOLERANCE_FOR_VALUE_ERROR,
-        )
+        flows_from_kpler = self.get_flows_from_kpler(
+            origin_iso2, date_from, date_to, FlowsSplit.Products
+        )[["date", "group", "family", "value"]]
 
-        comparison["problems"] = not_close
+        flows_from_kpler["product"] = flows_from_kpler.group.combine_first(flows_from_kpler.family)
 
-        return comparison
+        flows_from_kpler = flows_from_kpler[["date", "product", "value"]]
 
-    def compare_to_live_flows_for_product(self, origin_iso2, date_from, date_to):
+        if actual is None:
+            _, actual = self.get_grouped_trades(origin_iso2, date_from, date_to)
 
-        logger.info(f"Comparing {origin_iso2} from {date_from} to {date_to} by product")
+        expected = (
+            flows_from_kpler[pd.notnull(flows_from_kpler["product"])]
+            .rename(columns={"date": "departure_day", "value": "value_tonne"})
+            .groupby(["departure_day", "product"])
+            .aggregate({"value_tonne": "sum"})
+            .reset_index()
+        )
 
-        flows_from_kpler = self.scraper.get_flows(
+        return self._compare(expected, actual, "product", date_from, date_to)
+
+    def get_flows_from_kpler(self, origin_iso2, date_from, date_to, split):
+        """
+        Daily flows in tonnes from `origin_iso2`, split by `split`.
+
+        Kpler is only queried once per (origin, date range, split) for the lifetime of the
+        comparer: later requests for the same range, or for a range within one already
+        fetched (e.g. re-checking a refetched month), are served from memory.
+        """
+        for (cached_iso2, cached_from, cached_to, cached_split), flows in self.flows_cache.items():
+            if (
+                cached_iso2 == origin_iso2
+                and cached_split == split
+                and cached_from <= date_from
+                and date_to <= cached_to
+            ):
+                if flows is None:
+                    return None
+                flow_date = flows["date"].dt.date
+                return flows[(flow_date >= date_from) & (flow_date <= date_to)].copy()
+
+        flows = self.scraper.get_flows(
             origin_iso2=origin_iso2,
             granularity=FlowsPeriod.Daily,
             unit=FlowsMeasurementUnit.T,
             date_from=date_from,
             date_to=date_to,
-            split=FlowsSplit.Products,
-        )[["date", "group", "family", "value"]]
-
-        flows_from_kpler["product"] = flows_from_kpler.group.combine_first(flows_from_kpler.family)
+            split=split,
+        )
+        self.flows_cache[(origin_iso2, date_from, date_to, split)] = flows
+        return flows.copy() if flows is not None else None
 
-        flows_from_kpler = flows_from_kpler[["date", "product", "value"]]
+    def get_grouped_trades(self, origin_iso2, date_from, date_to):
+        """
+        Valid trades departing from `origin_iso2`, summed per departure day and destination
+        country, and per departure day and product.
 
-        departure_day = func.date_trunc("day", KplerTrade.departure_date_utc).label("departure_day")
-        product = func.coalesce(KplerProduct.group_name, KplerProduct.family_name).label("product")
+        Both groupings come from a single scan of the trades, using GROUPING SETS.
 
-        origin_zone = aliased(KplerZone)
+        :return: a tuple of two dataframes, with columns (departure_day, country_iso2,
+        value_tonne) and (departure_day, product, value_tonne)
+        """
+        departure_day = func.date_trunc("day", KplerTrade.departure_date_utc)
+        destination_zone = aliased(KplerZone)
+        country_iso2 = destination_zone.country_iso2
+        product = func.coalesce(KplerProduct.group_name, KplerProduct.family_name)
 
         grouped_trades_query = (
             session.query(
-                departure_day,
-                product,
+                departure_day.label("departure_day"),
+                country_iso2.label("country_iso2"),
+                product.label("product"),
+                func.grouping(country_iso2).label("is_product_grouping"),
                 func.sum(KplerTrade.value_tonne).label("value_tonne"),
             )
             .outerjoin(
-                origin_zone,
-                KplerTrade.departure_zone_id == origin_zone.id,
+                destination_zone,
+                KplerTrade.arrival_zone_id == destination_zone.id,
             )
             .outerjoin(
                 KplerProduct,
                 KplerTrade.product_id == KplerProduct.id,
             )
             .filter(
-                origin_zone.country_iso2 == origin_iso2,
-                departure_day >= date_from,
-                departure_day <= date_to,
+                *self._trades_departing_filter(origin_iso2, date_from, date_to),
                 KplerTrade.is_valid == True,
             )
-            .group_by(departure_day, product)
+            .group_by(
+                func.grouping_sets(
+                    tuple_(departure_day, country_iso2),
+                    tuple_(departure_day, product),
+                )
+            )
         )
 
-        actual = pd.read_sql(grouped_trades_query.statement, session.bind)
+        grouped = pd.read_sql(grouped_trades_query.statement, session.bind)
+        is_product_grouping = grouped.is_product_grouping == 1
 
-        expected = (
-            flows_from_kpler[pd.notnull(flows_from_kpler["product"])]
-            .rename(columns={"date": "departure_day", "value": "value_tonne"})
-            .groupby(["departure_day", "product"])
-            .aggregate({"value_tonne": "sum"})
-            .reset_index()
-        )
+        actual_per_dest = grouped.loc[
+            ~is_product_grouping, ["departure_day", "country_iso2", "value_tonne"]
+        ].reset_index(drop=True)
+        actual_per_dest.country_iso2 = actual_per_dest.country_iso2.fillna("unknown")
+
+        actual_per_product = grouped.loc[
+            is_product_grouping, ["departure_day", "product", "value_tonne"]
+        ].reset_index(drop=True)
 
+        return actual_per_dest, actual_per_product
+
+    def _compare(self, expected, actual, factor, date_from, date_to):
         # Using pandas, merge actual and expected
         comparison = pd.merge(
             expected,
             actual,
-            on=["departure_day", "product"],
+            on=["departure_day", factor],
             how="outer",
             suffixes=(".expected", ".actual"),
         )
@@ -251,6 +261,21 @@ class KplerTradeComparer:
 
         return comparison
 
+    def _trades_departing_filter(self, origin_iso2, date_from, date_to):
+        """
+        Trades departing from `origin_iso2` between `date_from` and `date_to` (both included).
+
+        The dates are compared to the raw departure timestamp as a half-open range, rather than
+        truncating it to the day, so that Postgres can use the (departure_zone_id,
+        departure_date_utc) index.
+        """
+        origin_zone_ids = select(KplerZone.id).where(KplerZone.country_iso2 == origin_iso2)
+        return [
+            KplerTrade.departure_zone_id.in_(origin_zone_ids),
+            KplerTrade.departure_date_utc >= to_datetime(date_from),
+            KplerTrade.departure_date_utc < to_datetime(date_to) + dt.timedelta(days=1),
+        ]
+
     def _aggregate_to_check_period(self, comparison):
         return (
             comparison.groupby("departure_day")
@@ -0,0 +1,290 @@
+import re
+from collections import defaultdict
+from typing import Optional
+
+import sqlalchemy as sa
+from unidecode import unidecode
+
+from base.db import session
+from base.logger import logger
+from base.models import Company
+
+# Minimum trigram similarity (Dice coefficient) for two names to be considered the same company
+NEAR_MATCH_THRESHOLD = 0.8
+
+
+def normalise_company_name(name: str) -> str:
+    """
+    Normalise a company name for comparison: ascii, lower case, punctuation replaced by
+    spaces and whitespace collapsed, e.g. "Sovcomflot  P.J.S.C." -> "sovcomflot p j s c".
+    """
+    if name is None:
+        return ""
+    name = unidecode(name).lower()
+    name = re.sub(r"[^a-z0-9]+", " ", name)
+    return name.strip()
+
+
+def trigrams(normalised_name: str) -> set[str]:
+    padded = f"  {normalised_name} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def trigram_similarity(trigrams_a: set[str], trigrams_b: set[str]) -> float:
+    if not trigrams_a or not trigrams_b:
+        return 0.0
+    return 2 * len(trigrams_a & trigrams_b) / (len(trigrams_a) + len(trigrams_b))
+
+
+class CompanyResolver:
+    """
+    In-memory resolver from company names (and optionally IMOs) to company ids.
+
+    It keeps:
+    - a hash index on raw names and on normalised names, for exact hits;
+    - a trigram index on normalised names, for near matches;
+    - an index on company IMOs, to detect conflicts before trying to insert.
+
+    The indexes are loaded on first use and then refreshed incrementally with the companies
+    created since (by id), so that a run only scans the company table once.
+    """
+
+    def __init__(self, near_match_threshold: float = NEAR_MATCH_THRESHOLD):
+        self.near_match_threshold = near_match_threshold
+        self.reset()
+
+    def reset(self):
+        """
+        Forget everything: the next lookup reloads the whole company table. Needed after
+        a rollback, as the indexes could hold companies that no longer exist.
+        """
+        self.max_id = None
+        self.ids_by_name: dict[str, list[tuple[int, str]]] = defaultdict(list)
+        self.ids_by_normalised_name: dict[str, list[tuple[int, str]]] = defaultdict(list)
+        self.companies_by_imo: dict[str, tuple[int, str]] = {}
+        self.entries: list[tuple[set[str], int, str]] = []
+        self.entries_by_trigram: dict[str, set[int]] = defaultdict(set)
+        self.entries_by_company: dict[int, list[int]] = defaultdict(list)
+
+    def refresh(self):
+        query = session.query(Company.id, Company.imo, Company.name, Company.names)
+        full_load = self.max_id is None
+        if not full_load:
+            query = query.filter(Company.id > self.max_id)
+
+        n_loaded = 0
+        for company_id, imo, name, names in query:
+            self.add(company_id, imo, name, names or [name])
+            n_loaded += 1
+
+        if full_load:
+            self.max_id = self.max_id or 0
+            logger.info(f"Loaded {n_loaded} companies in resolver")
+
+    def add(self, company_id, imo, name, names):
+        for company_name in set(names):
+            self.ids_by_name[company_name].append((company_id, imo))
+
+            normalised_name = normalise_company_name(company_name)
+            self.ids_by_normalised_name[normalised_name].append((company_id, imo))
+
+            entry_idx = len(self.entries)
+            name_trigrams = trigrams(normalised_name)
+            self.entries.append((name_trigrams, company_id, imo))
+            self.entries_by_company[company_id].append(entry_idx)
+            for trigram in name_trigrams:
+                self.entries_by_trigram[trigram].add(entry_idx)
+
+        if imo is not None:
+            self.companies_by_imo[imo] = (company_id, name)
+
+        self.max_id = max(self.max_id or 0, company_id)
+
+    def _ensure_loaded(self):
+        if self.max_id is None:
+            self.refresh()
+
+    def find(self, raw_name, imo=None) -> Optional[int]:
+        """
+        Exact match: same raw name, or failing that same normalised name, and same IMO when
+        one is given.
+        """
+        self._ensure_loaded()
+
+        for index, key in [
+            (self.ids_by_name, raw_name),
+            (self.ids_by_normalised_name, normalise_company_name(raw_name)),
+        ]:
+            for company_id, company_imo in index.get(key, []):
+                if imo is None or company_imo == imo:
+                    return company_id
+        return None
+
+    def find_near(self, raw_name, imo=None) -> Optional[int]:
+        """
+        Near match: the company with a name closest to `raw_name` in trigram similarity,
+        provided it reaches the threshold. When an IMO is given, only the company with that
+        IMO is considered.
+        """
+        self._ensure_loaded()
+
+        name_trigrams = trigrams(normalise_company_name(raw_name))
+
+        if imo is not None:
+            if imo not in self.companies_by_imo:
+                return None
+            company_id, _ = self.companies_by_imo[imo]
+            candidates = self.entries_by_company[company_id]
+        else:
+            candidates = set()
+            for trigram in name_trigrams:
+                candidates |= self.entries_by_trigram.get(trigram, set())
+
+        best_id, best_similarity = None, 0.0
+        for entry_idx in candidates:
+            entry_trigrams, company_id, _ = self.entries[entry_idx]
+            similarity = trigram_similarity(name_trigrams, entry_trigrams)
+            if similarity > best_similarity:
+                best_id, best_similarity = company_id, similarity
+
+        if best_similarity >= self.near_match_threshold:
+            return best_id
+        return None
+
+    def resolve(
+        self, names: list[str], imos: Optional[list[str]] = None, allow_near: bool = False
+    ) -> list[Optional[int]]:
+        """
+        Resolve many names at once, without creating companies.
+
+        :param names: raw company names
+        :param imos: optional company IMOs, aligned with names (None for unknown)
+        :param allow_near: whether to fall back to near matches for names without exact hit
+        :return: company ids aligned with names, None when not found
+        """
+        self.refresh()
+
+        if imos is None:
+            imos = [None] * len(names)
+
+        resolved = {}
+        company_ids = []
+        for raw_name, imo in zip(names, imos):
+            key = (raw_name, imo)
+            if key not in resolved:
+                company_id = self.find(raw_name, imo)
+                if company_id is None and allow_near:
+                    company_id = self.find_near(raw_name, imo)
+                resolved[key] = company_id
+            company_ids.append(resolved[key])
+        return company_ids
+
+    def find_or_create(self, raw_name, imo=None, address=None) -> Optional[int]:
+        """
+        Find the company matching `raw_name` (and `imo`), creating it if needed.
+
+        Returns None if the IMO already belongs to a company whose names are not close
+        to `raw_name`.
+        """
+        company_ids = self.find_or_create_many([(raw_name, imo, address)], commit=True)
+        return company_ids[(raw_name, imo)]
+
+    def find_or_create_many(
+        self, companies: list[tuple[str, str, str]], commit: bool = False
+    ) -> dict:
+        """
+        Resolve (raw_name, imo, address) tuples to company ids, creating the missing companies
+        in a single flush (and commit if `commit`).
+
+        Returns a dict keyed by (raw_name, imo).
+        """
+        self._ensure_loaded()
+
+        company_ids = {}
+        to_create = {}
+
+        for raw_name, imo, address in companies:
+            key = (raw_name, imo)
+            if key in company_ids or key in to_create:
+                continue
+
+            company_id = self.find(raw_name, imo)
+            if company_id is not None:
+                company_ids[key] = company_id
+            elif imo is not None and imo in self.companies_by_imo:
+                company_ids[key] = self._match_existing_imo(raw_name, imo)
+            else:
+                to_create[key] = Company(
+                    imo=imo,
+                    name=raw_name,
+                    names=[raw_name],
+                    address=address,
+                    addresses=[address],
+                )
+
+        if not to_create:
+            return company_ids
+
+        try:
+            with session.begin_nested():
+                session.add_all(to_create.values())
+                session.flush()
+            for (raw_name, imo), company in to_create.items():
+                self.add(company.id, imo, raw_name, [raw_name])
+                company_ids[(raw_name, imo)] = company.id
+        except sa.exc.IntegrityError:
+            # Most likely created by another process since we last refreshed:
+            # catch up and create the remaining ones one at a time.
+            self.refresh()
+            for (raw_name, imo), company in to_create.items():
+                company_ids[(raw_name, imo)] = self._find_or_create_one(
+                    raw_name, imo, company.address
+                )
+
+        if commit:
+            session.commit()
+
+        return company_ids
+
+    def _find_or_create_one(self, raw_name, imo, address) -> Optional[int]:
+        company_id = self.find(raw_name, imo)
+        if company_id is not None:
+            return company_id
+        if imo is not None and imo in self.companies_by_imo:
+            return self._match_existing_imo(raw_name, imo)
+
+        company = Company(
+            imo=imo,
+            name=raw_name,
+            names=[raw_name],
+            address=address,
+            addresses=[address],
+        )
+        try:
+            with session.begin_nested():
+                session.add(company)
+                session.flush()
+        except sa.exc.IntegrityError:
+            logger.warning("Failed to create company %s (IMO=%s)" % (raw_name, imo))
+            return None
+
+        self.add(company.id, imo, raw_name, [raw_name])
+        return company.id
+
+    def _match_existing_imo(self, raw_name, imo) -> Optional[int]:
+        company_id = self.find_near(raw_name, imo=imo)
+        if company_id is None:
+            _, existing_name = self.companies_by_imo[imo]
+            logger.warning("Inconsistency: %s != %s (IMO=%s)" % (existing_name, raw_name, imo))
+        return company_id
+
+
+global_company_resolver: CompanyResolver | None = None
+
+
+# Single resolver per application: the indexes are expensive to build but cheap to refresh.
+def get_company_resolver() -> CompanyResolver:
+    global global_company_resolver
+    if global_company_resolver is None:
+        global_company_resolver = CompanyResolver()
+    return global_company_resolver
@@ -1,9 +1,6 @@
 import datetime as dt
-from sqlalchemy import func
 from sqlalchemy import nullslast
-import sqlalchemy as sa
 from sqlalchemy.exc import IntegrityError
-from difflib import SequenceMatcher
 
 import base
 import json
@@ -16,12 +13,13 @@ from base.models import (
     ShipOwner,
     ShipManager,
     ShipFlag,
-    Company,
     Ship,
 )
 
 import country_converter as coco
 
+from .company_resolver import get_company_resolver
+
 
 def update_ship_core_details(imo, equasis_infos):
 
@@ -399,6 +397,9 @@ def find_or_create_company_id(raw_name, imo=None, address=None):
     The function checks whether we have a company which matches the name or exactly and has same imo, if not
     we attempt to create a record, and if there is imo conflict we double-check name similarity is close
 
+    Lookups go through the shared in-memory `CompanyResolver` rather than scanning the company
+    table every time.
+
     Parameters
     ----------
     raw_name : name of the company
@@ -409,39 +410,4 @@ def find_or_create_company_id(raw_name, imo=None, address=None):
     -------
 
     """
-    company_sq = session.query(
-        Company.id, Company.imo, func.unnest(Company.names).label("name")
-    ).subquery()
-    existing_company = (
-        session.query(company_sq)
-        .filter(company_sq.c.name == raw_name, sa.or_(imo is None, company_sq.c.imo == imo))
-        .first()
-    )
-
-    if existing_company:
-        company_id = existing_company.id
-    else:
-        new_company = Company(
-            imo=imo,
-            name=raw_name,
-            names=[raw_name],
-            address=address,
-            addresses=[address],
-        )
-        session.add(new_company)
-        try:
-            session.commit()
-            company_id = new_company.id
-        except sa.exc.IntegrityError:
-            session.rollback()
-            existing_company = session.query(Company).filter(Company.imo == imo).first()
-            ratio = SequenceMatcher(None, existing_company.name, raw_name).ratio()
-            if ratio > 0.9:
-                company_id = existing_company.id
-            else:
-                logger.warning(
-                    "Inconsistency: %s != %s (IMO=%s)" % (existing_company.name, raw_name, imo)
-                )
-                company_id = None
-
-    return company_id
+    return get_company_resolver().find_or_create(raw_name, imo=imo, address=address)
@@ -0,0 +1,383 @@
+import datetime as dt
+import json
+from collections import defaultdict
+
+import sqlalchemy as sa
+
+import base
+from base.db import session
+from base.encoder import JsonEncoder
+from base.logger import logger
+from base.models import (
+    ShipInsurer,
+    ShipOwner,
+    ShipManager,
+    ShipFlag,
+    Ship,
+)
+
+import country_converter as coco
+
+from .datasource_core_details import update_ship_core_details
+from .company_resolver import CompanyResolver, get_company_resolver
+
+
+class ShipCoreDetailsBatchWriter:
+    """
+    Collects parsed Equasis ship infos and writes them with a handful of queries and a single
+    commit per batch, instead of several lookups and commits per ship.
+
+    Usage:
+        writer = ShipCoreDetailsBatchWriter(batch_size=100)
+        for imo in imos:
+            writer.add(imo, equasis.get_ship_infos(imo))
+        writer.flush()
+    """
+
+    def __init__(self, batch_size=100, company_resolver: CompanyResolver = None):
+        self.batch_size = batch_size
+        self.company_resolver = company_resolver or get_company_resolver()
+        self.pending: list[tuple[str, dict]] = []
+
+    def add(self, imo, equasis_infos):
+        if equasis_infos is None:
+            logger.info("Failed to get response from equasis")
+            return
+
+        self.pending.append((imo, equasis_infos))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        batch, self.pending = self.pending, []
+
+        try:
+            update_ships_core_details(batch, company_resolver=self.company_resolver)
+        except sa.exc.SQLAlchemyError:
+            session.rollback()
+            # The resolver may hold companies that were rolled back
+            self.company_resolver.reset()
+            logger.warning(
+                "Failed to write batch of %d ships, writing them one by one." % (len(batch)),
+                exc_info=True,
+            )
+            for imo, equasis_infos in batch:
+                update_ship_core_details(imo, equasis_infos)
+
+
+def update_ships_core_details(
+    ships: list[tuple[str, dict]], company_resolver: CompanyResolver = None
+):
+    """
+    Batch equivalent of `update_ship_core_details`: updates ship records, insurers, managers,
+    owners and flags for many ships, then commits once.
+
+    :param ships: list of (imo, equasis_infos) tuples
+    :param company_resolver: company resolver, the shared one if not given
+    """
+    ships = [(imo, infos) for imo, infos in ships if infos is not None]
+    if not ships:
+        return
+
+    if company_resolver is None:
+        company_resolver = get_company_resolver()
+
+    imos = list({imo for imo, _ in ships})
+
+    company_ids = company_resolver.find_or_create_many(_collect_companies(ships))
+
+    update_ship_records_with_raw_equasis(ships, imos)
+    update_ships_owners(ships, imos, company_ids)
+    update_ships_managers(ships, imos, company_ids)
+    update_ships_insurers(ships, imos, company_ids)
+    update_flags(ships, imos)
+
+    session.commit()
+
+
+def _collect_companies(ships):
+    companies = []
+    for _, equasis_infos in ships:
+        for role in ["owner", "manager"]:
+            info = equasis_infos.get(role)
+            if info:
+                companies.append((info.get("name"), info.get("imo"), info.get("address")))
+
+        for insurer in equasis_infos.get("insurers") or []:
+            companies.append((insurer.get("name"), None, None))
+
+    # Needed for ships for which we create an unknown insurer
+    companies.append((base.UNKNOWN_INSURER, None, None))
+    return companies
+
+
+def _as_datetime(date):
+    # Equasis gives dates while the database returns datetimes
+    if isinstance(date, dt.date) and not isinstance(date, dt.datetime):
+        return dt.datetime.combine(date, dt.time())
+    return date
+
+
+def update_ship_records_with_raw_equasis(ships, imos):
+    existing_ships = {
+        ship.imo: ship for ship in session.query(Ship).filter(Ship.imo.in_(imos)).all()
+    }
+
+    for imo, equasis_infos in ships:
+        ship = existing_ships.get(imo)
+        if ship is None:
+            ship = Ship(imo=imo)
+            session.add(ship)
+            existing_ships[imo] = ship
+
+        others = dict(ship.others) if ship.others else {}
+        others.update({"equasis": equasis_infos})
+        # To convert datetimes to str
+        ship.others = json.loads(json.dumps(others, cls=JsonEncoder))
+
+
+def update_ships_owners(ships, imos, company_ids):
+    existing_owners = {
+        (owner.company_raw_name, owner.ship_imo, owner.date_from): owner
+        for owner in session.query(ShipOwner).filter(ShipOwner.ship_imo.in_(imos)).all()
+    }
+
+    for imo, equasis_infos in ships:
+        owner_info = equasis_infos.get("owner")
+        if not owner_info:
+            continue
+
+        owner_raw_name = owner_info.get("name")
+        owner_imo = owner_info.get("imo")
+        owner_date_from = owner_info.get("date_from")
+
+        key = (owner_raw_name, imo, owner_date_from)
+        owner = existing_owners.get(key)
+        if not owner:
+            owner = ShipOwner(
+                company_raw_name=owner_raw_name,
+                ship_imo=imo,
+                imo=owner_imo,
+                date_from=owner_date_from,
+                company_id=company_ids.get((owner_raw_name, owner_imo)),
+            )
+
+            # Verify we DID find a matching company_id otherwise we will have an
+            # integrity error
+            if owner.company_id is None:
+                logger.warning(
+                    "Failed to find/create company_id for company {}, ship_imo {}.".format(
+                        owner.company_raw_name, owner.ship_imo
+                    )
+                )
+                continue
+
+            session.add(owner)
+            existing_owners[key] = owner
+
+        owner.updated_on = dt.datetime.now()
+
+
+def update_ships_managers(ships, imos, company_ids):
+    existing_managers = {
+        (manager.company_raw_name, manager.imo, manager.ship_imo, manager.date_from): manager
+        for manager in session.query(ShipManager).filter(ShipManager.ship_imo.in_(imos)).all()
+    }
+
+    for imo, equasis_infos in ships:
+        manager_info = equasis_infos.get("manager")
+        if not manager_info:
+            continue
+
+        manager_raw_name = manager_info.get("name")
+        manager_imo = manager_info.get("imo")
+        manager_date_from = manager_info.get("date_from")
+
+        key = (manager_raw_name, manager_imo, imo, manager_date_from)
+        manager = existing_managers.get(key)
+        if not manager:
+            manager = ShipManager(
+                company_raw_name=manager_raw_name,
+                ship_imo=imo,
+                imo=manager_imo,
+                date_from=manager_date_from,
+                company_id=company_ids.get((manager_raw_name, manager_imo)),
+            )
+            session.add(manager)
+            existing_managers[key] = manager
+
+        manager.updated_on = dt.datetime.now()
+
+
+def update_ships_insurers(ships, imos, company_ids):
+    """
+    Applies the same rules as `update_ship_insurer`, against all insurer records of the
+    batch loaded at once. Records that would break the unique (ship_imo, company_raw_name)
+    constraint are skipped, as the per-ship path does when its commit fails.
+    """
+    insurers_by_ship = defaultdict(list)
+    for insurer in session.query(ShipInsurer).filter(ShipInsurer.ship_imo.in_(imos)).all():
+        insurers_by_ship[insurer.ship_imo].append(insurer)
+
+    def valid_insurers(imo):
+        return [x for x in insurers_by_ship[imo] if x.is_valid]
+
+    def add_insurer(imo, company_raw_name, date_from):
+        if any(x.company_raw_name == company_raw_name for x in insurers_by_ship[imo]):
+            logger.warning("Failed to add insurer %s for ship %s" % (company_raw_name, imo))
+            return None
+
+        company_id = company_ids.get((company_raw_name, None))
+        if company_id is None:
+            logger.warning("Failed to add insurer %s for ship %s" % (company_raw_name, imo))
+            return None
+
+        insurer = ShipInsurer(
+            company_raw_name=company_raw_name,
+            imo=None,
+            ship_imo=imo,
+            company_id=company_id,
+            date_from_equasis=date_from,
+            consecutive_failures=0,
+            is_valid=True,
+        )
+        session.add(insurer)
+        insurers_by_ship[imo].append(insurer)
+        return insurer
+
+    def mark_updated(insurer):
+        insurer.updated_on = dt.datetime.now()
+        insurer.checked_on = dt.datetime.now()
+        insurer.consecutive_failures = 0
+
+    def mark_failed(insurer):
+        insurer.checked_on = dt.datetime.now()
+        insurer.consecutive_failures = (insurer.consecutive_failures or 0) + 1
+
+    def matching_insurer(imo, company_raw_name, date_from):
+        insurers = valid_insurers(imo)
+        if company_raw_name != base.UNKNOWN_INSURER:
+            return next(
+                (
+                    x
+                    for x in insurers
+                    if x.company_raw_name == company_raw_name
+                    and _as_datetime(x.date_from_equasis) == _as_datetime(date_from)
+                ),
+                None,
+            )
+
+        # Only the latest one can match an unknown insurer
+        latest = max(
+            insurers,
+            key=lambda x: (x.date_from_equasis is not None, x.date_from_equasis or dt.datetime.min),
+            default=None,
+        )
+        if latest is not None and latest.company_raw_name == company_raw_name:
+            return latest
+        return None
+
+    for imo, equasis_infos in ships:
+        equasis_insurers = equasis_infos.get("insurers")
+
+        if not equasis_insurers:
+            logger.info("Couldn't find insurers for %s, marking as checked" % (imo))
+            insurers = valid_insurers(imo)
+            insurer = max(
+                insurers,
+                # updated_on can be a NULL expression for unknown insurers not flushed yet
+                key=lambda x: (
+                    isinstance(x.updated_on, dt.datetime),
+                    x.updated_on if isinstance(x.updated_on, dt.datetime) else dt.datetime.min,
+                ),
+                default=None,
+            )
+            if not insurer:
+                insurer = add_insurer(imo, base.UNKNOWN_INSURER, None)
+                if insurer is None:
+                    continue
+                # An explicit NULL: a None would be left out of the INSERT, getting the
+                # server default instead
+                insurer.updated_on = sa.null()
+            mark_failed(insurer)
+            continue
+
+        for equasis_insurer in equasis_insurers:
+            insurer_raw_name = equasis_insurer.get("name")
+            insurer_raw_date_from = (
+                equasis_insurer.get("date_from")
+                if equasis_insurer.get("date_from")
+                else dt.datetime.now()
+            )
+
+            # If it's the first insurer, we enter an empty date_from insurer first.
+            if not valid_insurers(imo):
+                first_insurer = add_insurer(imo, insurer_raw_name, None)
+                if first_insurer is not None:
+                    mark_updated(first_insurer)
+
+            insurer = matching_insurer(imo, insurer_raw_name, insurer_raw_date_from)
+
+            insurer_already_exists = bool(insurer)
+            consecutive_unknowns = (
+                insurer_already_exists
+                and insurer.company_raw_name == base.UNKNOWN_INSURER
+                and insurer_raw_name == base.UNKNOWN_INSURER
+            )
+            would_overwrite_null_date_from = (
+                insurer_already_exists and insurer.date_from_equasis == None
+            )
+
+            if consecutive_unknowns:
+                mark_failed(insurer)
+                logger.info(f"Multiple consecutive unknown insurer {imo}, marking as checked")
+
+            elif not insurer_already_exists or would_overwrite_null_date_from:
+                new_insurer = add_insurer(imo, insurer_raw_name, insurer_raw_date_from)
+                if new_insurer is not None:
+                    mark_updated(new_insurer)
+
+            else:
+                mark_updated(insurer)
+
+
+def update_flags(ships, imos):
+    latest_flags = {
+        flag.imo: flag
+        for flag in session.query(ShipFlag)
+        .filter(ShipFlag.imo.in_(imos))
+        .distinct(ShipFlag.imo)
+        .order_by(ShipFlag.imo, ShipFlag.updated_on.desc())
+        .all()
+    }
+
+    flag_iso2s = {}
+    for imo, equasis_infos in ships:
+        flag = equasis_infos.get("current_flag")
+        if flag is not None and flag not in flag_iso2s:
+            flag_iso2s[flag] = coco.convert(names=flag, to="ISO2")
+        flag_iso2 = flag_iso2s.get(flag)
+
+        update_time = dt.datetime.now()
+        latest_existing_flag = latest_flags.get(imo)
+
+        if not latest_existing_flag:
+            # Add dummy record for history
+            latest_existing_flag = ShipFlag(
+                imo=imo, flag_iso2=flag_iso2, first_seen=None, updated_on=update_time
+            )
+            session.add(latest_existing_flag)
+
+        if latest_existing_flag.flag_iso2 != flag_iso2 or latest_existing_flag.first_seen == None:
+            # Add new record
+            latest_existing_flag = ShipFlag(
+                imo=imo, flag_iso2=flag_iso2, first_seen=update_time, updated_on=update_time
+            )
+            session.add(latest_existing_flag)
+        else:
+            latest_existing_flag.updated_on = update_time
+
+        latest_flags[imo] = latest_existing_flag
@@ -1,13 +1,20 @@
+import datetime as dt
+
 from integrity.steps import IntegrityStep
 from integrity.integrity_check_definition import IntegrityCheckDefinition
+from integrity.runner import run_steps, record_results, format_results_table, DEFAULT_MAX_WORKERS
 
 from base.logger import logger_slack, notify_engineers
 
 
-def check(steps=[step for step in IntegrityStep]):
+def check(steps=[step for step in IntegrityStep], max_workers=DEFAULT_MAX_WORKERS):
     logger_slack.info("Checking integrity")
 
-    results = [step.run_test() for step in steps]
+    run_started_on = dt.datetime.now()
+    results = run_steps(steps, max_workers=max_workers)
+    record_results(results, run_started_on=run_started_on)
+    logger_slack.info(f"Integrity check durations:\n{format_results_table(results)}")
+
     failed_results = [result for result in results if not result.success]
 
     if len(failed_results) > 0:
@@ -1,9 +1,10 @@
 import datetime as dt
 import logging
 import re
-from typing import TypedDict
+from collections import defaultdict
+from typing import NamedTuple
 
-from sqlalchemy import func, tablesample, nulls_last, case
+from sqlalchemy import func, tablesample
 from sqlalchemy.orm import aliased
 
 from base.db import session
@@ -15,6 +16,7 @@ from base.models.kpler import (
     KplerVessel,
 )
 
+import pandas as pd
 import sqlalchemy as sa
 
 from base.models import Commodity, ShipInsurer, ShipOwner, Company, Price, ShipFlag
@@ -25,178 +27,463 @@ from tqdm import tqdm
 from tqdm.contrib.logging import logging_redirect_tqdm
 
 
-def test_sample_computed():
+# Number of computed trades checked per run, and per batch of bulk queries
+SAMPLE_SIZE = 10000
+SAMPLE_BATCH_SIZE = 2000
+
+# Ownership and insurance can be declared up to two weeks after departure
+OWNERSHIP_DATE_TOLERANCE = dt.timedelta(days=14)
+
+# Fields of the computed trades that are recomputed and compared
+CHECKED_FIELDS = [
+    "kpler_product_commodity_id",
+    "pricing_commodity",
+    "ship_insurer_names",
+    "ship_insurer_iso2s",
+    "ship_owner_names",
+    "ship_owner_iso2s",
+    "ship_flag_iso2s",
+    "eur_per_tonne",
+    "largest_vessel_type",
+    "largest_vessel_capacity_cm",
+]
+
+
+class CompanyDetails(NamedTuple):
+    name: str
+    country_iso2: str
+
+
+def test_sample_computed(sample_size=SAMPLE_SIZE, batch_size=SAMPLE_BATCH_SIZE):
     computed_sampled = aliased(
         KplerTradeComputed, tablesample(KplerTradeComputed, func.bernoulli(1))
     )
 
-    sampled_computed: list[KplerTradeComputed] = session.query(computed_sampled).limit(1000).all()
+    sampled_computed: list[KplerTradeComputed] = (
+        session.query(computed_sampled).limit(sample_size).all()
+    )
 
     errors = []
     with logging_redirect_tqdm(loggers=[logging.root]):
-        for sample in tqdm(sampled_computed):
-            try:
-                test_sample(sample)
-            except AssertionError as e:
-                errors.append(e)
+        for i in tqdm(range(0, len(sampled_computed), batch_size), unit="batch"):
+            errors += verify_samples(sampled_computed[i : i + batch_size])
+
     if errors:
-        all_errors = "\n".join([str(error) for error in errors])
+        all_errors = "\n".join(errors)
         raise AssertionError(f"Errors found in {len(errors)} samples: {all_errors}")
 
 
-def test_sample(sample: KplerTradeComputed):
+def verify_samples(samples: list[KplerTradeComputed]) -> list[str]:
+    """
+    Recompute the expected values of the sampled computed trades and compare them.
 
-    sample_id = f"id{sample.trade_id}_flow{sample.flow_id}"
+    All the dependencies of the samples (trades, products, commodities, zones, vessels,
+    insurers, owners, flags and prices) are loaded with one query per table, and the
+    per-ship lookups are done with pandas merges rather than one query per ship.
 
-    trade: KplerTrade = (
-        session.query(KplerTrade)
-        .filter(
-            KplerTrade.id == sample.trade_id,
-            KplerTrade.flow_id == sample.flow_id,
-            KplerTrade.is_valid,
-        )
-        .first()
-    )
-    assert trade, f"Trade {sample.trade_id} not found for sample {sample_id}"
-    assert trade.is_valid, f"Trade {sample.trade_id} is not valid for sample {sample_id}"
-    product: KplerProduct = (
-        session.query(KplerProduct).filter(KplerProduct.id == trade.product_id).first()
+    :return: one error message per wrong sample, listing all its wrong fields
+    """
+    trades = load_trades(samples)
+    products = load_by_id(KplerProduct, {trade.product_id for trade in trades.values()})
+    zones = load_by_id(
+        KplerZone,
+        {trade.departure_zone_id for trade in trades.values()}
+        | {trade.arrival_zone_id for trade in trades.values()},
     )
 
-    expected_commodity_id = extract_expected_commodity_id(product)
+    trade_ships = get_trade_ships(trades)
+    insurers = get_insurers_for_trade_ships(trade_ships)
+    owners = get_owners_for_trade_ships(trade_ships)
+    flags = get_flags_for_trade_ships(trade_ships)
+    largest_vessels = get_largest_vessels(trades)
 
-    assert (
-        sample.kpler_product_commodity_id == expected_commodity_id
-    ), f"Computed product id is wrong for sample {sample_id}: expected {expected_commodity_id} but got {sample.kpler_product_commodity_id}"
+    expected_commodity_ids = {
+        key: extract_expected_commodity_id(products[trade.product_id])
+        for key, trade in trades.items()
+        if trade.product_id in products
+    }
+    commodities = load_by_id(Commodity, set(expected_commodity_ids.values()))
+    prices = load_prices(samples, trades, commodities)
 
-    commodity: Commodity = (
-        session.query(Commodity).filter(Commodity.id == expected_commodity_id).first()
-    )
+    errors = []
+    checked_samples = []
+    expected_rows = []
+    for sample in samples:
+        sample_id = f"id{sample.trade_id}_flow{sample.flow_id}"
+        trade: KplerTrade = trades.get((sample.trade_id, sample.flow_id, sample.product_id))
+        if not trade:
+            errors.append(f"Trade {sample.trade_id} not found for sample {sample_id}")
+            continue
+        if not trade.is_valid:
+            errors.append(f"Trade {sample.trade_id} is not valid for sample {sample_id}")
+            continue
+
+        checked_samples.append(sample)
+        expected_rows.append(
+            get_expected_values(
+                sample,
+                trade,
+                products=products,
+                zones=zones,
+                commodities=commodities,
+                expected_commodity_ids=expected_commodity_ids,
+                insurers=insurers,
+                owners=owners,
+                flags=flags,
+                largest_vessels=largest_vessels,
+                prices=prices,
+            )
+        )
 
-    departure_zone: KplerZone = (
-        session.query(KplerZone).filter(KplerZone.id == trade.departure_zone_id).first()
+    sample_ids = [f"id{x.trade_id}_flow{x.flow_id}" for x in checked_samples]
+    expected = pd.DataFrame(expected_rows, columns=CHECKED_FIELDS)
+    actual = pd.DataFrame(
+        [{field: getattr(x, field) for field in CHECKED_FIELDS} for x in checked_samples],
+        columns=CHECKED_FIELDS,
     )
+    return errors + compare_values(sample_ids, expected, actual)
 
-    expected_commodity = extract_expected_pricing_commodity(product, commodity, departure_zone)
 
-    assert (
-        sample.pricing_commodity == expected_commodity
-    ), f"Computed pricing commodity is wrong for sample {sample_id}: expected {expected_commodity} but got {sample.pricing_commodity}"
+def compare_values(sample_ids: list[str], expected: pd.DataFrame, actual: pd.DataFrame):
+    """
+    Compare expected and computed values column by column.
 
-    insurer_companies = get_insurers_for_trade(trade)
+    :return: one error message per wrong sample, listing all its wrong fields
+    """
 
-    for i, insurer_company in enumerate(insurer_companies):
-        expected_name = insurer_company.name if insurer_company else "unknown"
-        expected_iso2 = (
-            insurer_company.country_iso2
-            if insurer_company and insurer_company.name != "unknown"
-            else "unknown"
-        )
-        actual_name = sample.ship_insurer_names[i]
-        actual_iso2 = sample.ship_insurer_iso2s[i]
-        assert (
-            actual_name == expected_name
-        ), f"Computed insurer is wrong for {sample_id}: expected {expected_name} got {actual_name}"
-        assert (
-            actual_iso2 == expected_iso2
-        ), f"Computed insurer country is wrong for {sample_id}: expected {expected_iso2} got {actual_iso2}"
-
-    owner_companies = get_owners_for_trade(trade)
-
-    for i, owner_company in enumerate(owner_companies):
-        expected_name = owner_company.name if owner_company else "unknown"
-        expected_iso2 = (
-            owner_company.country_iso2
-            if owner_company
-            and owner_company.name != "unknown"
-            and owner_company.country_iso2 is not None
-            else "unknown"
-        )
-        actual_name = sample.ship_owner_names[i]
-        actual_iso2 = sample.ship_owner_iso2s[i]
-        assert (
-            actual_name == expected_name
-        ), f"Computed owner is wrong for {sample_id}: expected {expected_name} got {actual_name}"
-        assert (
-            actual_iso2 == expected_iso2
-        ), f"Computed owner country is wrong for {sample_id}: expected {expected_iso2} got {actual_iso2}"
-
-    destination_zone = (
-        session.query(KplerZone).filter(KplerZone.id == trade.arrival_zone_id).first()
+    def comparable(values: pd.Series) -> pd.Series:
+        # Lists are compared as tuples, which pandas compares element-wise
+        return values.map(lambda x: tuple(x) if isinstance(x, list) else x)
+
+    wrong = pd.DataFrame(
+        {
+            field: ~(
+                (comparable(expected[field]) == comparable(actual[field]))
+                | (expected[field].isna() & actual[field].isna())
+            )
+            for field in CHECKED_FIELDS
+        },
+        index=expected.index,
     )
 
-    flag_for_trade = get_flags_for_trade(trade)
+    errors = []
+    for i in wrong.index[wrong.any(axis=1)]:
+        wrong_fields = [
+            f"{field}: expected {expected.at[i, field]} got {actual.at[i, field]}"
+            for field in CHECKED_FIELDS
+            if wrong.at[i, field]
+        ]
+        errors.append(
+            f"Computed values are wrong for sample {sample_ids[i]}: " + "; ".join(wrong_fields)
+        )
+    return errors
+
+
+def get_expected_values(
+    sample: KplerTradeComputed,
+    trade: KplerTrade,
+    *,
+    products,
+    zones,
+    commodities,
+    expected_commodity_ids,
+    insurers,
+    owners,
+    flags,
+    largest_vessels,
+    prices,
+) -> dict:
+    """
+    The expected values of the CHECKED_FIELDS of a sample.
+    """
+    key = (sample.trade_id, sample.flow_id, sample.product_id)
+    product: KplerProduct = products.get(trade.product_id)
+    expected_commodity_id = expected_commodity_ids[key]
+    commodity: Commodity = commodities.get(expected_commodity_id)
+    departure_zone: KplerZone = zones.get(trade.departure_zone_id)
+    destination_zone = zones.get(trade.arrival_zone_id)
+
+    expected_commodity = extract_expected_pricing_commodity(product, commodity, departure_zone)
 
-    for i, expected_iso2 in enumerate(flag_for_trade):
-        actual_iso2 = sample.ship_flag_iso2s[i]
-        assert (
-            actual_iso2 == expected_iso2
-        ), f"Computed flag country is wrong for {sample_id}: expected {expected_iso2} got {actual_iso2}"
+    insurer_companies = [insurers.get((key, i)) for i, _ in enumerate(trade.vessel_imos)]
+    owner_companies = [owners.get((key, i)) for i, _ in enumerate(trade.vessel_imos)]
 
     expected_price = get_expected_price(
-        sample=sample,
+        prices=prices.get(
+            (sample.pricing_scenario, expected_commodity, trade.departure_date_utc.date()), []
+        ),
         trade=trade,
         origin_zone=departure_zone,
         destination_zone=destination_zone,
-        commodity_id=expected_commodity,
         insurer_details=insurer_companies,
         owner_details=owner_companies,
     )
 
-    assert sample.eur_per_tonne == (
-        expected_price.eur_per_tonne if expected_price else None
-    ), f"Computed price is wrong for {sample_id}: expected {expected_price.eur_per_tonne} got {sample.eur_per_tonne}"
+    largest_vessel = largest_vessels.get(key)
+    largest_vessel_type = "unknown"
+    if largest_vessel:
+        if largest_vessel.type_class_name:
+            largest_vessel_type = largest_vessel.type_class_name
+        elif largest_vessel.type_name:
+            largest_vessel_type = largest_vessel.type_name
+
+    return {
+        "kpler_product_commodity_id": expected_commodity_id,
+        "pricing_commodity": expected_commodity,
+        "ship_insurer_names": [x.name if x else "unknown" for x in insurer_companies],
+        "ship_insurer_iso2s": [
+            x.country_iso2 if x and x.name != "unknown" else "unknown" for x in insurer_companies
+        ],
+        "ship_owner_names": [x.name if x else "unknown" for x in owner_companies],
+        "ship_owner_iso2s": [
+            (
+                x.country_iso2
+                if x and x.name != "unknown" and x.country_iso2 is not None
+                else "unknown"
+            )
+            for x in owner_companies
+        ],
+        "ship_flag_iso2s": [
+            extract_flag_iso2(flags.get((key, i))) for i, _ in enumerate(trade.vessel_imos)
+        ],
+        "eur_per_tonne": expected_price.eur_per_tonne if expected_price else None,
+        "largest_vessel_type": largest_vessel_type,
+        "largest_vessel_capacity_cm": largest_vessel.capacity_cm if largest_vessel else None,
+    }
+
+
+def load_trades(samples: list[KplerTradeComputed]) -> dict:
+    keys = {(sample.trade_id, sample.flow_id, sample.product_id) for sample in samples}
+    if not keys:
+        return {}
+
+    trades = (
+        session.query(KplerTrade)
+        .filter(
+            sa.tuple_(KplerTrade.id, KplerTrade.flow_id, KplerTrade.product_id).in_(list(keys)),
+            KplerTrade.is_valid,
+        )
+        .all()
+    )
+    return {(trade.id, trade.flow_id, trade.product_id): trade for trade in trades}
+
+
+def load_by_id(model, ids) -> dict:
+    ids = [x for x in ids if x is not None]
+    if not ids:
+        return {}
+    return {x.id: x for x in session.query(model).filter(model.id.in_(ids)).all()}
+
+
+def load_prices(samples, trades, commodities) -> dict:
+    """
+    Prices for the scenarios, pricing commodities and departure dates of the samples,
+    grouped by (scenario, commodity, date).
+    """
+    scenarios = {sample.pricing_scenario for sample in samples}
+    # Pricing commodities can be ESPO or Urals on top of the commodity's own
+    pricing_commodities = {commodity.pricing_commodity for commodity in commodities.values()} | {
+        "crude_oil_espo",
+        "crude_oil_urals",
+    }
+    dates = {trade.departure_date_utc.date() for trade in trades.values()}
+    if not dates:
+        return {}
+
+    prices = (
+        session.query(Price)
+        .filter(
+            Price.scenario.in_(scenarios),
+            Price.commodity.in_(pricing_commodities),
+            Price.date.in_(dates),
+        )
+        .all()
+    )
+
+    prices_by_key = defaultdict(list)
+    for price in prices:
+        prices_by_key[(price.scenario, price.commodity, price.date.date())].append(price)
+    return prices_by_key
+
+
+def get_trade_ships(trades: dict) -> pd.DataFrame:
+    """
+    One row per (trade, ship) with the position of the ship in the trade.
+    """
+    return pd.DataFrame(
+        [
+            {
+                "key": key,
+                "position": i,
+                "ship_imo": imo,
+                "departure_date_utc": trade.departure_date_utc,
+            }
+            for key, trade in trades.items()
+            for i, imo in enumerate(trade.vessel_imos or [])
+        ],
+        columns=["key", "position", "ship_imo", "departure_date_utc"],
+    )
+
+
+def latest_per_trade_ship(trade_ships, records, is_applicable, order_by) -> pd.DataFrame:
+    """
+    For each (trade, ship), the first record of the ship that is applicable to the trade,
+    ordered by `order_by` (descending, nulls last).
+    """
+    merged = trade_ships.merge(records, on="ship_imo", how="inner")
+    merged = merged[is_applicable(merged)]
+    merged = merged.sort_values(order_by, ascending=False, na_position="last", kind="stable")
+    return merged.drop_duplicates(subset=["key", "position"], keep="first")
+
+
+def to_company_details(latest: pd.DataFrame) -> dict:
+    return {
+        (row.key, row.position): (
+            CompanyDetails(name=row.name, country_iso2=none_if_na(row.country_iso2))
+            if not pd.isna(row.company_id)
+            else None
+        )
+        for row in latest.itertuples(index=False)
+    }
+
+
+def none_if_na(value):
+    return None if pd.isna(value) else value
+
+
+def get_insurers_for_trade_ships(trade_ships: pd.DataFrame) -> dict:
+    imos = trade_ships.ship_imo.unique().tolist()
+    if not imos:
+        return {}
+
+    date_from = func.coalesce(ShipInsurer.date_from_insurer, ShipInsurer.date_from_equasis)
+    insurers = pd.read_sql(
+        session.query(
+            ShipInsurer.ship_imo,
+            date_from.label("date_from"),
+            ShipInsurer.updated_on,
+            ShipInsurer.company_id,
+            Company.name,
+            Company.country_iso2,
+        )
+        .outerjoin(Company, Company.id == ShipInsurer.company_id)
+        .filter(ShipInsurer.ship_imo.in_(imos), ShipInsurer.is_valid)
+        .statement,
+        session.bind,
+        parse_dates=["date_from", "updated_on"],
+    )
+
+    latest = latest_per_trade_ship(
+        trade_ships,
+        insurers,
+        is_applicable=lambda x: x.date_from.isna()
+        | (x.date_from <= x.departure_date_utc + OWNERSHIP_DATE_TOLERANCE),
+        order_by=["date_from", "updated_on"],
+    )
+    return to_company_details(latest)
+
 
-    kpler_vessels_for_trade = (
+def get_owners_for_trade_ships(trade_ships: pd.DataFrame) -> dict:
+    imos = trade_ships.ship_imo.unique().tolist()
+    if not imos:
+        return {}
+
+    owners = pd.read_sql(
+        session.query(
+            ShipOwner.ship_imo,
+            ShipOwner.date_from,
+            ShipOwner.updated_on,
+            ShipOwner.company_id,
+            Company.name,
+            Company.country_iso2,
+        )
+        .outerjoin(Company, Company.id == ShipOwner.company_id)
+        .filter(ShipOwner.ship_imo.in_(imos))
+        .statement,
+        session.bind,
+        parse_dates=["date_from", "updated_on"],
+    )
+
+    latest = latest_per_trade_ship(
+        trade_ships,
+        owners,
+        is_applicable=lambda x: x.date_from.isna()
+        | (x.date_from <= x.departure_date_utc + OWNERSHIP_DATE_TOLERANCE),
+        order_by=["date_from", "updated_on"],
+    )
+    return to_company_details(latest)
+
+
+def get_flags_for_trade_ships(trade_ships: pd.DataFrame) -> dict:
+    """
+    Flag iso2 of each (trade, ship) at departure, None if the ship has no applicable flag.
+    """
+    imos = trade_ships.ship_imo.unique().tolist()
+    if not imos:
+        return {}
+
+    flags = pd.read_sql(
+        session.query(
+            ShipFlag.imo.label("ship_imo"),
+            ShipFlag.first_seen,
+            ShipFlag.flag_iso2,
+        )
+        .filter(ShipFlag.imo.in_(imos))
+        .statement,
+        session.bind,
+        parse_dates=["first_seen"],
+    )
+
+    latest = latest_per_trade_ship(
+        trade_ships,
+        flags,
+        is_applicable=lambda x: x.first_seen.isna() | (x.first_seen < x.departure_date_utc),
+        order_by=["first_seen"],
+    )
+    return {
+        (row.key, row.position): none_if_na(row.flag_iso2) for row in latest.itertuples(index=False)
+    }
+
+
+def get_largest_vessels(trades: dict) -> dict:
+    imos = {imo for trade in trades.values() for imo in trade.vessel_imos or []}
+    if not imos:
+        return {}
+
+    vessels = (
         session.query(
             KplerVessel.imo,
             KplerVessel.type_class_name,
             KplerVessel.type_name,
             KplerVessel.capacity_cm,
         )
-        .filter(KplerVessel.imo.in_(trade.vessel_imos))
+        .filter(KplerVessel.imo.in_(imos))
         .all()
     )
-
-    largest_vessel = max(kpler_vessels_for_trade, key=lambda x: x.capacity_cm, default=None)
-
-    expected_name = "unknown"
-    if largest_vessel:
-        if largest_vessel.type_class_name:
-            expected_name = largest_vessel.type_class_name
-        elif largest_vessel.type_name:
-            expected_name = largest_vessel.type_name
-
-    assert (
-        sample.largest_vessel_type == expected_name
-    ), f"Computed largest vessel type is wrong for {sample_id}: expected {largest_vessel.type_class_name} got {sample.largest_vessel_type}"
-    assert (
-        sample.largest_vessel_capacity_cm == largest_vessel.capacity_cm
-    ), f"Computed largest vessel capacity is wrong for {sample_id}: expected {largest_vessel.capacity_cm} got {sample.largest_vessel_capacity_cm}"
+    vessels_by_imo = defaultdict(list)
+    for vessel in vessels:
+        vessels_by_imo[vessel.imo].append(vessel)
+
+    return {
+        key: max(
+            [vessel for imo in trade.vessel_imos or [] for vessel in vessels_by_imo[imo]],
+            key=lambda x: x.capacity_cm,
+            default=None,
+        )
+        for key, trade in trades.items()
+    }
 
 
 def get_expected_price(
     *,
-    sample: KplerTradeComputed,
+    prices: list[Price],
     trade: KplerTrade,
     origin_zone: KplerZone,
     destination_zone: KplerZone,
-    commodity_id: str,
-    insurer_details: list[Company],
-    owner_details: list[Company],
+    insurer_details: list[CompanyDetails],
+    owner_details: list[CompanyDetails],
 ):
-    prices: list[Price] = (
-        session.query(Price)
-        .filter(
-            Price.scenario == sample.pricing_scenario,
-            Price.commodity == commodity_id,
-            Price.date == trade.departure_date_utc.date(),
-        )
-        .all()
-    )
-
     if origin_zone.country_iso2 != "RU":
-
         return [
             price
             for price in prices
@@ -222,8 +509,8 @@ def get_expected_price(
 def get_price_for_trade_ship(
     prices: list[Price],
     destination_zone: KplerZone,
-    insurer_details: Company,
-    owner_details: Company,
+    insurer_details: CompanyDetails,
+    owner_details: CompanyDetails,
 ):
     def rank_price(price: Price):
         # Ranks the price based on matching the destination, insurer and owner.
@@ -264,98 +551,10 @@ def get_price_for_trade_ship(
     return ranked_prices[0]
 
 
-def extract_flag_iso2(flag: ShipFlag):
-    if not flag:
+def extract_flag_iso2(flag_iso2):
+    if not flag_iso2:
         return "unknown"
-    if not flag.flag_iso2:
-        return "unknown"
-    return flag.flag_iso2
-
-
-def get_flags_for_trade(trade: KplerTrade):
-    return [
-        extract_flag_iso2(get_flag_for_trade_ship(trade, ship_imo))
-        for ship_imo in trade.vessel_imos
-    ]
-
-
-def get_flag_for_trade_ship(trade: KplerTrade, ship_imo: str):
-    flag: ShipFlag = (
-        session.query(ShipFlag)
-        .filter(
-            ShipFlag.imo == ship_imo,
-            sa.or_(
-                ShipFlag.first_seen < trade.departure_date_utc,
-                ShipFlag.first_seen == None,
-            ),
-        )
-        .order_by(nulls_last(ShipFlag.first_seen.desc()))
-        .first()
-    )
-
-    return flag
-
-
-def get_insurers_for_trade(trade: KplerTrade):
-    return [get_insurer_for_trade_ship(trade, ship_imo) for ship_imo in trade.vessel_imos]
-
-
-def get_insurer_for_trade_ship(trade: KplerTrade, ship_imo: str):
-
-    insurer: ShipInsurer = (
-        session.query(ShipInsurer)
-        .filter(
-            ShipInsurer.ship_imo == ship_imo,
-            ShipInsurer.is_valid,
-            sa.or_(
-                func.coalesce(ShipInsurer.date_from_insurer, ShipInsurer.date_from_equasis)
-                <= trade.departure_date_utc + dt.timedelta(days=14),
-                func.coalesce(ShipInsurer.date_from_insurer, ShipInsurer.date_from_equasis) == None,
-            ),
-        )
-        .order_by(
-            nulls_last(
-                func.coalesce(ShipInsurer.date_from_insurer, ShipInsurer.date_from_equasis).desc()
-            ),
-            nulls_last(ShipInsurer.updated_on.desc()),
-        )
-        .first()
-    )
-
-    if not insurer:
-        return None
-
-    insurer_details: Company = (
-        session.query(Company).filter(Company.id == insurer.company_id).first()
-    )
-
-    return insurer_details
-
-
-def get_owners_for_trade(trade: KplerTrade):
-    return [get_owner_for_trade_ship(trade, ship_imo) for ship_imo in trade.vessel_imos]
-
-
-def get_owner_for_trade_ship(trade: KplerTrade, ship_imo: str):
-    owner: ShipOwner = (
-        session.query(ShipOwner)
-        .filter(
-            ShipOwner.ship_imo == ship_imo,
-            sa.or_(
-                ShipOwner.date_from <= trade.departure_date_utc + dt.timedelta(days=14),
-                ShipOwner.date_from == None,
-            ),
-        )
-        .order_by(nulls_last(ShipOwner.date_from.desc()), nulls_last(ShipOwner.updated_on.desc()))
-        .first()
-    )
-
-    if not owner:
-        return None
-
-    owner_details: Company = session.query(Company).filter(Company.id == owner.company_id).first()
-
-    return owner_details
+    return flag_iso2
 
 
 def extract_expected_pricing_commodity(product, commodity, departure_zone):
@@ -1,10 +1,17 @@
+import time
+
 from base.logger import logger
 
+# Steps taking longer than this are reported as failed, without waiting for them
+DEFAULT_TIME_BUDGET_SECONDS = 60 * 60
+
 
 class IntegrityCheckResult:
-    def __init__(self, step, error=None):
+    def __init__(self, step, error=None, duration=None, timed_out=False):
         self.step = step
         self.error = error
+        self.duration = duration
+        self.timed_out = timed_out
 
     @property
     def success(self):
@@ -19,16 +26,26 @@ class IntegrityCheckResult:
 
 
 class IntegrityCheckDefinition:
-    def __init__(self, name, test):
+    def __init__(self, name, test, time_budget_seconds=DEFAULT_TIME_BUDGET_SECONDS):
         self.name = name
         self.test = test
+        self.time_budget_seconds = time_budget_seconds
 
     def run_test(self):
         logger.info(f"Checking integrity: {self.name}")
+        start = time.monotonic()
         try:
             self.test()
-            return IntegrityCheckResult(self)
+            return IntegrityCheckResult(self, duration=time.monotonic() - start)
         except AssertionError as e:
             logger.info(f"Checking integrity {self.name} - failure: {e}")
             message = str(e)
-            return IntegrityCheckResult(self, error=message)
+            return IntegrityCheckResult(self, error=message, duration=time.monotonic() - start)
+
+    def timed_out_result(self, duration):
+        return IntegrityCheckResult(
+            self,
+            error=f"Timed out after {duration:.0f}s (budget: {self.time_budget_seconds}s)",
+            duration=duration,
+            timed_out=True,
+        )
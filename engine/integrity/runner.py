@@ -0,0 +1,139 @@
+import datetime as dt
+import queue
+import threading
+import time
+import traceback
+
+import sqlalchemy as sa
+
+from base.db import session, check_if_table_exists
+from base.env import get_env
+from base.logger import logger
+from base.models import IntegrityCheckRun
+
+from integrity.integrity_check_definition import IntegrityCheckDefinition, IntegrityCheckResult
+
+DEFAULT_MAX_WORKERS = int(get_env("INTEGRITY_MAX_WORKERS", 4))
+
+# How often the runner checks for steps over their time budget
+POLL_INTERVAL_SECONDS = 5
+
+
+def run_steps(steps, max_workers=DEFAULT_MAX_WORKERS) -> list[IntegrityCheckResult]:
+    """
+    Run the integrity steps concurrently, in at most `max_workers` threads.
+
+    Each worker thread uses its own database session (`session` is thread-scoped), which is
+    closed after each step. A step still running past its time budget is reported as failed:
+    the runner stops waiting for it, and its result is ignored if it finishes later. Its thread
+    is replaced by a new worker for the steps left, and exits if it ever finishes.
+
+    :return: results in the same order as `steps`
+    """
+    definitions: list[IntegrityCheckDefinition] = [getattr(x, "value", x) for x in steps]
+
+    work = queue.Queue()
+    for i, definition in enumerate(definitions):
+        work.put((i, definition))
+
+    finished = queue.Queue()
+    started_at = {}
+    timed_out = set()
+    lock = threading.Lock()
+
+    def _work():
+        while True:
+            try:
+                i, definition = work.get_nowait()
+            except queue.Empty:
+                return
+
+            with lock:
+                started_at[i] = time.monotonic()
+
+            start = time.monotonic()
+            try:
+                result = definition.run_test()
+            except Exception:
+                logger.warning(f"Integrity check {definition.name} errored", exc_info=True)
+                result = IntegrityCheckResult(
+                    definition,
+                    error=f"Unexpected error:\n{traceback.format_exc()}",
+                    duration=time.monotonic() - start,
+                )
+            finally:
+                session.remove()
+
+            finished.put((i, result))
+
+            with lock:
+                if i in timed_out:
+                    # Already replaced
+                    return
+
+    def _start_worker():
+        # Daemon threads, so that a step over its budget doesn't keep the process alive
+        threading.Thread(target=_work, daemon=True).start()
+
+    for _ in range(min(max_workers, len(definitions))):
+        _start_worker()
+
+    results = {}
+    while len(results) < len(definitions):
+        try:
+            i, result = finished.get(timeout=POLL_INTERVAL_SECONDS)
+            if i not in results:
+                results[i] = result
+        except queue.Empty:
+            pass
+
+        now = time.monotonic()
+        with lock:
+            running = [(i, start) for i, start in started_at.items() if i not in results]
+        for i, start in running:
+            if now - start > definitions[i].time_budget_seconds:
+                logger.warning(f"Integrity check {definitions[i].name} is over its time budget")
+                results[i] = definitions[i].timed_out_result(duration=now - start)
+                with lock:
+                    timed_out.add(i)
+                if not work.empty():
+                    _start_worker()
+
+    return [results[i] for i in range(len(definitions))]
+
+
+def format_results_table(results: list[IntegrityCheckResult]) -> str:
+    rows = [
+        (
+            result.name,
+            "timed out" if result.timed_out else ("ok" if result.success else "failed"),
+            f"{result.duration:.1f}s" if result.duration is not None else "",
+        )
+        for result in results
+    ]
+    name_width = max([len(name) for name, _, _ in rows] + [len("step")])
+    lines = [f"{'step':<{name_width}}  {'outcome':<9}  duration"]
+    lines += [f"{name:<{name_width}}  {outcome:<9}  {duration}" for name, outcome, duration in rows]
+    return "\n".join(lines)
+
+
+def record_results(results: list[IntegrityCheckResult], run_started_on: dt.datetime):
+    try:
+        check_if_table_exists(IntegrityCheckRun, create_table=True)
+        session.add_all(
+            [
+                IntegrityCheckRun(
+                    run_started_on=run_started_on,
+                    step=result.name,
+                    success=result.success,
+                    timed_out=result.timed_out,
+                    duration_seconds=result.duration,
+                    error=result.error,
+                )
+                for result in results
+            ]
+        )
+        session.commit()
+    except sa.exc.SQLAlchemyError:
+        session.rollback()
+        logger.warning("Failed to record integrity check results", exc_info=True)
@@ -0,0 +1,70 @@
+"""
+Benchmark of entsog.process_flows_raw on a recorded raw dataset.
+
+Record raw flows from the database once:
+    python -m run.benchmark.entsog_process_flows --record raw.pickle --date-from 2021-01-01
+
+Then time the processing, optionally checking its output against a previous run:
+    python -m run.benchmark.entsog_process_flows --raw raw.pickle --save-output before.pickle
+    python -m run.benchmark.entsog_process_flows --raw raw.pickle --expected before.pickle
+"""
+
+from argparse import ArgumentParser
+import datetime as dt
+import time
+
+import pandas as pd
+
+from engines import entsog
+
+
+def record(filename, date_from, date_to):
+    flows_raw = entsog.get_flows_raw(
+        date_from=date_from,
+        date_to=date_to,
+        remove_pipe_in_pipe=True,
+        use_db=True,
+    )
+    flows_raw.to_pickle(filename)
+    print(f"Recorded {len(flows_raw)} raw flows to {filename}")
+
+
+def benchmark(filename, repeat=3, save_output=None, expected=None):
+    flows_raw = pd.read_pickle(filename)
+
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        flows = entsog.process_flows_raw(flows_raw=flows_raw.copy())
+        durations.append(time.perf_counter() - start)
+
+    print(
+        f"process_flows_raw: {len(flows_raw)} raw rows -> {len(flows)} flows, "
+        f"best of {repeat}: {min(durations):.2f}s"
+    )
+
+    if save_output:
+        flows.to_pickle(save_output)
+
+    if expected:
+        pd.testing.assert_frame_equal(flows, pd.read_pickle(expected), check_exact=True)
+        print("Output is identical to the expected one")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--record", type=str, default=None, help="Pickle to record raw flows to")
+    parser.add_argument("--date-from", type=str, default="2022-01-01")
+    parser.add_argument("--date-to", type=str, default=str(dt.date.today()))
+    parser.add_argument("--raw", type=str, default=None, help="Recorded raw flows to process")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save-output", type=str, default=None)
+    parser.add_argument("--expected", type=str, default=None)
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, date_from=args.date_from, date_to=args.date_to)
+    if args.raw:
+        benchmark(
+            args.raw, repeat=args.repeat, save_output=args.save_output, expected=args.expected
+        )
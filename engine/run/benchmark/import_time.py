@@ -0,0 +1,61 @@
+"""
+Benchmark of cold start: how long importing a module takes, and which packages it pays for.
+
+Each module is imported in a fresh interpreter with `-X importtime`:
+    python -m run.benchmark.import_time engines.counter engines.kpler_scraper run.update_main
+
+The API can be measured the same way, from its own directory:
+    python -m run.benchmark.import_time --cwd ../api routes app
+"""
+
+from argparse import ArgumentParser
+from collections import defaultdict
+import os
+import subprocess
+import sys
+
+
+def get_import_times(module, cwd=None):
+    """
+    Import `module` in a new interpreter.
+    :return: (total import time in seconds, {top-level package: self time in seconds})
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}:\n{process.stderr[-2000:]}")
+
+    total = 0
+    by_package = defaultdict(float)
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        name = name.strip()
+        by_package[name.split(".")[0]] += int(self_us) / 1e6
+        if name == module:
+            total = int(cumulative_us) / 1e6
+
+    return total, dict(by_package)
+
+
+def benchmark(modules, cwd=None, top=15):
+    for module in modules:
+        total, by_package = get_import_times(module, cwd=cwd)
+        print(f"{module}: {total:.2f}s")
+        for package, seconds in sorted(by_package.items(), key=lambda x: -x[1])[:top]:
+            print(f"  {package:<30} {seconds:.3f}s")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("modules", nargs="+", help="Modules to import, e.g. engines.counter")
+    parser.add_argument("--cwd", type=str, default=None, help="Directory to import them from")
+    parser.add_argument("--top", type=int, default=15, help="Number of packages to show")
+    args = parser.parse_args()
+
+    benchmark(args.modules, cwd=os.path.abspath(args.cwd) if args.cwd else None, top=args.top)
@@ -0,0 +1,9 @@
+import base
+from engines.entsog import EntsogDb
+
+
+# Adds the checksum columns used by incremental ENTSOG updates to entsogflow_raw. To be run
+# once on databases created before them, as altering the table locks it.
+if __name__ == "__main__":
+    print("=== Using %s environment ===" % (base.db.environment,))
+    EntsogDb.add_checksum_columns()
@@ -0,0 +1,122 @@
+from .mock_db_module import *
+
+import datetime as dt
+
+import pandas as pd
+
+from integrity.check_kpler_trade_computed import (
+    CHECKED_FIELDS,
+    OWNERSHIP_DATE_TOLERANCE,
+    compare_values,
+    latest_per_trade_ship,
+)
+
+
+def test_latest_per_trade_ship__same_as_ordered_query():
+    trade_ships = pd.DataFrame(
+        [
+            {
+                "key": "a",
+                "position": 0,
+                "ship_imo": "1",
+                "departure_date_utc": dt.datetime(2023, 6, 1),
+            },
+            {
+                "key": "a",
+                "position": 1,
+                "ship_imo": "2",
+                "departure_date_utc": dt.datetime(2023, 6, 1),
+            },
+            {
+                "key": "b",
+                "position": 0,
+                "ship_imo": "1",
+                "departure_date_utc": dt.datetime(2022, 1, 1),
+            },
+            {
+                "key": "c",
+                "position": 0,
+                "ship_imo": "3",
+                "departure_date_utc": dt.datetime(2023, 6, 1),
+            },
+        ]
+    )
+    owners = pd.DataFrame(
+        [
+            # Ship 1: an old owner, a newer one, and one declared just after departure of "a"
+            {
+                "ship_imo": "1",
+                "date_from": None,
+                "updated_on": dt.datetime(2021, 1, 1),
+                "name": "A",
+            },
+            {
+                "ship_imo": "1",
+                "date_from": dt.datetime(2022, 6, 1),
+                "updated_on": None,
+                "name": "B",
+            },
+            {
+                "ship_imo": "1",
+                "date_from": dt.datetime(2023, 6, 10),
+                "updated_on": None,
+                "name": "C",
+            },
+            # Ship 2: only undated owners, the latest update wins
+            {
+                "ship_imo": "2",
+                "date_from": None,
+                "updated_on": dt.datetime(2021, 1, 1),
+                "name": "D",
+            },
+            {
+                "ship_imo": "2",
+                "date_from": None,
+                "updated_on": dt.datetime(2022, 1, 1),
+                "name": "E",
+            },
+        ]
+    ).astype({"date_from": "datetime64[ns]", "updated_on": "datetime64[ns]"})
+
+    latest = latest_per_trade_ship(
+        trade_ships,
+        owners,
+        is_applicable=lambda x: x.date_from.isna()
+        | (x.date_from <= x.departure_date_utc + OWNERSHIP_DATE_TOLERANCE),
+        order_by=["date_from", "updated_on"],
+    )
+
+    names = {(row.key, row.position): row.name for row in latest.itertuples(index=False)}
+    assert names == {("a", 0): "C", ("a", 1): "E", ("b", 0): "A"}
+
+
+def test_compare_values__reports_all_wrong_fields():
+    expected_row = {
+        "kpler_product_commodity_id": "kpler_crude",
+        "pricing_commodity": "crude_oil_urals",
+        "ship_insurer_names": ["Gard", "unknown"],
+        "ship_insurer_iso2s": ["NO", "unknown"],
+        "ship_owner_names": ["A", "B"],
+        "ship_owner_iso2s": ["GR", "unknown"],
+        "ship_flag_iso2s": ["PA", "LR"],
+        "eur_per_tonne": None,
+        "largest_vessel_type": "Aframax",
+        "largest_vessel_capacity_cm": 120000,
+    }
+    wrong_row = {
+        **expected_row,
+        "ship_owner_iso2s": ["GR", "RU"],
+        "eur_per_tonne": 450.0,
+        "largest_vessel_capacity_cm": 100000,
+    }
+    expected = pd.DataFrame([expected_row, expected_row], columns=CHECKED_FIELDS)
+    actual = pd.DataFrame([expected_row, wrong_row], columns=CHECKED_FIELDS)
+
+    errors = compare_values(["id1_flow1", "id2_flow1"], expected, actual)
+
+    assert len(errors) == 1
+    assert errors[0].startswith("Computed values are wrong for sample id2_flow1: ")
+    assert "ship_owner_iso2s: expected ['GR', 'unknown'] got ['GR', 'RU']" in errors[0]
+    assert "eur_per_tonne: expected None got 450.0" in errors[0]
+    assert "largest_vessel_capacity_cm: expected 120000 got 100000" in errors[0]
+    assert "ship_owner_names" not in errors[0]
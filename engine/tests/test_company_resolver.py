@@ -0,0 +1,64 @@
+from .mock_db_module import *
+
+from engines.ship_details_datasource.company_resolver import (
+    CompanyResolver,
+    normalise_company_name,
+)
+
+
+def build_resolver():
+    resolver = CompanyResolver()
+    resolver.max_id = 0
+    resolver.add(1, "5441828", "NORSTAR SHIP MANAGEMENT PTE", ["NORSTAR SHIP MANAGEMENT PTE"])
+    resolver.add(2, None, "Gard P&I (Bermuda) Ltd", ["Gard P&I (Bermuda) Ltd", "Gard AS"])
+    resolver.add(3, "5994067", "YAOKI SHIPPING & MH PROGRESS", ["YAOKI SHIPPING & MH PROGRESS"])
+    return resolver
+
+
+def test_normalise_company_name():
+    assert normalise_company_name("Sovcomflot  P.J.S.C.") == "sovcomflot p j s c"
+    assert normalise_company_name("Société Générale") == "societe generale"
+    assert normalise_company_name(None) == ""
+
+
+def test_CompanyResolver_find__exact_and_normalised():
+    resolver = build_resolver()
+
+    assert resolver.find("Gard AS") == 2
+    assert resolver.find("GARD P&I (BERMUDA) LTD.") == 2
+    assert resolver.find("NORSTAR SHIP MANAGEMENT PTE", imo="5441828") == 1
+    assert resolver.find("NORSTAR SHIP MANAGEMENT PTE", imo="0000000") is None
+    assert resolver.find("Unknown company") is None
+
+
+def test_CompanyResolver_find_near__restricted_to_imo():
+    resolver = build_resolver()
+
+    assert resolver.find_near("NORSTAR SHIP MANAGEMENT PTE LTD", imo="5441828") == 1
+    assert resolver.find_near("YAOKI SHIPPING & MH PROGRESS", imo="5441828") is None
+    assert resolver.find_near("NORSTAR SHIP MANAGEMENT PTE LTD", imo="0000000") is None
+
+
+def test_CompanyResolver_find_near__without_imo():
+    resolver = build_resolver()
+
+    assert resolver.find_near("Yaoki Shipping and MH Progress") == 3
+    assert resolver.find_near("Completely different name") is None
+
+
+def test_CompanyResolver_find_or_create_many__imo_conflict():
+    resolver = build_resolver()
+
+    company_ids = resolver.find_or_create_many(
+        [
+            ("NORSTAR SHIP MANAGEMENT PTE LTD", "5441828", None),
+            ("SOMETHING ELSE ENTIRELY", "5441828", None),
+            ("Gard AS", None, None),
+        ]
+    )
+
+    assert company_ids == {
+        ("NORSTAR SHIP MANAGEMENT PTE LTD", "5441828"): 1,
+        ("SOMETHING ELSE ENTIRELY", "5441828"): None,
+        ("Gard AS", None): 2,
+    }
@@ -0,0 +1,31 @@
+from .mock_db_module import *
+
+import datetime as dt
+
+import pandas as pd
+from currency_converter import CurrencyConverter
+
+from engines.currency import get_exchange_rates
+
+
+def test_get_exchange_rates__same_as_converter():
+    # Uses the rates file shipped with the package
+    converter = CurrencyConverter(fallback_on_missing_rate=True, fallback_on_wrong_date=True)
+    last_date = converter.bounds["USD"].last_date
+
+    # Covers weekends, a currency that stopped being published and dates past the bounds
+    currencies = ["EUR", "USD", "JPY", "RUB"]
+    dates = pd.date_range(start=dt.date(2022, 2, 20), end=last_date + dt.timedelta(days=5))
+
+    exchanges = get_exchange_rates(converter, currencies, dates)
+
+    expected = [
+        (date, currency, converter.convert(1, "EUR", currency, date=date))
+        for date in dates
+        for currency in currencies
+    ]
+
+    assert len(exchanges) == len(expected)
+    assert list(zip(exchanges.date, exchanges.currency)) == [(d, c) for d, c, _ in expected]
+    assert exchanges.per_eur.tolist() == [rate for _, _, rate in expected]
+    assert not exchanges.estimated.any()
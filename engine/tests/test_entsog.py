@@ -0,0 +1,219 @@
+from .mock_db_module import *
+
+import datetime as dt
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+from engines import entsog
+from engines.entsog import EntsogDb, get_checksums, process_flows_raw, get_pairs
+
+
+def _flow(
+    direction,
+    status,
+    hours,
+    value_kwh,
+    gcv_kwh_m3=10.0,
+    point_key="P1",
+    countries=("DE", "PL"),
+    date=dt.date(2022, 1, 1),
+):
+    importer, exporter = countries
+    period_from = pd.Timestamp(date)
+    return {
+        "pointKey": point_key,
+        "pointLabel": f"Point {point_key}",
+        "operatorKey": f"OP-{point_key}-{direction}",
+        "operatorLabel": f"Operator {point_key} {direction}",
+        "directionKey": direction,
+        "country": importer if direction == "entry" else exporter,
+        "partner": exporter if direction == "entry" else importer,
+        "type": "crossborder",
+        "date": date,
+        "periodFrom": period_from,
+        "periodTo": period_from + pd.Timedelta(hours=hours),
+        "flowStatus": status,
+        "value_kwh": value_kwh,
+        "gcv_kwh_m3": gcv_kwh_m3,
+    }
+
+
+def test_process_flows_raw__keeps_longest_confirmed_flows():
+    flows_raw = pd.DataFrame(
+        [
+            _flow("entry", "Confirmed", 24, 1000.0),
+            _flow("entry", "Confirmed", 1, 50.0),
+            _flow("entry", "Provisional", 24, 900.0),
+            _flow("exit", "Confirmed", 24, np.nan),
+        ]
+    )
+
+    flows = process_flows_raw(flows_raw)
+
+    assert len(flows) == 1
+    flow = flows.iloc[0]
+    assert (flow.departure_iso2, flow.destination_iso2) == ("PL", "DE")
+    assert flow.value_mwh == 1.0
+    assert flow.value_m3 == 100.0
+
+
+def test_get_pairs__ignores_direction():
+    df = pd.DataFrame({"country": ["DE", "PL", "DE", None], "partner": ["PL", "DE", "DE", "NO"]})
+    assert list(get_pairs(df)) == ["DE-PL", "DE-PL", "DE-DE", "-NO"]
+
+
+def _flows_raw():
+    """
+    Both sides of three points (DE<-PL, PL<-DE and AT<-DE) over three days, with ids.
+    """
+    flows_raw = pd.DataFrame(
+        [
+            _flow(
+                direction,
+                "Confirmed",
+                24,
+                value,
+                point_key=point_key,
+                countries=countries,
+                date=date,
+            )
+            for point_key, countries in [
+                ("P1", ("DE", "PL")),
+                ("P2", ("PL", "DE")),
+                ("P3", ("AT", "DE")),
+            ]
+            for date in [dt.date(2022, 1, x) for x in [1, 2, 3]]
+            for direction, value in [("entry", 1000.0 * date.day), ("exit", 1050.0 * date.day)]
+        ]
+    )
+    flows_raw["id"] = (
+        flows_raw.pointKey + "-" + flows_raw.directionKey + "-" + flows_raw.date.astype(str)
+    )
+    return flows_raw
+
+
+def test_upload_flows_raw__new_changed_unchanged():
+    flows = _flows_raw()
+    existing = flows.iloc[:4]
+    existing = pd.DataFrame(
+        {
+            "id": existing.id,
+            "checksum": get_checksums(existing[entsog.ENTSOG_RAW_VALUE_COLUMNS]),
+        }
+    )
+    # The second one changed since
+    existing.iloc[1, 1] = "0"
+
+    inserted = []
+    with patch.object(entsog.pd, "read_sql", return_value=existing), patch.object(
+        pd.DataFrame, "to_sql", lambda df, *args, **kwargs: inserted.append(df)
+    ), patch.object(entsog, "upsert") as upsert:
+        n_uploaded = EntsogDb.upload_flows_raw(flows)
+
+    assert n_uploaded == len(flows) - 3
+    assert inserted[0].id.tolist() == flows.id.iloc[4:].tolist()
+    assert upsert.call_args.kwargs["df"].id.tolist() == [flows.id.iloc[1]]
+    assert (
+        inserted[0].checksum
+        == get_checksums(flows.iloc[4:][entsog.ENTSOG_RAW_VALUE_COLUMNS]).values
+    ).all()
+
+
+def test_upload_flows_raw__upserts_new_flows_if_insert_fails():
+    flows = _flows_raw()
+
+    def failing_to_sql(df, *args, **kwargs):
+        raise sa.exc.IntegrityError("INSERT", {}, Exception("duplicate key"))
+
+    with patch.object(
+        entsog.pd, "read_sql", return_value=pd.DataFrame(columns=["id", "checksum"])
+    ), patch.object(pd.DataFrame, "to_sql", failing_to_sql), patch.object(
+        entsog, "upsert"
+    ) as upsert:
+        n_uploaded = EntsogDb.upload_flows_raw(flows)
+
+    assert n_uploaded == len(flows)
+    assert upsert.call_args.kwargs["df"].id.tolist() == flows.id.tolist()
+
+
+def test_mark_processed__in_chunks():
+    session = MagicMock()
+    with patch.object(entsog, "session", session):
+        EntsogDb.mark_processed(["a", "b", "c", "d", "e"], chunksize=2)
+
+    filters = session.query.return_value.filter.call_args_list
+    assert [x.args[0].right.value for x in filters] == [["a", "b"], ["c", "d"], ["e"]]
+    assert session.query.return_value.filter.return_value.update.call_count == 3
+    session.commit.assert_called_once()
+
+
+def _cells(flows):
+    pairs = get_pairs(
+        flows.rename(columns={"destination_iso2": "country", "departure_iso2": "partner"})
+    )
+    return (
+        flows.assign(pair=pairs)
+        .sort_values(["pair", "date", "type", "departure_iso2"])
+        .set_index(["pair", "date", "type"])
+    )
+
+
+def test_get_flows_incremental__same_as_full_processing_for_touched_cells():
+    flows_raw = _flows_raw()
+    points = flows_raw[
+        [
+            "pointKey",
+            "pointLabel",
+            "operatorKey",
+            "operatorLabel",
+            "directionKey",
+            "country",
+            "partner",
+            "type",
+        ]
+    ].drop_duplicates()
+    # P1 (DE-PL) changed on the 2nd, P3 (AT-DE) on the 3rd
+    unprocessed = flows_raw[
+        ((flows_raw.pointKey == "P1") & (flows_raw.date == dt.date(2022, 1, 2)))
+        | (
+            (flows_raw.pointKey == "P3")
+            & (flows_raw.date == dt.date(2022, 1, 3))
+            & (flows_raw.directionKey == "exit")
+        )
+    ]
+
+    def get_physical_flows(points, date_from, date_to):
+        return flows_raw[
+            flows_raw.pointKey.isin(points.pointKey)
+            & (flows_raw.date >= date_from)
+            & (flows_raw.date <= date_to)
+        ].drop(columns=["id"])
+
+    with patch.object(entsog, "update_db"), patch.object(
+        entsog, "get_points", return_value=points
+    ), patch.object(
+        EntsogDb,
+        "get_unprocessed_flows_raw",
+        return_value=unprocessed[
+            ["id", "pointKey", "operatorKey", "directionKey", "date", "country", "partner"]
+        ],
+    ), patch.object(
+        EntsogDb, "get_physical_flows", get_physical_flows
+    ):
+        flows, processed_ids = entsog.get_flows_incremental(save_to_file=False)
+
+    assert sorted(processed_ids) == sorted(unprocessed.id)
+
+    incremental = _cells(flows)
+    full = _cells(process_flows_raw(flows_raw.drop(columns=["id"])))
+    touched = [
+        ("DE-PL", dt.date(2022, 1, 2), "crossborder"),
+        ("AT-DE", dt.date(2022, 1, 3), "crossborder"),
+    ]
+
+    assert sorted(set(incremental.index)) == sorted(touched)
+    columns = ["departure_iso2", "destination_iso2", "value_m3", "value_mwh", "value_tonne"]
+    pd.testing.assert_frame_equal(incremental[columns], full[full.index.isin(touched)][columns])
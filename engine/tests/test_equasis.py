@@ -5,12 +5,15 @@ from engines.company_scraper.session_management import (
 )
 from .mock_db_module import *
 
+import threading
+import time
 from datetime import date
 from unittest.mock import MagicMock
 from engines.company_scraper import (
     EquasisClient,
     EquasisSession,
     EquasisFixedInitialisationSessionPool,
+    EquasisConcurrentSessionPool,
     EquasisSessionUnavailable,
 )
 import pytest
@@ -379,6 +382,116 @@ def test_OnDemandEquasisSessionManager_make_request__three_failures_gives_up():
         response = session_pool.make_request(example_url, {})
 
 
+def fetch_with_session(session, item):
+    return session.make_request(example_url, {"item": item})
+
+
+def test_EquasisConcurrentSessionPool_run__all_items_written_once():
+
+    sessions = [
+        MockSession("test1", lambda url, data: "test1 " + data["item"]),
+        MockSession("test2", lambda url, data: "test2 " + data["item"]),
+    ]
+
+    written = {}
+
+    def write(item, result):
+        written[item] = result
+        return True
+
+    session_pool = EquasisConcurrentSessionPool(sessions)
+    result = session_pool.run(["a", "b", "c", "d"], fetch_with_session, write)
+
+    assert sorted(written.keys()) == ["a", "b", "c", "d"]
+    assert all(written[item].endswith(item) for item in written)
+    assert result.n_checked == 4
+    assert result.n_updated == 4
+    assert not result.exhausted
+
+
+def test_EquasisConcurrentSessionPool_run__unavailable_session_hands_work_to_others():
+
+    sessions = [
+        MockSession("test1", raise_session_unavailable_error),
+        MockSession("test2", create_mock_session_response("test2 response")),
+    ]
+
+    written = []
+
+    def write(item, result):
+        written.append((item, result))
+        return True
+
+    session_pool = EquasisConcurrentSessionPool(sessions)
+    result = session_pool.run(["a", "b", "c"], fetch_with_session, write)
+
+    assert sorted(written) == [
+        ("a", "test2 response"),
+        ("b", "test2 response"),
+        ("c", "test2 response"),
+    ]
+    assert not result.exhausted
+
+
+def test_EquasisConcurrentSessionPool_run__exhausted_keeps_partial_results():
+
+    responses_left = ["first response"]
+
+    def respond_once(url, data):
+        if not responses_left:
+            raise EquasisSessionUnavailable()
+        return responses_left.pop()
+
+    sessions = [MockSession("test1", respond_once)]
+
+    written = []
+
+    def write(item, result):
+        written.append((item, result))
+        return True
+
+    session_pool = EquasisConcurrentSessionPool(sessions)
+    result = session_pool.run(["a", "b", "c"], fetch_with_session, write)
+
+    assert written == [("a", "first response")]
+    assert result.n_checked == 1
+    assert result.n_updated == 1
+    assert result.exhausted
+
+
+def test_EquasisConcurrentSessionPool_run__unexpected_error_is_raised():
+    def raise_unexpected_error(url, data):
+        raise ValueError("unexpected")
+
+    sessions = [MockSession("test1", raise_unexpected_error)]
+
+    session_pool = EquasisConcurrentSessionPool(sessions)
+
+    with pytest.raises(ValueError):
+        session_pool.run(["a"], fetch_with_session, lambda item, result: True)
+
+
+def test_EquasisConcurrentSessionPool_run__write_error_stops_workers():
+    sessions = [
+        MockSession("test1", create_mock_session_response("test1 response")),
+        MockSession("test2", create_mock_session_response("test2 response")),
+    ]
+
+    def write(item, result):
+        raise ValueError("write failed")
+
+    session_pool = EquasisConcurrentSessionPool(sessions, wait=lambda: time.sleep(0.01))
+
+    with pytest.raises(ValueError, match="write failed"):
+        session_pool.run([str(x) for x in range(1000)], fetch_with_session, write)
+
+    # Left running, the workers would take about 5 seconds to drain the queue
+    workers = [x for x in threading.enumerate() if x.name in ("equasis-test1", "equasis-test2")]
+    for worker in workers:
+        worker.join(timeout=1)
+    assert not any(worker.is_alive() for worker in workers)
+
+
 def test_Equasis_get_ship_infos__has_ship_infos(ship_details_body):
 
     mocked_pool = MagicMock()
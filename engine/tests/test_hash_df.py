@@ -0,0 +1,30 @@
+from .mock_db_module import *
+
+import pandas as pd
+
+from base.utils import hash_df, unhash_df
+
+
+def test_hash_df__groups_equal_lists_and_restores_them():
+    df = pd.DataFrame(
+        {
+            "imos": [["1", "2"], ["3"], ["1", "2"], None],
+            "value_tonne": [1.0, 2.0, 3.0, 4.0],
+        }
+    )
+
+    hashed, codes_values = hash_df(df.copy(), ["imos", "not_a_column"])
+    assert list(codes_values) == ["imos"]
+    assert hashed.imos.tolist() == [0, 1, 0, 2]
+
+    grouped = hashed.groupby("imos", as_index=False).value_tonne.sum()
+    unhashed = unhash_df(grouped, codes_values)
+    assert unhashed.imos.tolist() == [["1", "2"], ["3"], None]
+    assert unhashed.value_tonne.tolist() == [4.0, 2.0, 4.0]
+
+
+def test_unhash_df__missing_codes():
+    hashed, codes_values = hash_df(pd.DataFrame({"imos": [["1"], ["2"]]}), ["imos"])
+    hashed = pd.concat([hashed, pd.DataFrame({"value_tonne": [1.0]})])
+
+    assert unhash_df(hashed, codes_values).imos.tolist() == [["1"], ["2"], None]
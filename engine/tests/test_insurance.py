@@ -0,0 +1,82 @@
+from .mock_db_module import *
+
+import datetime as dt
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from engines import insurance
+
+
+class _FakeInsuranceScraper:
+    def __init__(self, failing_imos=()):
+        self.failing_imos = set(failing_imos)
+        self.imos = []
+
+    def get_insurance_start_date_for_ship(self, imo):
+        self.imos.append(imo)
+        if imo in self.failing_imos:
+            raise ValueError(f"Unexpected page for {imo}")
+        return dt.datetime(2024, 1, int(imo[-1]))
+
+
+def _update(scrapers, insurances, writes, write_batch_size=2):
+    to_update = pd.DataFrame(insurances, columns=["id", "ship_imo", "company_id"])
+    with patch.object(insurance, "known_insurers", scrapers), patch.object(
+        insurance, "get_all_insurance_to_update", return_value=to_update
+    ), patch.object(insurance, "write_insurance_dates", writes.append), patch.object(
+        insurance, "INSURER_REQUEST_INTERVAL_SECONDS", 0
+    ):
+        insurance.update(write_batch_size=write_batch_size)
+
+
+def test_update__one_queue_per_insurer_and_batched_writes():
+    scrapers = {1: _FakeInsuranceScraper(), 2: _FakeInsuranceScraper(failing_imos=["1000004"])}
+    writes = []
+    _update(
+        scrapers,
+        [
+            (10, "1000001", 1),
+            (11, "1000002", 2),
+            (12, "1000003", 1),
+            (13, "1000004", 2),
+            (14, "1000005", 2),
+        ],
+        writes,
+    )
+
+    assert scrapers[1].imos == ["1000001", "1000003"]
+    assert scrapers[2].imos == ["1000002", "1000004", "1000005"]
+
+    # Full batches while scraping, then the rest; the failing ship is skipped
+    assert [len(x) for x in writes] == [2, 2, 0]
+    assert sorted(x for batch in writes for x in batch) == [
+        (10, dt.datetime(2024, 1, 1)),
+        (11, dt.datetime(2024, 1, 2)),
+        (12, dt.datetime(2024, 1, 3)),
+        (14, dt.datetime(2024, 1, 5)),
+    ]
+
+
+def test_update__insurer_failing_for_all_ships():
+    scrapers = {
+        1: _FakeInsuranceScraper(),
+        2: _FakeInsuranceScraper(failing_imos=["1000002", "1000004"]),
+    }
+
+    writes = []
+    with patch.object(insurance.logger_slack, "error") as slack_error, pytest.raises(
+        RuntimeError, match=r"\[2\]"
+    ):
+        _update(
+            scrapers,
+            [(10, "1000001", 1), (11, "1000002", 2), (12, "1000004", 2)],
+            writes,
+            write_batch_size=100,
+        )
+
+    # Dates of the other insurers are still written
+    assert writes == [[(10, dt.datetime(2024, 1, 1))]]
+    slack_error.assert_called_once()
+    assert "insurer 2" in slack_error.call_args[0][0]
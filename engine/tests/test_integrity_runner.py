@@ -0,0 +1,66 @@
+from .mock_db_module import *
+
+import threading
+import time
+
+import integrity.runner
+from integrity.integrity_check_definition import IntegrityCheckDefinition
+from integrity.runner import run_steps
+
+
+def _fail():
+    assert False, "Failing check"
+
+
+def _raise():
+    raise ValueError("Unexpected")
+
+
+def test_run_steps__reports_outcomes_in_order():
+    steps = [
+        IntegrityCheckDefinition("PASSING", lambda: None),
+        IntegrityCheckDefinition("FAILING", _fail),
+        IntegrityCheckDefinition("RAISING", _raise),
+    ]
+
+    results = run_steps(steps, max_workers=2)
+
+    assert [result.name for result in results] == ["PASSING", "FAILING", "RAISING"]
+    assert [result.success for result in results] == [True, False, False]
+    assert results[1].error.startswith("Failing check")
+    assert "ValueError" in results[2].error
+    assert all(result.duration is not None for result in results)
+
+
+def test_run_steps__times_out_slow_steps(monkeypatch):
+    monkeypatch.setattr(integrity.runner, "POLL_INTERVAL_SECONDS", 0.05)
+    release = threading.Event()
+    steps = [
+        IntegrityCheckDefinition("HANGING", release.wait, time_budget_seconds=0.2),
+        IntegrityCheckDefinition("PASSING", lambda: None),
+    ]
+
+    start = time.monotonic()
+    results = run_steps(steps, max_workers=2)
+    release.set()
+
+    assert time.monotonic() - start < 5
+    assert results[0].timed_out and not results[0].success
+    assert results[1].success
+
+
+def test_run_steps__times_out_slow_steps_single_worker(monkeypatch):
+    monkeypatch.setattr(integrity.runner, "POLL_INTERVAL_SECONDS", 0.05)
+    release = threading.Event()
+    steps = [
+        IntegrityCheckDefinition("HANGING", release.wait, time_budget_seconds=0.2),
+        IntegrityCheckDefinition("PASSING", lambda: None),
+    ]
+
+    start = time.monotonic()
+    results = run_steps(steps, max_workers=1)
+    release.set()
+
+    assert time.monotonic() - start < 5
+    assert results[0].timed_out and not results[0].success
+    assert results[1].success
@@ -0,0 +1,95 @@
+from .mock_db_module import *
+
+import datetime as dt
+from unittest.mock import MagicMock
+
+import pandas as pd
+import pytest
+
+from base import UNKNOWN_COUNTRY
+from engines.kpler_scraper.metadata import KplerMetadataStore, KplerZoneIndex
+from engines.kpler_scraper.scraper import KplerScraper
+
+ZONES = [
+    {
+        "id": 1,
+        "name": "Primorsk",
+        "parentZones": [
+            {"id": 10, "name": "Russian Federation", "type": "country", "resourceType": "zone"},
+            {"id": 11, "name": "Baltic Sea", "type": "sea", "resourceType": "zone"},
+        ],
+    },
+    {"id": 2, "name": "Atlantic Ocean", "parentZones": []},
+]
+
+
+def _response(status_code, json=None, etag=None):
+    response = MagicMock(status_code=status_code, headers={"ETag": etag} if etag else {})
+    response.json.return_value = json
+    return response
+
+
+def test_KplerMetadataStore_get_listing__persists_across_instances(tmp_path):
+    client = MagicMock()
+    client.fetch.return_value = _response(200, ZONES, etag="v1")
+    path = str(tmp_path / "metadata.sqlite")
+
+    zones = KplerMetadataStore(client=client, path=path).get_listing("zones")
+    assert list(zones.id) == [1, 2]
+
+    store = KplerMetadataStore(client=client, path=path)
+    assert list(store.get_listing("zones").id) == [1, 2]
+    zones_countries = store.get_zones_countries()
+    assert set(zones_countries.id) == {10, 11}
+    assert set(zones_countries.iso2) == {"RU"}
+    assert client.fetch.call_count == 1
+
+
+def test_KplerMetadataStore_get_listing__revalidates_expired_listing_with_etag(tmp_path):
+    client = MagicMock()
+    client.fetch.return_value = _response(200, ZONES, etag="v1")
+    path = str(tmp_path / "metadata.sqlite")
+    KplerMetadataStore(client=client, path=path).get_listing("zones")
+
+    client.fetch.return_value = _response(304)
+    store = KplerMetadataStore(client=client, path=path, ttl=dt.timedelta(seconds=0))
+    assert list(store.get_listing("zones").id) == [1, 2]
+    client.fetch.assert_called_with("zones", headers={"If-None-Match": "v1"})
+
+
+def test_KplerMetadataStore_get_record__fetches_missing_records_once(tmp_path):
+    path = str(tmp_path / "metadata.sqlite")
+    fetch = MagicMock(return_value={"id": 1370, "name": "Crude/Co"})
+
+    for _ in range(2):
+        store = KplerMetadataStore(client=None, path=path)
+        assert store.get_record("product", 1370, fetch)["name"] == "Crude/Co"
+    assert fetch.call_count == 1
+
+
+def test_KplerScraper_map_zone_names__uses_names_manual_values_then_index(monkeypatch):
+    zones_countries = pd.DataFrame(
+        {
+            "id": [10, 11, 12, 12],
+            "name": ["Russian Federation", "Baltic Sea", "Ambiguous", "Ambiguous"],
+            "country": ["Russian Federation"] * 4,
+            "iso2": ["RU"] * 4,
+        }
+    )
+    scraper = KplerScraper.__new__(KplerScraper)
+    monkeypatch.setattr(scraper, "get_zone_index", lambda: KplerZoneIndex(zones_countries))
+
+    ids = pd.Series([10, 11, 299, 0, 12], index=[5, 6, 7, 8, 9])
+    names = pd.Series([None, "Given name", None, None, "Given too"], index=[5, 6, 7, 8, 9])
+    assert list(scraper.map_zone_names(ids, names=names)) == [
+        "Russian Federation",
+        "Given name",
+        "Egypt",
+        UNKNOWN_COUNTRY,
+        "Given too",
+    ]
+    assert list(scraper.map_zone_iso2s(ids)) == ["RU", "RU", "EG", None, None]
+    assert scraper.get_zone_iso2(11) == "RU"
+
+    with pytest.raises(ValueError):
+        scraper.get_zone_name(12)
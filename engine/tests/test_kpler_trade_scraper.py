@@ -0,0 +1,60 @@
+from .mock_db_module import *
+
+from unittest.mock import MagicMock
+
+import pandas as pd
+
+from engines.kpler_scraper.scraper_trade import KplerTradeScraper
+from engines.kpler_scraper.scraper_product import KplerProductScraper
+
+
+def _trade_raw(id, vessel_id, installation_id, product_id):
+    return {
+        "id": id,
+        "status": "Delivered",
+        "start": "2023-01-02T10:00:00",
+        "end": "2023-01-12T10:00:00",
+        "portCallOrigin": {
+            "zone": {"id": 1},
+            "installation": {"id": installation_id, "name": f"Installation {installation_id}"},
+            "shipToShip": False,
+        },
+        "portCallDestination": {"zone": {"id": 2}, "shipToShip": False},
+        "vessels": [{"id": vessel_id, "imo": str(vessel_id), "vesselType": "Tanker"}],
+        "steps": [],
+        "flowQuantities": [
+            {"id": product_id, "flowQuantity": {"mass": 1000.0, "volume": 1200.0}},
+        ],
+    }
+
+
+def test_KplerTradeScraper_get_trades__parses_pages_into_typed_frames(monkeypatch):
+    pages = [
+        [_trade_raw(1, 10, 100, 1000), _trade_raw(2, 10, 100, 1001)],
+        [_trade_raw(3, 11, 101, 1000)],
+        [],
+    ]
+    scraper = KplerTradeScraper.__new__(KplerTradeScraper)
+    scraper.get_zone_dict = MagicMock(return_value={"id": 1, "name": "Russia"})
+    scraper.get_trades_raw = MagicMock(side_effect=[(len(x), x) for x in pages])
+    monkeypatch.setattr(
+        KplerProductScraper,
+        "get_parsed_infos",
+        MagicMock(side_effect=lambda id: {"id": id, "name": f"Product {id}", "type": "grade"}),
+    )
+
+    trades, vessels, products, installations = scraper.get_trades(from_iso2="RU", month="2023-01")
+
+    assert list(trades.id) == [1, 2, 3]
+    assert trades.id.dtype == "Int64"
+    assert isinstance(trades.departure_installation_name.dtype, pd.CategoricalDtype)
+    assert list(trades.departure_installation_name.cat.categories) == [
+        "Installation 100",
+        "Installation 101",
+    ]
+    assert pd.api.types.is_datetime64_any_dtype(trades.departure_date_utc)
+
+    assert list(vessels.id) == [10, 11]
+    assert list(installations.id) == [100, 101]
+    assert list(products.id) == [1000, 1001]
+    assert KplerProductScraper.get_parsed_infos.call_count == 2
@@ -0,0 +1,70 @@
+from .mock_db_module import *
+
+from unittest.mock import patch
+
+import pandas as pd
+
+from base import UNKNOWN_COUNTRY
+from base.kpler import FlowsSplit
+from engines.kpler_scraper import update_flow
+
+
+class _FakeFlowScraper:
+    """
+    Two ports of RU, each shipping 10/day to CN and 5/day to IN, out of a total of 20/day.
+    """
+
+    from_zones = [{"id": 1, "name": "Port A"}, {"id": 2, "name": "Port B"}]
+    to_zones = [{"id": 10, "name": "China"}, {"id": 11, "name": "India"}]
+    values = {10: 10.0, 11: 5.0, None: 20.0}
+
+    def get_zone_dict(self, iso2=None, **kwargs):
+        return {"id": 0, "name": iso2} if iso2 else None
+
+    def get_flows_raw_brute(self, from_zone=None, split=None, **kwargs):
+        zones = self.from_zones if from_zone["id"] == 0 else self.to_zones
+        return pd.DataFrame({"split": zones})
+
+    def get_flows(self, from_zone, to_zone, **kwargs):
+        return pd.DataFrame(
+            {
+                "date": pd.to_datetime(["2023-01-01", "2023-01-02"]),
+                "product": "Crude",
+                "from_zone_id": from_zone["id"],
+                "to_zone_id": to_zone["id"] if to_zone else 0,
+                "to_zone_name": to_zone["name"] if to_zone else None,
+                "value": self.values[to_zone["id"] if to_zone else None],
+            }
+        )
+
+
+def _update_flows(**kwargs):
+    uploads = []
+    with patch.object(update_flow, "KplerFlowScraper", _FakeFlowScraper), patch.object(
+        update_flow, "upload_flows", uploads.append
+    ):
+        update_flow.update_flows(
+            origin_iso2s=["RU"],
+            from_splits=[FlowsSplit.OriginPorts],
+            to_splits=[FlowsSplit.DestinationCountries],
+            max_workers=3,
+            **kwargs,
+        )
+    return uploads
+
+
+def test_update_flows__uploads_once_per_from_zone_with_unknown():
+    uploads = _update_flows()
+
+    assert [set(x.from_zone_id) for x in uploads] == [{1}, {2}]
+    for flows in uploads:
+        unknown = flows[flows.to_zone_name == UNKNOWN_COUNTRY]
+        assert list(unknown.value) == [5.0, 5.0]
+        assert len(flows) == 6
+
+
+def test_update_flows__add_unknown_only():
+    uploads = _update_flows(add_unknown_only=True)
+
+    assert len(uploads) == 2
+    assert all((x.to_zone_name == UNKNOWN_COUNTRY).all() for x in uploads)
@@ -0,0 +1,37 @@
+from .mock_db_module import *
+
+import datetime as dt
+from unittest.mock import MagicMock
+
+import pandas as pd
+
+from base.kpler import FlowsSplit
+from engines.kpler_scraper.verify import KplerTradeComparer
+
+
+def test_KplerTradeComparer_get_flows_from_kpler__fetches_each_range_once():
+    comparer = KplerTradeComparer.__new__(KplerTradeComparer)
+    comparer.flows_cache = {}
+    comparer.scraper = MagicMock()
+    comparer.scraper.get_flows.return_value = pd.DataFrame(
+        {
+            "date": pd.date_range("2023-01-01", "2023-03-31"),
+            "value": 1.0,
+        }
+    )
+
+    full_range = (dt.date(2023, 1, 1), dt.date(2023, 3, 31))
+    comparer.get_flows_from_kpler("RU", *full_range, FlowsSplit.DestinationCountries)
+    comparer.get_flows_from_kpler("RU", *full_range, FlowsSplit.DestinationCountries)
+    february = comparer.get_flows_from_kpler(
+        "RU", dt.date(2023, 2, 1), dt.date(2023, 2, 28), FlowsSplit.DestinationCountries
+    )
+
+    assert comparer.scraper.get_flows.call_count == 1
+    assert len(february) == 28
+    assert february.date.min() == pd.Timestamp("2023-02-01")
+
+    # Other splits and origins are fetched separately
+    comparer.get_flows_from_kpler("RU", *full_range, FlowsSplit.Products)
+    comparer.get_flows_from_kpler("TR", *full_range, FlowsSplit.DestinationCountries)
+    assert comparer.scraper.get_flows.call_count == 3
@@ -0,0 +1,183 @@
+from .mock_db_module import *
+
+import copy
+import datetime as dt
+from unittest.mock import MagicMock, patch
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+
+import base
+from base.db import Base
+from base.models import Ship, ShipFlag, ShipInsurer, ShipManager, ShipOwner
+from engines.company_scraper import EquasisClient
+from engines.ship_details_datasource import (
+    ShipCoreDetailsBatchWriter,
+    company_resolver,
+    datasource_core_details,
+    datasource_core_details_batch,
+    update_ship_core_details,
+)
+from engines.ship_details_datasource.company_resolver import CompanyResolver
+
+
+# Just enough for the ship tables to be created in SQLite
+@compiles(JSONB, "sqlite")
+@compiles(ARRAY, "sqlite")
+def _compile_as_json(type_, compiler, **kw):
+    return "JSON"
+
+
+@compiles(sa.BigInteger, "sqlite")
+def _compile_as_integer(type_, compiler, **kw):
+    # So that primary keys autoincrement
+    return "INTEGER"
+
+
+TABLES = [x.__table__ for x in [Ship, ShipInsurer, ShipOwner, ShipManager, ShipFlag]]
+
+
+@pytest.fixture(scope="module")
+def ship_a_infos():
+    with open("tests/equasis_responses/ship_details.html") as f:
+        body = f.read()
+    equasis = EquasisClient(session_manager=MagicMock(**{"make_request.return_value": body}))
+    return equasis.get_ship_infos("1000001")
+
+
+def build_resolver():
+    # All companies are known, so that none is created (the company table isn't in SQLite)
+    resolver = CompanyResolver()
+    resolver.max_id = 0
+    resolver.add(1, "5441828", "NORSTAR SHIP MANAGEMENT PTE", ["NORSTAR SHIP MANAGEMENT PTE"])
+    resolver.add(2, "5994067", "YAOKI SHIPPING & MH PROGRESS", ["YAOKI SHIPPING & MH PROGRESS"])
+    resolver.add(
+        3, None, "Japan Ship Owners' P&I Association", ["Japan Ship Owners' P&I Association"]
+    )
+    resolver.add(4, None, "Gard P&I (Bermuda) Ltd", ["Gard P&I (Bermuda) Ltd"])
+    resolver.add(5, None, "Skuld", ["Skuld"])
+    resolver.add(6, None, base.UNKNOWN_INSURER, [base.UNKNOWN_INSURER])
+    return resolver
+
+
+def build_runs(ship_a_infos):
+    """
+    Two successive runs over three ships:
+    - A, parsed from the Equasis response, seen twice;
+    - B, without insurers both times;
+    - C, changing insurer between runs.
+    """
+    ship_b_infos = copy.deepcopy(ship_a_infos)
+    ship_b_infos.update(imo="1000002", insurers=[], current_flag="Liberia")
+
+    ship_c_infos = copy.deepcopy(ship_a_infos)
+    ship_c_infos.update(
+        imo="1000003",
+        insurers=[{"name": "Gard P&I (Bermuda) Ltd", "date_from": dt.date(2023, 1, 1)}],
+    )
+    ship_c_infos_later = copy.deepcopy(ship_c_infos)
+    ship_c_infos_later.update(
+        insurers=[{"name": "Skuld", "date_from": dt.date(2024, 2, 1)}], current_flag="Liberia"
+    )
+
+    return [
+        [("1000001", ship_a_infos), ("1000002", ship_b_infos), ("1000003", ship_c_infos)],
+        [("1000001", ship_a_infos), ("1000002", ship_b_infos), ("1000003", ship_c_infos_later)],
+    ]
+
+
+def read_rows(db):
+    def rows(query):
+        return sorted(tuple(str(x) for x in row) for row in query)
+
+    return {
+        "ship": rows(db.query(Ship.imo, Ship.others)),
+        "owner": rows(
+            db.query(
+                ShipOwner.ship_imo,
+                ShipOwner.company_raw_name,
+                ShipOwner.imo,
+                ShipOwner.company_id,
+                ShipOwner.date_from,
+            )
+        ),
+        "manager": rows(
+            db.query(
+                ShipManager.ship_imo,
+                ShipManager.company_raw_name,
+                ShipManager.imo,
+                ShipManager.company_id,
+                ShipManager.date_from,
+            )
+        ),
+        "insurer": rows(
+            db.query(
+                ShipInsurer.ship_imo,
+                ShipInsurer.company_raw_name,
+                ShipInsurer.company_id,
+                ShipInsurer.date_from_equasis,
+                ShipInsurer.consecutive_failures,
+                ShipInsurer.is_valid,
+                ShipInsurer.updated_on.is_(None),
+            )
+        ),
+        "flag": rows(db.query(ShipFlag.imo, ShipFlag.flag_iso2, ShipFlag.first_seen.is_(None))),
+    }
+
+
+def run_and_read(runs, write_run):
+    engine = sa.create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=TABLES)
+    db = sessionmaker(bind=engine)()
+    resolver = build_resolver()
+
+    with patch.object(datasource_core_details, "session", db), patch.object(
+        datasource_core_details_batch, "session", db
+    ), patch.object(company_resolver, "session", db), patch.object(
+        company_resolver, "global_company_resolver", resolver
+    ):
+        results = []
+        for run in runs:
+            write_run(run, resolver)
+            results.append(read_rows(db))
+    return results
+
+
+def write_one_by_one(run, resolver):
+    for imo, equasis_infos in run:
+        update_ship_core_details(imo, equasis_infos)
+
+
+def write_batch(run, resolver):
+    writer = ShipCoreDetailsBatchWriter(batch_size=2, company_resolver=resolver)
+    for imo, equasis_infos in run:
+        writer.add(imo, equasis_infos)
+    writer.flush()
+
+
+def test_ShipCoreDetailsBatchWriter__same_rows_as_one_by_one(ship_a_infos):
+    runs = build_runs(ship_a_infos)
+
+    expected = run_and_read(runs, write_one_by_one)
+    actual = run_and_read(runs, write_batch)
+
+    for expected_rows, actual_rows in zip(expected, actual):
+        # Which flag is the latest is ambiguous on later runs, as the dummy and first flag
+        # records share their updated_on
+        assert {k: v for k, v in actual_rows.items() if k != "flag"} == {
+            k: v for k, v in expected_rows.items() if k != "flag"
+        }
+    assert actual[0]["flag"] == expected[0]["flag"]
+
+    first_run, second_run = actual
+    assert len(first_run["owner"]) == 3 and len(first_run["manager"]) == 3
+    # A and C: a single undated record, as the dated one would break the unique constraint,
+    # B: an unknown insurer, then C gets a new dated one
+    assert len(first_run["insurer"]) == 3
+    assert len(second_run["insurer"]) == 4
+    assert ("1000002", base.UNKNOWN_INSURER, "6", "None", "2", "True", "True") in second_run[
+        "insurer"
+    ]